@@ -0,0 +1,348 @@
+import argparse
+import glob
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+import numpy as np
+
+import fftBackend
+import pngDecoder
+from pngFile import PngFile
+from rsaAlgorithm import AlgorithmRSA, RANDOM_EXPONENT, STANDARD_EXPONENT
+
+# valid bit depths of every color type
+BIT_DEPTHS = {
+    0 : (1, 2, 4, 8, 16),
+    2 : (8, 16),
+    3 : (1, 2, 4, 8),
+    4 : (8, 16),
+    6 : (8, 16)
+}
+
+
+def _write_chunk(file, chunk_type: bytes, data: bytes):
+    file.write(struct.pack(">I", len(data)))
+    file.write(chunk_type)
+    file.write(data)
+    file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type))))
+
+
+def _filter_row(filter_type: int, row: np.ndarray, previous: np.ndarray, bytes_per_pixel: int) -> np.ndarray:
+    """Apply png filter to row of bytes (vectorized, filters use original bytes only)"""
+    row = row.astype(np.int16)
+    previous = previous.astype(np.int16)
+    left = np.zeros_like(row)
+    left[bytes_per_pixel:] = row[:-bytes_per_pixel]
+    upper_left = np.zeros_like(row)
+    upper_left[bytes_per_pixel:] = previous[:-bytes_per_pixel]
+
+    if filter_type == 0:
+        predictor = 0
+    elif filter_type == 1:
+        predictor = left
+    elif filter_type == 2:
+        predictor = previous
+    elif filter_type == 3:
+        predictor = (left + previous) >> 1
+    else:
+        pa = np.abs(previous - upper_left)
+        pb = np.abs(left - upper_left)
+        pc = np.abs(left + previous - 2 * upper_left)
+        predictor = np.where((pa <= pb) & (pa <= pc), left, np.where(pb <= pc, previous, upper_left))
+    return ((row - predictor) & 0xff).astype(np.uint8)
+
+
+def _pack_row(samples: np.ndarray, bit_depth: int) -> np.ndarray:
+    if bit_depth == 16:
+        return samples.astype(">u2").view(np.uint8)
+    if bit_depth == 8:
+        return samples.astype(np.uint8)
+    per_byte = 8 // bit_depth
+    samples = np.pad(samples, (0, -len(samples) % per_byte)).reshape(-1, per_byte).astype(np.uint8)
+    shifts = np.arange(8 - bit_depth, -1, -bit_depth, dtype=np.uint8)
+    return np.bitwise_or.reduce(samples << shifts, axis=1).astype(np.uint8)
+
+
+def write_synthetic_png(path: str, width: int, height: int, color_type: int, bit_depth: int,
+                        interlace: int = 0, idat_size: int = 1 << 16):
+    """Write synthetic png file row by row (memory does not depend on image size)
+
+    Image is a gradient, rows cycle through all five filter types.
+
+    Args:
+        path (str): Output path
+        width (int): Image width
+        height (int): Image height
+        color_type (int): Png color type
+        bit_depth (int): Png bit depth
+        interlace (int): 0 for non interlaced, 1 for Adam7
+        idat_size (int): Maximal size of IDAT chunk data
+    """
+    channels = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}[color_type]
+    bytes_per_pixel = max(1, channels * bit_depth // 8)
+    max_value = (1 << bit_depth) - 1
+
+    with open(path, "wb") as file:
+        file.write(PngFile.HEADER)
+        _write_chunk(file, b"IHDR", struct.pack(">IIBBBBB", width, height, bit_depth,
+                                                color_type, 0, 0, interlace))
+        if color_type == 3:
+            palette = np.arange(256, dtype=np.uint8)
+            _write_chunk(file, b"PLTE", np.stack([palette, palette[::-1], palette // 2], axis=1).tobytes())
+
+        compressor = zlib.compressobj(6)
+        pending = bytearray()
+
+        def flush(data: bytes):
+            pending.extend(data)
+            while len(pending) >= idat_size:
+                _write_chunk(file, b"IDAT", bytes(pending[:idat_size]))
+                del pending[:idat_size]
+
+        if interlace:
+            passes = [(start_x, start_y, step_x, step_y)
+                      for start_x, start_y, step_x, step_y in pngDecoder.ADAM7_PASSES]
+        else:
+            passes = [(0, 0, 1, 1)]
+
+        for start_x, start_y, step_x, step_y in passes:
+            columns = np.arange(start_x, width, step_x)
+            if len(columns) == 0:
+                continue
+            previous = None
+            for y in range(start_y, height, step_y):
+                samples = (columns[:, np.newaxis] * 3 + y * 5 + np.arange(channels) * 7) % (max_value + 1)
+                row = _pack_row(samples.reshape(-1), bit_depth)
+                if previous is None:
+                    previous = np.zeros_like(row)
+                filter_type = y % 5
+                filtered = _filter_row(filter_type, row, previous, bytes_per_pixel)
+                flush(compressor.compress(bytes([filter_type]) + filtered.tobytes()))
+                previous = row
+
+        flush(compressor.flush())
+        if pending:
+            _write_chunk(file, b"IDAT", bytes(pending))
+        _write_chunk(file, b"IEND", b"")
+
+
+def measure(function, repeat: int) -> dict:
+    """Run function repeat times
+
+    Returns:
+        dict: Minimal and median time in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {"min": min(times), "median": statistics.median(times), "repeat": repeat}
+
+
+def _strip_ancillary(png_file: PngFile):
+    output = io.BytesIO()
+    output.write(PngFile.HEADER)
+    for chunk in png_file.chunks:
+        if chunk.is_critical() is True:
+            output.write(chunk.create_chunk())
+    return output
+
+
+def benchmark_file(path: str, repeat: int, fft: bool = True) -> dict:
+    """Benchmark chunk parsing, decoding, fft and saving of single file"""
+    results = {"path": path, "size": os.path.getsize(path)}
+
+    results["parse"] = measure(lambda: PngFile(path).close(), repeat)
+    results["parse_lazy"] = measure(lambda: PngFile(path, lazy=True).close(), repeat)
+    results["parse_mmap"] = measure(lambda: PngFile(path, use_mmap=True, lazy=True).close(), repeat)
+
+    png_file = PngFile(path, stats=True)
+    ihdr = png_file.ihdr
+    results["image"] = {"width": ihdr.width, "height": ihdr.height, "bit_depth": ihdr.bit_depth,
+                        "color_type": ihdr.color_type, "interlace_method": ihdr.interlace_method,
+                        "idat_chunks": sum(1 for chunk in png_file.chunks if chunk.type == "IDAT")}
+    # decoded pixels are cached by PngFile, so every repeat decodes chunks again
+    results["decode"] = measure(lambda: pngDecoder.decode_pixels(ihdr, png_file.chunks), repeat)
+    png_file.pixels()
+    if fft:
+        results["fft"] = measure(png_file.get_fft, repeat)
+        results["fft_backend"] = png_file.fft_backend
+    results["strip_ancillary"] = measure(lambda: _strip_ancillary(png_file), repeat)
+    results["stats"] = png_file.stats.as_dict()
+    png_file.close()
+    return results
+
+
+def benchmark_rsa(key_sizes: list, repeat: int, blocks: int, public_exponent=RANDOM_EXPONENT) -> list:
+    """Benchmark rsa key generation and single block encryption and decryption
+
+    Decryption with Chinese Remainder Theorem is checked against plain modular
+    exponentiation.
+    """
+    results = []
+    for key_size in key_sizes:
+        result = {"key_size": key_size, "public_exponent": public_exponent}
+        result["key_generation"] = measure(lambda: AlgorithmRSA(key_size, public_exponent), repeat)
+
+        rsa = AlgorithmRSA(key_size, public_exponent)
+        data = [int.from_bytes(os.urandom(key_size // 8 - 1), "big") for _ in range(blocks)]
+        result["encrypt"] = measure(lambda: [rsa.encrypt_data(block) for block in data], repeat)
+        encrypted = [rsa.encrypt_data(block) for block in data]
+        result["decrypt"] = measure(lambda: [rsa.decrypt_data(block) for block in encrypted], repeat)
+        result["decrypt_many"] = measure(lambda: rsa.decrypt_many(encrypted), repeat)
+        d, n = rsa.private_key.d, rsa.private_key.n
+        result["decrypt_no_crt"] = measure(lambda: [pow(block, d, n) for block in encrypted], repeat)
+        if rsa.decrypt_many(encrypted) != data or [pow(block, d, n) for block in encrypted] != data:
+            raise RuntimeError(f"Rsa decryption mismatch for {key_size} bit key")
+
+        payload = os.urandom(rsa.plain_block_size * blocks)
+        result["encrypt_ECB"] = measure(lambda: rsa.encrypt_ECB(payload), repeat)
+        encrypted_payload, extra = rsa.encrypt_ECB(payload)
+        result["decrypt_ECB"] = measure(lambda: rsa.decrypt_ECB(encrypted_payload, extra), repeat)
+        if rsa.decrypt_ECB(encrypted_payload, extra) != payload:
+            raise RuntimeError(f"Rsa ECB decryption mismatch for {key_size} bit key")
+
+        block_bytes = (key_size // 8 - 1) * blocks
+        result["encrypt_throughput"] = block_bytes / result["encrypt"]["min"]
+        result["decrypt_throughput"] = block_bytes / result["decrypt"]["min"]
+        result["crt_speedup"] = result["decrypt_no_crt"]["min"] / result["decrypt"]["min"]
+        results.append(result)
+    return results
+
+
+def synthetic_cases(sizes: list, interlace: tuple, idat_sizes: tuple):
+    """Iterate over parameters of synthetic images"""
+    for size in sizes:
+        for color_type, bit_depths in BIT_DEPTHS.items():
+            for bit_depth in bit_depths:
+                for interlace_method in interlace:
+                    for idat_size in idat_sizes:
+                        yield size, color_type, bit_depth, interlace_method, idat_size
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "fft_backends": fftBackend.available_backends(),
+        "fft_backend": fftBackend.get_backend().description,
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Find benchmarks slower than baseline by more than threshold
+
+    Returns:
+        list: Descriptions of regressions
+    """
+    def timings(data: dict) -> dict:
+        found = {}
+        for section in ("corpus", "synthetic"):
+            for case in data.get(section, []):
+                for name, value in case.items():
+                    if isinstance(value, dict) and "min" in value:
+                        found[(case["path"] if section == "corpus" else case["name"], name)] = value["min"]
+        for case in data.get("rsa", []):
+            for name, value in case.items():
+                if isinstance(value, dict) and "min" in value:
+                    exponent = case.get("public_exponent", RANDOM_EXPONENT)
+                    found[(f"rsa-{case['key_size']}-e{exponent}", name)] = value["min"]
+        return found
+
+    current = timings(results)
+    regressions = []
+    for key, old in timings(baseline).items():
+        new = current.get(key)
+        if new is not None and old > 0 and new > old * (1 + threshold):
+            regressions.append(f"{key[0]} {key[1]}: {old:.6f}s -> {new:.6f}s")
+    return regressions
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark png parsing, decoding, fft and rsa")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="json results file")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--corpus", default="png", help="directory with sample png files ('' to skip)")
+    parser.add_argument("--sizes", default="256", help="comma separated sizes of synthetic images ('' to skip)")
+    parser.add_argument("--large", action="store_true", help="add 16384x16384 synthetic images")
+    parser.add_argument("--small-idat", type=int, default=1024, help="IDAT size of many small IDATs case")
+    parser.add_argument("--no-fft", action="store_true", help="skip fft of synthetic images")
+    parser.add_argument("--fft-backend", choices=["auto"] + list(fftBackend.BACKENDS), default="auto",
+                        help="fft backend (auto uses scipy when installed)")
+    parser.add_argument("--fft-workers", type=int, default=None, help="number of fft threads")
+    parser.add_argument("--rsa-key-sizes", default="512,1024", help="comma separated rsa key sizes ('' to skip)")
+    parser.add_argument("--rsa-blocks", type=int, default=64)
+    parser.add_argument("--workdir", default=None, help="directory for synthetic images (temporary by default)")
+    parser.add_argument("--compare", default=None, help="baseline results file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown against baseline")
+    args = parser.parse_args(argv)
+
+    fftBackend.set_default_backend(args.fft_backend, args.fft_workers)
+    results = {"environment": environment(), "corpus": [], "synthetic": [], "rsa": []}
+
+    if args.corpus:
+        for path in sorted(glob.glob(os.path.join(args.corpus, "*.png"))):
+            logging.info("Benchmark %s", path)
+            try:
+                results["corpus"].append(benchmark_file(path, args.repeat))
+            except Exception as e:
+                results["corpus"].append({"path": path, "error": f"{type(e).__name__}: {e}"})
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    if args.large:
+        sizes.append(16384)
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        for size, color_type, bit_depth, interlace, idat_size in synthetic_cases(
+                sizes, (0, 1), (1 << 16, args.small_idat)):
+            name = f"{size}x{size}-c{color_type}-b{bit_depth}-i{interlace}-idat{idat_size}"
+            path = os.path.join(workdir, f"{name}.png")
+            logging.info("Benchmark %s", name)
+            start = time.perf_counter()
+            write_synthetic_png(path, size, size, color_type, bit_depth, interlace, idat_size)
+            case = {"name": name, "generate": time.perf_counter() - start}
+            case.update(benchmark_file(path, args.repeat, fft=not args.no_fft))
+            results["synthetic"].append(case)
+            os.remove(path)
+
+    key_sizes = [int(size) for size in args.rsa_key_sizes.split(",") if size]
+    if key_sizes:
+        logging.info("Benchmark rsa")
+        for public_exponent in (RANDOM_EXPONENT, STANDARD_EXPONENT):
+            results["rsa"] += benchmark_rsa(key_sizes, args.repeat, args.rsa_blocks, public_exponent)
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2, default=float)
+    logging.info("Results saved to %s", args.output)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for regression in regressions:
+            logging.warning("Regression %s", regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
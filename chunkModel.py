@@ -0,0 +1,162 @@
+import numpy as np
+from PyQt6.QtCore import QAbstractItemModel, QModelIndex, QSize, Qt
+from PyQt6.QtGui import QImage
+
+
+class _ChunkItem(object):
+    """Chunk row of model, details are created when row is expanded"""
+    __slots__ = ("row", "chunk", "checked", "details")
+
+    def __init__(self, row: int, chunk) -> None:
+        self.row = row
+        self.chunk = chunk
+        self.checked = True
+        self.details = None
+
+
+class ChunkModel(QAbstractItemModel):
+    """Tree model of png chunks
+
+    Top level rows are chunks (ancillary chunks are checkable and selected for
+    saving by default), child rows are chunk details. Details, palette swatch
+    and histogram rows are created only for expanded chunks, so views render
+    files with thousands of chunks without creating data for hidden rows.
+    """
+    HEADERS = ("Chunk", "Value")
+    # size of single palette entry in swatch image
+    SWATCH_CELL = 12
+    SWATCH_COLUMNS = 16
+    HISTOGRAM_HEIGHT = 200
+    # detail rows drawn as image (palette) or widget set by view (histogram)
+    PALETTE_ROW = "Palette"
+    HISTOGRAM_ROW = "Histogram"
+
+    def __init__(self, chunks: list, parent=None) -> None:
+        super().__init__(parent)
+        self._items = [_ChunkItem(row, chunk) for row, chunk in enumerate(chunks)]
+
+    def index(self, row: int, column: int, parent: QModelIndex = QModelIndex()) -> QModelIndex:
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        if not parent.isValid():
+            return self.createIndex(row, column, None)
+        return self.createIndex(row, column, self._items[parent.row()])
+
+    def parent(self, index: QModelIndex) -> QModelIndex:
+        item = index.internalPointer() if index.isValid() else None
+        if item is None:
+            return QModelIndex()
+        return self.createIndex(item.row, 0, None)
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        if not parent.isValid():
+            return len(self._items)
+        if parent.internalPointer() is not None or parent.column() != 0:
+            return 0
+        return len(self._details(self._items[parent.row()]))
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return len(self.HEADERS)
+
+    def hasChildren(self, parent: QModelIndex = QModelIndex()) -> bool:
+        # details are not created just to draw expand indicator
+        if not parent.isValid():
+            return bool(self._items)
+        return parent.internalPointer() is None and parent.column() == 0
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def flags(self, index: QModelIndex) -> Qt.ItemFlag:
+        if not index.isValid():
+            return Qt.ItemFlag.NoItemFlags
+        flags = Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+        if self._is_ancillary_row(index):
+            flags |= Qt.ItemFlag.ItemIsUserCheckable
+        return flags
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        parent_item = index.internalPointer()
+        if parent_item is None:
+            return self._chunk_data(self._items[index.row()], index.column(), role)
+
+        key, value = self._details(parent_item)[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            if key == self.HISTOGRAM_ROW or key == self.PALETTE_ROW:
+                return key if index.column() == 0 else None
+            return key if index.column() == 0 else value
+        if role == Qt.ItemDataRole.DecorationRole and key == self.PALETTE_ROW and index.column() == 1:
+            return value
+        if role == Qt.ItemDataRole.SizeHintRole and key == self.HISTOGRAM_ROW:
+            return QSize(0, self.HISTOGRAM_HEIGHT)
+        return None
+
+    def setData(self, index: QModelIndex, value, role: int = Qt.ItemDataRole.EditRole) -> bool:
+        if role != Qt.ItemDataRole.CheckStateRole or not self._is_ancillary_row(index):
+            return False
+        self._items[index.row()].checked = Qt.CheckState(value) == Qt.CheckState.Checked
+        self.dataChanged.emit(index, index, [role])
+        return True
+
+    def _chunk_data(self, item: _ChunkItem, column: int, role: int):
+        chunk = item.chunk
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == 0:
+                return chunk.type
+            kind = "Critical" if chunk.is_critical() else "Ancillary"
+            return f"{kind}, {chunk.chunk_length} bytes"
+        if role == Qt.ItemDataRole.CheckStateRole and column == 0 and not chunk.is_critical():
+            return Qt.CheckState.Checked if item.checked else Qt.CheckState.Unchecked
+        return None
+
+    def _is_ancillary_row(self, index: QModelIndex) -> bool:
+        return (index.internalPointer() is None and index.column() == 0
+                and not self._items[index.row()].chunk.is_critical())
+
+    def _details(self, item: _ChunkItem) -> list:
+        if item.details is not None:
+            return item.details
+
+        chunk = item.chunk
+        byte_data = bytes(chunk.byte_data[:20])
+        details = [
+            ("Chunk type", "Critical" if chunk.is_critical() else "Ancillary"),
+            ("Length", str(chunk.chunk_length)),
+            ("Byte data", f"{byte_data}..." if chunk.chunk_length > 20 else str(byte_data))
+        ]
+        for key, value in chunk.data.items():
+            value = str(value)
+            details.append((key, value[:80] + "..." if len(value) > 80 else value))
+
+        if chunk.type == "PLTE":
+            details.append((self.PALETTE_ROW, self.palette_swatch(chunk.get_entries())))
+        elif chunk.type == "hIST":
+            details.append((self.HISTOGRAM_ROW, None))
+        item.details = details
+        return details
+
+    def palette_swatch(self, entries: np.ndarray) -> QImage:
+        """Draw palette entries as single image of colored cells"""
+        rows = -(-len(entries) // self.SWATCH_COLUMNS)
+        cells = np.zeros((rows * self.SWATCH_COLUMNS, 3), dtype=np.uint8)
+        cells[:len(entries)] = entries
+        cells = cells.reshape(rows, self.SWATCH_COLUMNS, 3)
+        pixels = np.ascontiguousarray(cells.repeat(self.SWATCH_CELL, axis=0).repeat(self.SWATCH_CELL, axis=1))
+        height, width = pixels.shape[:2]
+        return QImage(pixels.data, width, height, pixels.strides[0], QImage.Format.Format_RGB888).copy()
+
+    def chunk(self, index: QModelIndex):
+        """Chunk of top level row"""
+        return self._items[index.row()].chunk
+
+    def is_histogram_row(self, index: QModelIndex) -> bool:
+        parent_item = index.internalPointer()
+        return parent_item is not None and self._details(parent_item)[index.row()][0] == self.HISTOGRAM_ROW
+
+    def selected_chunks(self) -> list:
+        """Critical chunks and checked ancillary chunks, in file order"""
+        return [item.chunk for item in self._items if item.chunk.is_critical() or item.checked]
@@ -0,0 +1,172 @@
+import logging
+import os
+import threading
+
+import numpy as np
+
+try:
+    import scipy.fft as scipy_fft
+except ImportError:
+    scipy_fft = None
+
+try:
+    import pyfftw
+    import pyfftw.builders
+except ImportError:
+    pyfftw = None
+
+
+class NumpyBackend(object):
+    """Single threaded numpy.fft"""
+    name = "numpy"
+
+    def __init__(self, workers: int = None) -> None:
+        self.workers = 1
+
+    def fft(self, a: np.ndarray, axis: int = -1) -> np.ndarray:
+        return np.fft.fft(a, axis=axis)
+
+    def rfft(self, a: np.ndarray, axis: int = -1) -> np.ndarray:
+        return np.fft.rfft(a, axis=axis)
+
+    def fft2(self, a: np.ndarray, axes: tuple = (-2, -1)) -> np.ndarray:
+        return np.fft.fft2(a, axes=axes)
+
+    def rfft2(self, a: np.ndarray, axes: tuple = (-2, -1)) -> np.ndarray:
+        return np.fft.rfft2(a, axes=axes)
+
+    @property
+    def description(self) -> str:
+        """Backend name and number of threads"""
+        return f"{self.name} ({self.workers} workers)"
+
+
+class ScipyBackend(NumpyBackend):
+    """Multithreaded scipy.fft"""
+    name = "scipy"
+
+    def __init__(self, workers: int = None) -> None:
+        self.workers = workers or os.cpu_count()
+
+    def fft(self, a: np.ndarray, axis: int = -1) -> np.ndarray:
+        return scipy_fft.fft(a, axis=axis, workers=self.workers)
+
+    def rfft(self, a: np.ndarray, axis: int = -1) -> np.ndarray:
+        return scipy_fft.rfft(a, axis=axis, workers=self.workers)
+
+    def fft2(self, a: np.ndarray, axes: tuple = (-2, -1)) -> np.ndarray:
+        return scipy_fft.fft2(a, axes=axes, workers=self.workers)
+
+    def rfft2(self, a: np.ndarray, axes: tuple = (-2, -1)) -> np.ndarray:
+        return scipy_fft.rfft2(a, axes=axes, workers=self.workers)
+
+
+class PyfftwBackend(NumpyBackend):
+    """Multithreaded FFTW with plans cached per input shape, type and axes
+
+    Planning is slow, but repeated transforms of the same size reuse the plan.
+    Accumulated wisdom can be saved with export_wisdom and loaded in another
+    process with import_wisdom.
+    """
+    name = "pyfftw"
+
+    def __init__(self, workers: int = None) -> None:
+        self.workers = workers or os.cpu_count()
+        self._plans = {}
+        self._lock = threading.Lock()
+
+    def _execute(self, builder, a: np.ndarray, axes: tuple) -> np.ndarray:
+        key = (builder.__name__, a.shape, a.dtype.str, axes)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is None:
+                plan = builder(a, axes=axes, threads=self.workers, overwrite_input=False,
+                               planner_effort="FFTW_MEASURE", avoid_copy=False)
+                self._plans[key] = plan
+            # output array of plan is reused by next execution
+            return plan(a).copy()
+
+    def fft(self, a: np.ndarray, axis: int = -1) -> np.ndarray:
+        return self._execute(pyfftw.builders.fftn, a, (axis,))
+
+    def rfft(self, a: np.ndarray, axis: int = -1) -> np.ndarray:
+        return self._execute(pyfftw.builders.rfftn, a, (axis,))
+
+    def fft2(self, a: np.ndarray, axes: tuple = (-2, -1)) -> np.ndarray:
+        return self._execute(pyfftw.builders.fftn, a, tuple(axes))
+
+    def rfft2(self, a: np.ndarray, axes: tuple = (-2, -1)) -> np.ndarray:
+        return self._execute(pyfftw.builders.rfftn, a, tuple(axes))
+
+    @staticmethod
+    def export_wisdom() -> tuple:
+        return pyfftw.export_wisdom()
+
+    @staticmethod
+    def import_wisdom(wisdom: tuple):
+        pyfftw.import_wisdom(wisdom)
+
+
+BACKENDS = {
+    "numpy": NumpyBackend,
+    "scipy": ScipyBackend,
+    "pyfftw": PyfftwBackend
+}
+
+_default_name = "auto"
+_default_workers = None
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def available_backends() -> list:
+    """Names of backends with installed dependencies"""
+    names = ["numpy"]
+    if scipy_fft is not None:
+        names.append("scipy")
+    if pyfftw is not None:
+        names.append("pyfftw")
+    return names
+
+
+def set_default_backend(name: str = "auto", workers: int = None):
+    """Set backend used when no backend is given
+
+    Args:
+        name (str): Backend name or "auto" (scipy when installed, numpy otherwise)
+        workers (int): Number of threads, all cpus by default
+    """
+    global _default_name, _default_workers
+    if name != "auto" and name not in BACKENDS:
+        raise ValueError(f"Invalid fft backend {name}")
+    _default_name = name
+    _default_workers = workers
+
+
+def get_backend(name: str = None, workers: int = None):
+    """Get fft backend
+
+    Backends are shared, so plans of pyfftw backend are reused. Backend with
+    missing dependency falls back to numpy.
+
+    Args:
+        name (str): Backend name, "auto" or None for default backend
+        workers (int): Number of threads, default number when None
+    """
+    name = name or _default_name
+    workers = workers or _default_workers
+    if name == "auto":
+        name = "scipy" if scipy_fft is not None else "numpy"
+    if name not in BACKENDS:
+        raise ValueError(f"Invalid fft backend {name}")
+    if name not in available_backends():
+        logging.warning("Fft backend %s is not installed, using numpy", name)
+        name = "numpy"
+
+    key = (name, workers)
+    with _instances_lock:
+        backend = _instances.get(key)
+        if backend is None:
+            backend = BACKENDS[name](workers)
+            _instances[key] = backend
+    return backend
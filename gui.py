@@ -4,17 +4,51 @@ from pathlib import Path
 from PyQt6.QtWidgets import QLabel
 from PyQt6.QtWidgets import QGridLayout, QHBoxLayout, QVBoxLayout, QScrollArea
 from PyQt6.QtWidgets import QWidget, QTabWidget, QGroupBox, QMessageBox, QCheckBox
-from PyQt6.QtWidgets import QLineEdit, QPushButton, QFileDialog, QTextEdit, QFormLayout
-from PyQt6.QtGui import QPixmap
-from PyQt6.QtCore import QSize, Qt
+from PyQt6.QtWidgets import QLineEdit, QPushButton, QFileDialog, QTextEdit, QFormLayout, QProgressBar
+from PyQt6.QtWidgets import QTreeView, QHeaderView
+from PyQt6.QtGui import QPixmap, QImage
+from PyQt6.QtCore import QSize, Qt, QThreadPool
 from pngFile import PngFile
+from guiWorker import Job, Worker
+from chunkModel import ChunkModel
+import numpy as np
 import pyqtgraph as pg
 
 
+def _load_task(job: Job, progress, path: str) -> PngFile:
+    png_file = PngFile(path)
+    if job.cancelled:
+        png_file.close()
+        job.check()
+    return png_file
+
+
+def _decode_task(job: Job, progress, png_file: PngFile):
+    # progress callback checks cancellation every few decoded rows
+    png_file.pixels(on_rows=lambda rows, total: progress(100 * rows // total))
+    job.check()
+    return png_file.display_pixels()
+
+
+# progress of fft task reached before its stages
+FFT_STAGE_PROGRESS = {"fft": 10, "mirror": 80}
+
+
+def _fft_task(job: Job, progress, png_file: PngFile) -> tuple:
+    fft_mag, fft_phase = png_file.get_fft("half", on_stage=lambda stage: progress(FFT_STAGE_PROGRESS[stage]))
+    job.check()
+    return (fft_mag, fft_phase, png_file.fft_backend)
+
+
 class MainWindow(QWidget):
+    # stages of file analysis run in order on thread pool
+    STAGES = ("Loading", "Decoding", "FFT")
+
     def __init__(self):
         super(MainWindow, self).__init__()
         self.png_file : PngFile = None
+        self.thread_pool = QThreadPool.globalInstance()
+        self._job = Job(0)
         self.setWindowTitle("Emedia")
         self.setFixedHeight(720)
         self.setFixedWidth(720)
@@ -77,89 +111,54 @@ class MainWindow(QWidget):
         browse_button.clicked.connect(self.openFileShowDialog)
         layout.addWidget(browse_button, 0, 4)
 
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100 * len(self.STAGES))
+        self.progress_bar.setFormat("")
+        layout.addWidget(self.progress_bar, 1, 0, 1, 5)
+
         self.image_label = QLabel()
-        layout.addWidget(self.image_label, 1, 0, 1, 5)
+        layout.addWidget(self.image_label, 2, 0, 1, 5)
 
         return layout
 
     def _chunksLayout(self, png_file : PngFile = None):
         """Create chunks layout"""
-        formLayout = QVBoxLayout()
-        groupBox = QGroupBox()
-
-        self.list_of_chunk_box = []
-
+        self.chunk_model = None
         if png_file is None:
-            label = QTextEdit("Image not loaded")
-            formLayout.addWidget(label)
-        else:
-            for chunk in png_file.chunks:
-                box = QGroupBox(chunk.type)
-
-                chunksLayout = QVBoxLayout()
-
-                if chunk.is_critical() is True:
-                    label = QLabel(f"Chunk type: Critical")
-                else:
-                    label = QLabel(f"Chunk type: Ancillary")
-                    box.setCheckable(True)
-
-                chunksLayout.addWidget(label)
-
-                label = QLabel(f"Length: {chunk.chunk_length}")
-                chunksLayout.addWidget(label)
-
-                if len(chunk.byte_data) > 20:
-                    label = QLabel(f"Byte data: {chunk.byte_data[:20]}...")
-                else:
-                    label = QLabel(f"Byte data: {chunk.byte_data}")
-
-                chunksLayout.addWidget(label)
-
-                for key, value in chunk.data.items():
-                    if key == "Decoded data":
-                        label = QLabel(f"{key}: {str(value)[:40]}...")
-                    else:
-                        label = QLabel(f"{key}: {value}")
-                    chunksLayout.addWidget(label)
-
-
-                if chunk.type == "PLTE":
-                    plte_colors = chunk.get_RGB()
-                    for i in range(len(plte_colors[0])):
-                        color = (plte_colors[0][i], plte_colors[1][i], plte_colors[2][i])
-                        label = QLabel(f"{color}")
-                        chunksLayout.addWidget(label)
-                        label = QLabel()
-                        label.setStyleSheet(f"background-color: rgb{color};")
-                        chunksLayout.addWidget(label)
-
-                if chunk.type == "hIST":
-                    test = QVBoxLayout()
-                    histogram = chunk.get_histogram()
-                    plte = png_file.get_chunk("PLTE")
-                    brushes = []
-                    plte_colors = plte.get_RGB()
-                    for i, red in enumerate(plte_colors[0]):
-                        brushes.append((red, plte_colors[1][i], plte_colors[2][i]))
-
-                    # add histogram
-                    plot = pg.plot()
-                    bargraph = pg.BarGraphItem(x =  [i for i in range(len(histogram))], height = histogram, width = 0.6, brushes = brushes)
-                    plot.addItem(bargraph)
-                    chunksLayout.addWidget(plot)
-
-                box.setLayout(chunksLayout)
-                formLayout.addWidget(box)
-                self.list_of_chunk_box.append(box)
-
-
-        groupBox.setLayout(formLayout)
-
-        scroll = QScrollArea()
-        scroll.setWidget(groupBox)
-        scroll.setWidgetResizable(True)
-        return scroll
+            return QTextEdit("Image not loaded")
+
+        self.chunk_model = ChunkModel(png_file.chunks, self)
+        tree = QTreeView()
+        tree.setModel(self.chunk_model)
+        tree.header().setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)
+        tree.expanded.connect(lambda index: self._onChunkExpanded(tree, index))
+        return tree
+
+    def _onChunkExpanded(self, tree: QTreeView, index):
+        """Build histogram chart of expanded hIST chunk (once)"""
+        model = self.chunk_model
+        chunk = model.chunk(index)
+        if chunk.type != "hIST":
+            return
+        for row in range(model.rowCount(index)):
+            child = model.index(row, 0, index)
+            if not model.is_histogram_row(child) or tree.indexWidget(child) is not None:
+                continue
+            tree.setFirstColumnSpanned(row, index, True)
+            tree.setIndexWidget(child, self.__createHistogram(chunk))
+
+    def __createHistogram(self, chunk):
+        histogram = chunk.get_histogram()
+        brushes = []
+        plte = self.png_file.get_chunk("PLTE")
+        if plte is not None:
+            brushes = [tuple(color) for color in plte.get_entries()[:len(histogram)].tolist()]
+
+        plot = pg.PlotWidget()
+        bargraph = pg.BarGraphItem(x=np.arange(len(histogram)), height=histogram, width=0.6,
+                                   brushes=brushes or None)
+        plot.addItem(bargraph)
+        return plot
 
     def __createPlot(self, title: str, data):
         graphWidget = pg.PlotWidget()
@@ -196,19 +195,18 @@ class MainWindow(QWidget):
 
         return imv
 
-    def _fftLayout(self, png_file : PngFile = None):
-        """Create chunks layout"""
+    def _fftLayout(self, fft: tuple = None):
+        """Create fft layout from magnitude, phase and backend description"""
         formLayout = QVBoxLayout()
         groupBox = QGroupBox()
 
-        self.list_of_chunk_box = []
-
-        if png_file is None:
+        if fft is None:
             label = QTextEdit("Image not loaded")
             formLayout.addWidget(label)
         else:
-            fft_list = self.png_file.get_fft()
+            fft_list = fft[:2]
             fft_titles = ["FFT maginitude", "FFT phase"]
+            formLayout.addWidget(QLabel(f"FFT backend: {fft[2]}"))
 
             for i, fft_data in enumerate(fft_list):
                 fft_plot_widget = self.__createImageFFT(fft_titles[i], fft_data)
@@ -221,9 +219,18 @@ class MainWindow(QWidget):
         scroll.setWidgetResizable(True)
         return scroll
 
-    def _updateImgae(self, img_file):
-        """Update image in file layout"""
-        im = QPixmap(img_file)
+    def _updateImgae(self, pixels):
+        """Update image in file layout from 8 bit gray, RGB or RGBA pixels"""
+        height, width = pixels.shape[:2]
+        channels = 1 if pixels.ndim == 2 else pixels.shape[2]
+        formats = {
+            1: QImage.Format.Format_Grayscale8,
+            3: QImage.Format.Format_RGB888,
+            4: QImage.Format.Format_RGBA8888
+        }
+        image = QImage(pixels.data, width, height, pixels.strides[0], formats[channels]).copy()
+
+        im = QPixmap.fromImage(image)
         high_rez = QSize(550, 550)
 
         im = im.scaled(high_rez)
@@ -248,26 +255,61 @@ class MainWindow(QWidget):
         self.path_to_file.insert(fname[0])
         logging.info(f"File {fname[0]}")
 
-        self.png_file = PngFile(fname[0])
-        # try:
-        #     self.png_file = PngFile(fname[0])
-        # except Exception as e: print("diiii %s", e)
-           # QMessageBox.critical(self, "Error", "Error during file encoding")
-           # return
-        self._updateImgae(fname[0])
-        try:
-            self.png_file = PngFile(fname[0])
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Error during file encodinn:\n{str(e)}")
+        # results of previous file still being analysed are dropped
+        self._job.cancel()
+        self.thread_pool.clear()
+        self._job = Job(self._job.generation + 1)
+
+        self.png_file = None
+        self.save_file_button.setDisabled(True)
+        self.image_label.clear()
+        self._replaceTab(1, self._chunksLayout(), "Chunks")
+        self._replaceTab(2, self._fftLayout(), "FFT")
+        self._startStage(0, _load_task, fname[0])
+
+    def _replaceTab(self, index: int, widget: QWidget, title: str):
+        current = self.tabwidget.currentIndex()
+        self.tabwidget.removeTab(index)
+        self.tabwidget.insertTab(index, widget, title)
+        self.tabwidget.setCurrentIndex(current)
+
+    def _startStage(self, stage: int, function, *args):
+        """Run stage of analysis of current file on thread pool"""
+        worker = Worker(self._job, self.STAGES[stage], function, *args)
+        worker.signals.result.connect(self._onResult)
+        worker.signals.error.connect(self._onError)
+        worker.signals.progress.connect(self._onProgress)
+        self._onProgress(self._job.generation, self.STAGES[stage], 0)
+        self.thread_pool.start(worker)
+
+    def _onProgress(self, generation: int, stage: str, percent: int):
+        if generation != self._job.generation:
             return
+        self.progress_bar.setValue(100 * self.STAGES.index(stage) + percent)
+        self.progress_bar.setFormat(f"{stage} %p%")
 
-        self.tabwidget.removeTab(2)
-        self.tabwidget.removeTab(1)
-        self.save_file_button.setDisabled(False)
-        self.tabwidget.addTab(self._chunksLayout(self.png_file), "Chunks")
-        self.tabwidget.addTab(self._fftLayout(self.png_file), "FFT")
+    def _onResult(self, generation: int, stage: str, result):
+        """Fill tab with result of stage and start next stage"""
+        if generation != self._job.generation:
+            return
+        if stage == "Loading":
+            self.png_file = result
+            self._replaceTab(1, self._chunksLayout(self.png_file), "Chunks")
+            self.save_file_button.setEnabled(True)
+            self._startStage(1, _decode_task, self.png_file)
+        elif stage == "Decoding":
+            self._updateImgae(result)
+            self._startStage(2, _fft_task, self.png_file)
+        else:
+            self._replaceTab(2, self._fftLayout(result), "FFT")
+            self.progress_bar.setValue(self.progress_bar.maximum())
+            self.progress_bar.setFormat("Done")
 
-        self.save_file_button.setEnabled(True)
+    def _onError(self, generation: int, stage: str, message: str):
+        if generation != self._job.generation:
+            return
+        self.progress_bar.setFormat(f"{stage} failed")
+        QMessageBox.critical(self, "Error", f"Error during file encodinn:\n{message}")
 
     def _save_only_critical_chunks(self, file):
             for chunk in self.png_file.chunks:
@@ -275,15 +317,8 @@ class MainWindow(QWidget):
                     file.write(chunk.create_chunk())
 
     def _save_choosen_chunks(self, file):
-        itter = 0
-        for chunk in self.png_file.chunks:
-            if chunk.is_critical() is True:
-                file.write(chunk.create_chunk())
-            else:
-                if self.list_of_chunk_box[itter].isChecked():
-                    file.write(chunk.create_chunk())
-
-            itter += 1
+        for chunk in self.chunk_model.selected_chunks():
+            file.write(chunk.create_chunk())
 
     def saveImage(self):
         """On save image button"""
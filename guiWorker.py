@@ -0,0 +1,74 @@
+import logging
+import threading
+
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+
+
+class Cancelled(Exception):
+    """Raised inside of task when its job was cancelled"""
+
+
+class WorkerSignals(QObject):
+    """Signals of Worker, emitted with generation of job which started task
+
+    Slots are called in thread of receiver (GUI thread), so widgets can be
+    updated from them.
+    """
+    result = pyqtSignal(int, str, object)
+    error = pyqtSignal(int, str, str)
+    progress = pyqtSignal(int, str, int)
+
+
+class Job(object):
+    """Generation and cancellation flag shared by all tasks of loaded file"""
+    def __init__(self, generation: int) -> None:
+        self.generation = generation
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def check(self):
+        """Stop running task of cancelled job"""
+        if self._cancelled.is_set():
+            raise Cancelled()
+
+
+class Worker(QRunnable):
+    """Task of QThreadPool running single stage of file analysis
+
+    Function is called with job and progress callback (taking percent) followed
+    by given arguments, its return value is emitted with result signal.
+    Cancelled tasks emit nothing.
+    """
+    def __init__(self, job: Job, stage: str, function, *args) -> None:
+        super().__init__()
+        self.job = job
+        self.stage = stage
+        self.function = function
+        self.args = args
+        self.signals = WorkerSignals()
+
+    def _progress(self, percent: int):
+        self.job.check()
+        self.signals.progress.emit(self.job.generation, self.stage, percent)
+
+    def run(self):
+        if self.job.cancelled:
+            return
+        try:
+            result = self.function(self.job, self._progress, *self.args)
+        except Cancelled:
+            logging.debug("Task %s of job %d cancelled", self.stage, self.job.generation)
+            return
+        except Exception as e:
+            logging.exception("Task %s failed", self.stage)
+            if not self.job.cancelled:
+                self.signals.error.emit(self.job.generation, self.stage, str(e))
+            return
+        if not self.job.cancelled:
+            self.signals.result.emit(self.job.generation, self.stage, result)
@@ -1,18 +1,27 @@
-from pngFile import PngFile
+import sys
 import logging
 
 # if __name__ == "__main__":
 #     logging.getLogger().setLevel(logging.DEBUG)
 #     x = PngFile("png/land.png")
 
-import sys
-from PyQt6.QtWidgets import QApplication
-from gui import MainWindow
-import logging
-
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "scan":
+        # headless metadata scanner, Qt is not imported
+        import pngScanner
+        logging.basicConfig(level=logging.INFO)
+        sys.exit(pngScanner.main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] in ("keygen", "encrypt", "decrypt"):
+        # image data encryption, Qt is not imported
+        import pngEncryption
+        logging.basicConfig(level=logging.INFO)
+        sys.exit(pngEncryption.main(sys.argv[1:]))
+
+    from PyQt6.QtWidgets import QApplication
+    from gui import MainWindow
+
     logging.basicConfig(level=logging.DEBUG)
     app = QApplication(sys.argv)
     mw = MainWindow()
     mw.show()
-    sys.exit(app.exec())
\ No newline at end of file
+    sys.exit(app.exec())
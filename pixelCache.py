@@ -0,0 +1,79 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class PixelCache(object):
+    """Least recently used cache of decoded images with byte size budget
+
+    Cached arrays are read only, because they are shared by all consumers.
+    """
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024) -> None:
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(path: str) -> tuple:
+        """Cache key of file, changes when file is modified"""
+        status = os.stat(path)
+        return (os.path.realpath(path), status.st_size, status.st_mtime_ns)
+
+    def get(self, key: tuple) -> np.ndarray:
+        with self._lock:
+            array = self._entries.get(key)
+            if array is not None:
+                self._entries.move_to_end(key)
+            return array
+
+    def put(self, key: tuple, array: np.ndarray):
+        """Add array to cache, arrays bigger than whole budget are not cached"""
+        array.setflags(write=False)
+        if array.nbytes > self._max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old.nbytes
+            self._entries[key] = array
+            self._size += array.nbytes
+            while self._size > self._max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    @property
+    def size(self) -> int:
+        """Size of cached arrays in bytes"""
+        return self._size
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes
+
+
+_shared_cache = None
+
+
+def enable_shared_cache(max_bytes: int = 512 * 1024 * 1024) -> PixelCache:
+    """Enable process wide cache used by PngFile objects without own cache"""
+    global _shared_cache
+    _shared_cache = PixelCache(max_bytes)
+    return _shared_cache
+
+
+def disable_shared_cache():
+    global _shared_cache
+    _shared_cache = None
+
+
+def shared_cache() -> PixelCache:
+    """Process wide cache, None when disabled"""
+    return _shared_cache
@@ -1,5 +1,6 @@
 import logging
 import io
+import struct
 import zlib
 
 import numpy as np
@@ -10,71 +11,207 @@ from terminalColors import bcolors
 CHUNK_LENGTH_SIZE = 4
 CHUNK_TYPE_SIZE = 4
 CHUNK_CRC_SIZE = 4
+CHUNK_HEADER = struct.Struct(">I4s")
+CRC_BLOCK_SIZE = 1 << 20
+
+VERIFY_MODES = ("strict", "lenient", "off")
+
+
+class ChunkCrcError(RuntimeError):
+    def __init__(self, chunk_type: str, stored: int, calculated: int) -> None:
+        super().__init__(f"Invalid {chunk_type} crc: stored {stored:#010x}, calculated {calculated:#010x}")
+        self.chunk_type = chunk_type
+        self.stored = stored
+        self.calculated = calculated
+
+
+# chunk type -> chunk class, filled by register_chunk
+CHUNK_TYPES = {}
+
+
+def register_chunk(chunk_type: str):
+    """Class decorator registering parser class of chunk type
+
+    Example:
+        @register_chunk("vpAg")
+        class PngChunkvpAg(PngChunk):
+            __slots__ = ()
+
+            def _parse_data(self, data_dict: dict):
+                ...
+    """
+    def decorator(chunk_class):
+        CHUNK_TYPES[chunk_type] = chunk_class
+        return chunk_class
+    return decorator
+
 
 class PngChunk(object):
-    def __init__(self, file: io.BufferedReader) -> None:
-        logging.debug(f"{bcolors.HEADER}{bcolors.BOLD}New chunk:{bcolors.ENDC}")
+    __slots__ = ("_file", "_length", "_type", "_offset", "_byte_data", "_crc", "_crc_valid", "_data")
 
-        self._file = file
-        self._length = self.__read_length()
-        self._type = self.__read_type()
-        self._byte_data = self.__read_data()
-        self._crc = self.__calculate_crc()
-
-        self._data = {}
-        if self.__change_object_to_specific_chunk() is True:
-            self._parse_data(self._data)
-
-    def __change_object_to_specific_chunk(self) -> bool:
-        """Change class to specific chunt type class (in case of use parent class)"""
-        if self.__class__ != PngChunk:
-            return True
-        try:
-            self.__class__ = globals()[f"PngChunk{self._type}"]
-        except Exception:
-            return False
-        return True
+    @classmethod
+    def read(cls, file: io.BufferedReader, lazy: bool = False) -> "PngChunk":
+        """Read chunk header and create object of class registered for chunk type
 
-    def __read_length(self) -> int:
-        """Read chunk length
+        Args:
+            file: Reader positioned at the beginning of chunk
+            lazy (bool): Read only chunk header and crc (see __init__)
+
+        Raises:
+            RuntimeError: File ends inside chunk header or chunk type is invalid
 
         Returns:
-            int: Chunk length
+            PngChunk: Chunk of class registered for its type, PngChunk for unknown types
+        """
+        offset = file.tell()
+        # copy, so error traceback does not keep memory mapped file alive
+        header = bytes(file.read(CHUNK_HEADER.size))
+        if len(header) < CHUNK_HEADER.size:
+            raise RuntimeError(f"Truncated chunk header at offset {offset}: "
+                               f"{len(header)} of {CHUNK_HEADER.size} bytes")
+        length, chunk_type = CHUNK_HEADER.unpack(header)
+        try:
+            chunk_type = chunk_type.decode("ascii")
+        except UnicodeDecodeError:
+            raise RuntimeError(f"Invalid chunk type {chunk_type} at offset {offset}") from None
+        if cls is PngChunk:
+            cls = CHUNK_TYPES.get(chunk_type, PngChunk)
+
+        chunk = cls.__new__(cls)
+        chunk._length = length
+        chunk._type = chunk_type
+        chunk.__init__(file, lazy)
+        return chunk
+
+    def __init__(self, file: io.BufferedReader, lazy: bool = False) -> None:
+        """Read chunk from file
+
+        Args:
+            file: Reader positioned at the beginning of chunk
+            lazy (bool): Read only chunk header and crc, data is loaded
+                on first access (and verified according to file.verify)
+
+        Chunks are created by read(), which reads header before __init__.
+        Data is parsed on first access of data.
         """
-        length = int.from_bytes(self._file.read(CHUNK_LENGTH_SIZE), 'big')
-        logging.debug("Length %d", length)
-        return length
+        self._file = file
+        self._offset = self._file.tell()
+        if lazy is True:
+            self._byte_data = None
+            self._file.seek(self._length, io.SEEK_CUR)
+        else:
+            self._byte_data = self.__read_data()
+        self._crc = self.__read_crc()
+        self._crc_valid = None
+        self._data = None
+
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug("%s%sNew chunk:%s %s%s%s%s length %d, crc %d", bcolors.HEADER, bcolors.BOLD,
+                          bcolors.ENDC, bcolors.OKCYAN, bcolors.BOLD, self._type, bcolors.ENDC,
+                          self._length, self._crc)
+
+    def __read_data(self) -> bytes:
+        """Read chunk data
 
-    def __read_type(self) -> str:
-        """Read chunk type
+        With memory mapped reader data is a memoryview slice of the file.
 
         Returns:
-            str: Chunk type
+            bytes: Chunk data
         """
-        chunk_type = self._file.read(CHUNK_TYPE_SIZE).decode()
-        logging.debug(f"{bcolors.OKCYAN}{bcolors.BOLD}%s{bcolors.ENDC}", chunk_type)
-        return chunk_type
+        return self._file.read(self._length)
 
-    def __read_data(self) -> bytes:
-        """Read chunk data
+    def __read_crc(self) -> int:
+        """Read crc stored in file
+        """
+        return int.from_bytes(self._file.read(CHUNK_CRC_SIZE), "big")
+
+    def __load_data(self) -> bytes:
+        """Load data of lazy chunk
 
         Returns:
             bytes: Chunk data
         """
-        data = self._file.read(self._length)
-        logging.debug("Data %s...", data[:40])
-        return data
+        return self._file.read_at(self._offset, self._length)
+
+    def _iter_blocks(self, block_size: int):
+        for start in range(0, self._length, block_size):
+            size = min(block_size, self._length - start)
+            if self._byte_data is None:
+                yield self._file.read_at(self._offset + start, size)
+            else:
+                yield memoryview(self._byte_data)[start:start + size]
+
+    def iter_data(self, block_size: int = CRC_BLOCK_SIZE):
+        """Iterate over chunk data in blocks
+
+        Data of lazy chunk is streamed from file and is not kept in memory.
+        Crc of chunk which was not verified yet is checked according to
+        file.verify before the first block is yielded, so corrupted data is
+        reported as ChunkCrcError (or recorded in lenient mode) before it is
+        decompressed or parsed.
+
+        Args:
+            block_size (int): Maximal size of single block
+        """
+        if self._crc_valid is None:
+            self.check_crc(self._file.verify)
+        yield from self._iter_blocks(block_size)
+
+    def calculate_crc(self) -> int:
+        """Calculate crc of chunk type and data
 
-    def __calculate_crc(self) -> int:
-        """Calculate chunk crc
+        Returns:
+            int: Calculated crc
         """
-        crc = int.from_bytes(self._file.read(CHUNK_CRC_SIZE), "big")
-        logging.debug("CRC: %d", crc)
+        crc = zlib.crc32(self._type.encode())
+        for block in self._iter_blocks(CRC_BLOCK_SIZE):
+            crc = zlib.crc32(block, crc)
         return crc
 
+    def check_crc(self, mode: str = "strict", crc: int = None) -> bool:
+        """Compare calculated crc with crc stored in file
+
+        Args:
+            mode (str): "strict" raises ChunkCrcError on mismatch,
+                "lenient" only logs a warning, "off" skips verification
+            crc (int): Already calculated crc, calculated when not given
+
+        Returns:
+            bool: Crc is valid (None when verification is off)
+        """
+        if mode == "off":
+            return None
+        if crc is None:
+            stats = self._file.stats
+            if stats is None:
+                crc = self.calculate_crc()
+            else:
+                with stats.timer("crc"):
+                    crc = self.calculate_crc()
+
+        self._crc_valid = crc == self._crc
+        if self._crc_valid is False:
+            if mode == "strict":
+                raise ChunkCrcError(self._type, self._crc, crc)
+            logging.warning("Invalid %s crc: stored %#010x, calculated %#010x",
+                            self._type, self._crc, crc)
+        return self._crc_valid
+
+    def _parse(self):
+        """Parse chunk data once"""
+        if self._data is None:
+            self._data = {}
+            stats = self._file.stats
+            if stats is None:
+                self._parse_data(self._data)
+                return
+            with stats.timer("parse"):
+                self._parse_data(self._data)
+            stats.add("chunks_parsed")
+
     def _parse_data(self, data_dict: dict):
-        """Parse chunk data"""
-        raise NotImplementedError
+        """Parse chunk data (chunks of unregistered types have no parsed data)"""
+        return
 
     def is_critical(self) -> bytes:
         return self._type[0].isupper()
@@ -84,7 +221,7 @@ class PngChunk(object):
         type_byte = str.encode(self._type)
         crc_byte = self._crc.to_bytes(4, 'big')
 
-        chunk_byte = length_byte + type_byte + self._byte_data + crc_byte
+        chunk_byte = length_byte + type_byte + self.byte_data + crc_byte
         return chunk_byte
 
     @property
@@ -95,62 +232,123 @@ class PngChunk(object):
     def chunk_length(self):
         return self._length
 
+    def tobytes(self) -> bytes:
+        """Return chunk data as owned bytes (copy for memory mapped chunks)"""
+        return bytes(self.byte_data)
+
+    def release(self):
+        """Release memoryview of chunk data so the mapping can be closed"""
+        if isinstance(self._byte_data, memoryview):
+            self._byte_data.release()
+
+    @property
+    def offset(self) -> int:
+        """Position of chunk data in file"""
+        return self._offset
+
+    @property
+    def crc(self) -> int:
+        """Crc stored in file"""
+        return self._crc
+
+    @property
+    def crc_valid(self) -> bool:
+        """Result of crc verification, None if chunk was not verified"""
+        return self._crc_valid
+
     @property
     def byte_data(self):
+        if self._byte_data is None:
+            self._byte_data = self.__load_data()
+            self.check_crc(self._file.verify)
         return self._byte_data
 
     @property
     def data(self):
+        self._parse()
         return self._data
 
 
 
+@register_chunk("IHDR")
 class PngChunkIHDR(PngChunk):
-    def __init__(self, file: io.BufferedReader) -> None:
-        super().__init__(file)
+    __slots__ = ()
+
+    # number of samples per pixel for every color type
+    CHANNELS = {
+        0 : 1,
+        2 : 3,
+        3 : 1,
+        4 : 2,
+        6 : 4
+    }
+
+    def __init__(self, file: io.BufferedReader, lazy: bool = False) -> None:
+        super().__init__(file, lazy)
 
     @property
     def width(self) -> int:
-        width = int.from_bytes(self._byte_data[:4], "big")
-        logging.debug("Width %d", width)
+        width = int.from_bytes(self.byte_data[:4], "big")
         return width
 
+    @property
+    def height(self) -> int:
+        height = int.from_bytes(self.byte_data[4:8], "big")
+        return height
+
     @property
     def length(self) -> int:
-        length = int.from_bytes(self._byte_data[4:8], "big")
-        logging.debug("length %d", length)
-        return length
+        return self.height
 
     @property
     def bit_depth(self) -> int:
-        bit_depth = self._byte_data[9]
-        logging.debug("bit_depth %d", bit_depth)
+        bit_depth = self.byte_data[8]
         return bit_depth
 
     @property
     def color_type(self) -> int:
-        color = self._byte_data[10]
-        logging.debug("color type %d", color)
+        color = self.byte_data[9]
         return color
 
     @property
     def compression_method(self) -> int:
-        compression = self._byte_data[11]
-        logging.debug("Compression method %d", compression)
+        compression = self.byte_data[10]
         return compression
 
     @property
     def filter_method(self) -> int:
-        filter_method = self._byte_data[11]
-        logging.debug("Filter method %d", filter_method)
+        filter_method = self.byte_data[11]
         return filter_method
 
     @property
     def interlace_method(self) -> int:
-        interlace_method = self._byte_data[11]
-        logging.debug("Interlace method %d", interlace_method)
+        interlace_method = self.byte_data[12]
         return interlace_method
 
+    @property
+    def channels(self) -> int:
+        """Number of samples per pixel"""
+        return self.CHANNELS[self.color_type]
+
+    @property
+    def bits_per_pixel(self) -> int:
+        return self.channels * self.bit_depth
+
+    @property
+    def filter_bytes_per_pixel(self) -> int:
+        """Distance to corresponding byte of previous pixel used by filters"""
+        return max(1, self.bits_per_pixel // 8)
+
+    def row_bytes(self, width: int = None) -> int:
+        """Size of scanline without filter type byte
+
+        Args:
+            width (int): Number of pixels in row, image width by default
+        """
+        if width is None:
+            width = self.width
+        return (width * self.bits_per_pixel + 7) // 8
+
 
     def _parse_data(self, data_dict:dict):
         data_dict["width"] = self.width
@@ -160,36 +358,46 @@ class PngChunkIHDR(PngChunk):
         data_dict["compression_method"] = self.compression_method
         data_dict["filter_method"] = self.filter_method
         data_dict["interlace_method"] = self.interlace_method
+        logging.debug("IHDR %s", data_dict)
 
 
+@register_chunk("IEND")
 class PngChunkIEND(PngChunk):
-    def __init__(self, file: io.BufferedReader) -> None:
-        super().__init__(file)
+    __slots__ = ()
+
+    def __init__(self, file: io.BufferedReader, lazy: bool = False) -> None:
+        super().__init__(file, lazy)
 
     def _parse_data(self, data_dict: dict):
         return
 
 
+@register_chunk("gAMA")
 class PngChunkgAMA(PngChunk):
-    def __init__(self, file: io.BufferedReader) -> None:
-        super().__init__(file)
+    __slots__ = ()
+
+    def __init__(self, file: io.BufferedReader, lazy: bool = False) -> None:
+        super().__init__(file, lazy)
 
     @property
     def gamma(self) -> float:
-        gamma = int.from_bytes(self._byte_data, "big")
-        logging.debug("Gamma %f", gamma / 100000.0)
+        gamma = int.from_bytes(self.byte_data, "big")
         return gamma / 100000.0
 
     def _parse_data(self, data_dict: dict):
         data_dict["gamma"] = self.gamma
+        logging.debug("Gamma %f", data_dict["gamma"])
 
+@register_chunk("tEXt")
 class PngChunktEXt(PngChunk):
-    def __init__(self, file: io.BufferedReader) -> None:
-        super().__init__(file)
+    __slots__ = ()
+
+    def __init__(self, file: io.BufferedReader, lazy: bool = False) -> None:
+        super().__init__(file, lazy)
 
     def _parse_data(self, data_dict: dict):
         textual_data = []
-        textual_data = self._byte_data.split(b'\x00')
+        textual_data = self.tobytes().split(b'\x00')
 
         data_dict["Keyword"] = textual_data[0]
         data_dict["Text string"] = textual_data[1]
@@ -197,7 +405,10 @@ class PngChunktEXt(PngChunk):
         logging.debug("Keyword: %s", textual_data[0])
         logging.debug("Text string: %s", textual_data[1])
 
+@register_chunk("sRGB")
 class PngChunksRGB(PngChunk):
+    __slots__ = ()
+
     RENDERING_INTENT_DEF = {
         0 : "Perceptual",
         1 : "Relative colorimetric",
@@ -205,16 +416,12 @@ class PngChunksRGB(PngChunk):
         3 : "Absolute colorimetric"
     }
 
-    def __init__(self, file: io.BufferedReader) -> None:
-        super().__init__(file)
+    def __init__(self, file: io.BufferedReader, lazy: bool = False) -> None:
+        super().__init__(file, lazy)
 
     @property
     def rendering_intent_value(self) -> int:
-        rendering_intent = int.from_bytes(self._byte_data, "big")
-        logging.debug("Rendering intent %d -> %s",
-                        rendering_intent,
-                        self.RENDERING_INTENT_DEF[rendering_intent])
-        return rendering_intent
+        return int.from_bytes(self.byte_data, "big")
 
     @property
     def rendering_intent_string(self) -> str:
@@ -222,23 +429,27 @@ class PngChunksRGB(PngChunk):
 
     def _parse_data(self, data_dict: dict):
         data_dict["rendering_intent"] = self.rendering_intent_string
+        logging.debug("Rendering intent %s", data_dict["rendering_intent"])
 
 
 
+@register_chunk("cHRM")
 class PngChunkcHRM(PngChunk):
-    def __init__(self, file: io.BufferedReader) -> None:
-        super().__init__(file)
+    __slots__ = ()
+
+    def __init__(self, file: io.BufferedReader, lazy: bool = False) -> None:
+        super().__init__(file, lazy)
 
     def _parse_data(self, data_dict: dict):
         # value times 100000
-        white_point_x = int.from_bytes(self._byte_data[:4], "big")
-        white_point_y = int.from_bytes(self._byte_data[4:8], "big")
-        red_x = int.from_bytes(self._byte_data[8:12], "big")
-        red_y = int.from_bytes(self._byte_data[12:16], "big")
-        green_x = int.from_bytes(self._byte_data[16:20], "big")
-        green_y = int.from_bytes(self._byte_data[20:24], "big")
-        blue_x = int.from_bytes(self._byte_data[24:28], "big")
-        blue_y = int.from_bytes(self._byte_data[28:32], "big")
+        white_point_x = int.from_bytes(self.byte_data[:4], "big")
+        white_point_y = int.from_bytes(self.byte_data[4:8], "big")
+        red_x = int.from_bytes(self.byte_data[8:12], "big")
+        red_y = int.from_bytes(self.byte_data[12:16], "big")
+        green_x = int.from_bytes(self.byte_data[16:20], "big")
+        green_y = int.from_bytes(self.byte_data[20:24], "big")
+        blue_x = int.from_bytes(self.byte_data[24:28], "big")
+        blue_y = int.from_bytes(self.byte_data[28:32], "big")
 
         data_dict["White point x"] = white_point_x/100000
         data_dict["White point y"] = white_point_y/100000
@@ -259,9 +470,12 @@ class PngChunkcHRM(PngChunk):
         logging.debug("Blue y = %s", blue_y / 100000)
 
 
+@register_chunk("bKGD")
 class PngChunkbKGD(PngChunk):
-    def __init__(self, file: io.BufferedReader) -> None:
-        super().__init__(file)
+    __slots__ = ()
+
+    def __init__(self, file: io.BufferedReader, lazy: bool = False) -> None:
+        super().__init__(file, lazy)
 
     def _parse_data(self, data_dict: dict):
         pass
@@ -270,59 +484,56 @@ class PngChunkbKGD(PngChunk):
         logging.info("decode1")
         if color_type == 0 or color_type == 4:
             logging.info("decode2")
-            greyscale = int.from_bytes(self._byte_data[0:2], "big")
+            greyscale = int.from_bytes(self.byte_data[0:2], "big")
             logging.info("greyscale %s", greyscale)
             self.data_dict["greyscale"] = greyscale
 
         if color_type == 2 or color_type == 6:
-            red = int.from_bytes(self._byte_data[0:2], "big")
-            green = int.from_bytes(self._byte_data[2:4], "big")
-            blue = int.from_bytes(self._byte_data[4:6], "big")
+            red = int.from_bytes(self.byte_data[0:2], "big")
+            green = int.from_bytes(self.byte_data[2:4], "big")
+            blue = int.from_bytes(self.byte_data[4:6], "big")
             logging.info("red %s", red)
             logging.info("green %s", green)
             logging.info("blue %s", blue)
 
         if color_type == 3:
-            palette_index = int.from_bytes(self._byte_data[0:1], "big")
+            palette_index = int.from_bytes(self.byte_data[0:1], "big")
             logging.info("palette_index %s", palette_index)
 
 
 
 # data to filter and compress
+@register_chunk("IDAT")
 class PngChunkIDAT(PngChunk):
-    def __init__(self, file: io.BufferedReader) -> None:
-        super().__init__(file)
+    __slots__ = ()
 
-    def _parse_data(self, data_dict: dict):
-        pass
-        # decoded_bytes = zlib.decompress(self._byte_data)
-        # decoded = int.from_bytes(decoded_bytes, "big", signed=True)
-        # cursor = 0
-        # while cursor < len(decoded_bytes):
-        #     data = decoded_bytes[cursor]
-        #     cursor += 1
-        # data_dict["Decoded data"] = decoded
-        # logging.debug("Decoded data = %s", decoded)
-    # def decode(self, color_type):
+    def __init__(self, file: io.BufferedReader, lazy: bool = False) -> None:
+        super().__init__(file, lazy)
 
+    def _parse_data(self, data_dict: dict):
+        # IDAT chunks are decoded together as one stream (see pngDecoder)
+        return
 
 
 
 
 # image offset
+@register_chunk("oFFs")
 class PngChunkoFFs(PngChunk):
+    __slots__ = ()
+
     UNIT_SPECIFIER = {
         0 : "pixel",
         1 : "micrometer"
     }
 
-    def __init__(self, file: io.BufferedReader) -> None:
-        super().__init__(file)
+    def __init__(self, file: io.BufferedReader, lazy: bool = False) -> None:
+        super().__init__(file, lazy)
 
     def _parse_data(self, data_dict: dict):
-        position_x = int.from_bytes(self._byte_data[0:4], "big", signed=True)
-        position_y = int.from_bytes(self._byte_data[4:8], "big", signed=True)
-        unit = self._byte_data[8]
+        position_x = int.from_bytes(self.byte_data[0:4], "big", signed=True)
+        position_y = int.from_bytes(self.byte_data[4:8], "big", signed=True)
+        unit = self.byte_data[8]
 
         data_dict["Position x"] = position_x
         data_dict["Position y"] = position_y
@@ -334,20 +545,23 @@ class PngChunkoFFs(PngChunk):
                       self.UNIT_SPECIFIER[unit])
 
 
+@register_chunk("pHYs")
 class PngChunkpHYs(PngChunk):
+    __slots__ = ()
+
     UNIT_SPECIFIER = {
         0 : "unknown",
         1 : "meter"
     }
 
-    def __init__(self, file: io.BufferedReader) -> None:
-        super().__init__(file)
+    def __init__(self, file: io.BufferedReader, lazy: bool = False) -> None:
+        super().__init__(file, lazy)
 
 # pixels per unit
     def _parse_data(self, data_dict: dict):
-        pixels_pu_x = int.from_bytes(self._byte_data[0:4], "big", signed=True)
-        pixels_pu_y = int.from_bytes(self._byte_data[4:8], "big", signed=True)
-        unit = self._byte_data[8]
+        pixels_pu_x = int.from_bytes(self.byte_data[0:4], "big", signed=True)
+        pixels_pu_y = int.from_bytes(self.byte_data[4:8], "big", signed=True)
+        unit = self.byte_data[8]
 
         data_dict["Position x"] = pixels_pu_x
         data_dict["Position y"] = pixels_pu_y
@@ -360,16 +574,19 @@ class PngChunkpHYs(PngChunk):
 
 
 
+@register_chunk("sTER")
 class PngChunksTER(PngChunk):
+    __slots__ = ()
+
     LAYOUT_TYPE = {
         0 : "cross-fuse layout",
         1 : "diverging-fuse layout"
     }
-    def __init__(self, file: io.BufferedReader) -> None:
-        super().__init__(file)
+    def __init__(self, file: io.BufferedReader, lazy: bool = False) -> None:
+        super().__init__(file, lazy)
 
     def _parse_data(self, data_dict: dict):
-        layout_type = self._byte_data[0]
+        layout_type = self.byte_data[0]
 
         data_dict["Layout type"] = layout_type
 
@@ -378,17 +595,20 @@ class PngChunksTER(PngChunk):
 
 
 
+@register_chunk("tIME")
 class PngChunktIME(PngChunk):
-    def __init__(self, file: io.BufferedReader) -> None:
-        super().__init__(file)
+    __slots__ = ()
+
+    def __init__(self, file: io.BufferedReader, lazy: bool = False) -> None:
+        super().__init__(file, lazy)
 
     def _parse_data(self, data_dict: dict):
-        year = int.from_bytes(self._byte_data[:2], "big")
-        month = self._byte_data[2]
-        day = self._byte_data[3]
-        hour = self._byte_data[4]
-        minute = self._byte_data[5]
-        second = self._byte_data[6]
+        year = int.from_bytes(self.byte_data[:2], "big")
+        month = self.byte_data[2]
+        day = self.byte_data[3]
+        hour = self.byte_data[4]
+        minute = self.byte_data[5]
+        second = self.byte_data[6]
 
         data_dict["year"] = year
         data_dict["month"] = month
@@ -407,63 +627,158 @@ class PngChunktIME(PngChunk):
 
 
 # kolejne wystąpienia odpowiadają kolorom z chunka PLTE
+@register_chunk("hIST")
 class PngChunkhIST(PngChunk):
-    def __init__(self, file: io.BufferedReader) -> None:
-       super().__init__(file)
+    __slots__ = ("hist",)
+
+    def __init__(self, file: io.BufferedReader, lazy: bool = False) -> None:
+        super().__init__(file, lazy)
 
     def _parse_data(self, data_dict: dict):
+        # approximate usage frequency of every palette entry
+        self.hist = np.frombuffer(self.byte_data, dtype=">u2").astype(np.uint16)
+        logging.debug("hIST %s", self.hist)
 
-       # dla pętli potrzebny jest dostęp do długości chunka
-        self.hist=[]
+    def get_histogram(self) -> np.ndarray:
+        self._parse()
+        return self.hist
 
-        for i in range(0, self._length, 2):
-           self.hist.append(int.from_bytes(self._byte_data[i: i + 2], "big"))
-        logging.info(self.hist)
-       # proba histogramu
-       # data_dict["Histogram"] = hist
-       # logging.debug("Histogram = %s", hist)
-       # counts, bins = np.histogram(hist, range(257))
-       # plt.bar(bins[:-1] - 0.5, counts, width=1, edgecolor='none')
-       # plt.xlim([-0.5, 255.5])
-       # plt.show()
 
-    def get_histogram(self) -> list:
-       return self.hist
+@register_chunk("PLTE")
+class PngChunkPLTE(PngChunk):
+    __slots__ = ("entries",)
 
+    def __init__(self, file: io.BufferedReader, lazy: bool = False) -> None:
+        super().__init__(file, lazy)
 
+    def _parse_data(self, data_dict: dict):
+        # copy, so palette does not keep memory mapped file alive
+        self.entries = np.frombuffer(self.byte_data, dtype=np.uint8).reshape(-1, 3).copy()
+        self.entries.setflags(write=False)
+        logging.debug("PLTE %s", self.entries)
 
-class PngChunkPLTE(PngChunk):
-    def __init__(self, file: io.BufferedReader) -> None:
-        super().__init__(file)
+    def get_entries(self) -> np.ndarray:
+        """Palette as read only array of shape (entries, 3)"""
+        self._parse()
+        return self.entries
+
+    def get_RGB(self) -> list:
+        """Palette as lists of red, green and blue values"""
+        self._parse()
+        return self.entries.transpose().tolist()
+
+    def lookup_table(self, trns: PngChunk = None) -> np.ndarray:
+        """Table mapping every possible palette index to RGB or RGBA color
+
+        Indices outside of palette map to black (transparent with tRNS), so
+        whole arrays of indices can be expanded with single lookup.
+
+        Args:
+            trns (PngChunk): tRNS chunk with alpha of palette entries, entries
+                without alpha are opaque
+
+        Returns:
+            np.ndarray: uint8 array of shape (256, 3) or (256, 4) with tRNS
+        """
+        entries = self.get_entries()[:256]
+        table = np.zeros((256, 3 if trns is None else 4), dtype=np.uint8)
+        table[:len(entries), :3] = entries
+        if trns is not None:
+            alpha = np.frombuffer(trns.byte_data, dtype=np.uint8)[:256]
+            table[:len(entries), 3] = 255
+            table[:len(alpha), 3] = alpha
+        table.setflags(write=False)
+        return table
+
+
+@register_chunk("sBIT")
+class PngChunksBIT(PngChunk):
+    # channel names for every chunk length (color type 0, 4, 2 or 3, 6)
+    CHANNELS = {
+        1 : ("Gray",),
+        2 : ("Gray", "Alpha"),
+        3 : ("Red", "Green", "Blue"),
+        4 : ("Red", "Green", "Blue", "Alpha")
+    }
+    __slots__ = ()
+
+    def __init__(self, file: io.BufferedReader, lazy: bool = False) -> None:
+        super().__init__(file, lazy)
 
     def _parse_data(self, data_dict: dict):
-        self.red = []
-        self.green = []
-        self.blue = []
-        # dla pętli potrzebny jest dostęp do długości chunka
-        for i in range(0, self._length, 3):
-            self.red.append(self._byte_data[i])
-            self.green.append(self._byte_data[i+1])
-            self.blue.append(self._byte_data[i+2])
-        # data_dict["PLTE R"] = self.red
-        # data_dict["PLTE G"] = self.green
-        # data_dict["PLTE B"] = self.blue
-        logging.debug("PLTE R = %s", self.red)
-        logging.debug("PLTE G = %s", self.green)
-        logging.debug("PLTE B = %s", self.blue)
+        for channel, bits in zip(self.CHANNELS[self._length], self.byte_data):
+            data_dict[f"{channel} significant bits"] = bits
+        logging.debug("sBIT %s", data_dict)
 
-    def get_RGB(self) -> list:
-        return [self.red, self.green, self.blue]
 
+@register_chunk("tRNS")
+class PngChunktRNS(PngChunk):
+    __slots__ = ()
+
+    def __init__(self, file: io.BufferedReader, lazy: bool = False) -> None:
+        super().__init__(file, lazy)
 
-#class PngChunksBIT(PngChunk):
+    def palette_alpha(self) -> list:
+        """Alpha of palette entries (color type 3), missing entries are opaque"""
+        return list(self.byte_data)
 
+    def gray(self) -> int:
+        """Transparent gray level (color type 0)"""
+        return int.from_bytes(self.byte_data[0:2], "big")
 
-#class PngChunksPLT(PngChunk):
+    def rgb(self) -> tuple:
+        """Transparent color (color type 2)"""
+        return (int.from_bytes(self.byte_data[0:2], "big"),
+                int.from_bytes(self.byte_data[2:4], "big"),
+                int.from_bytes(self.byte_data[4:6], "big"))
 
+    def _parse_data(self, data_dict: dict):
+        # meaning of data depends on color type from IHDR
+        data_dict["Transparency"] = list(self.byte_data)
+        logging.debug("tRNS %s", data_dict["Transparency"])
+
+
+@register_chunk("sPLT")
+class PngChunksPLT(PngChunk):
+    __slots__ = ()
+
+    def __init__(self, file: io.BufferedReader, lazy: bool = False) -> None:
+        super().__init__(file, lazy)
+
+    def get_entries(self) -> list:
+        """Palette entries as (red, green, blue, alpha, frequency) tuples"""
+        data = self.tobytes()
+        name_end = data.index(b'\x00')
+        entry_format = ">BBBBH" if data[name_end + 1] == 8 else ">HHHHH"
+        return list(struct.iter_unpack(entry_format, data[name_end + 2:]))
+
+    def _parse_data(self, data_dict: dict):
+        data = self.tobytes()
+        name_end = data.index(b'\x00')
+        sample_depth = data[name_end + 1]
+        entry_size = 6 if sample_depth == 8 else 10
 
-#class PngChunktRNS(PngChunk):
+        data_dict["Palette name"] = data[:name_end]
+        data_dict["Sample depth"] = sample_depth
+        data_dict["Entries"] = (len(data) - name_end - 2) // entry_size
+        logging.debug("sPLT %s", data_dict)
 
 
 # compressed equivalent of tEXt
-# class PngChunkzTXt(PngChunk):
+@register_chunk("zTXt")
+class PngChunkzTXt(PngChunk):
+    __slots__ = ()
+
+    def __init__(self, file: io.BufferedReader, lazy: bool = False) -> None:
+        super().__init__(file, lazy)
+
+    def _parse_data(self, data_dict: dict):
+        data = self.tobytes()
+        keyword_end = data.index(b'\x00')
+
+        data_dict["Keyword"] = data[:keyword_end]
+        data_dict["Compression method"] = data[keyword_end + 1]
+        data_dict["Text string"] = zlib.decompress(data[keyword_end + 2:])
+
+        logging.debug("Keyword: %s", data_dict["Keyword"])
+        logging.debug("Text string: %s", data_dict["Text string"])
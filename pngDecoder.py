@@ -0,0 +1,592 @@
+import logging
+import time
+import zlib
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+from pngChunk import PngChunkIHDR
+
+# maximal size of compressed and decompressed data processed at once
+INFLATE_BLOCK_SIZE = 64 * 1024
+# number of reconstructed rows between calls of decoding progress callback
+PROGRESS_ROWS = 64
+# consecutive Average and Paeth scanlines reconstructed together (see unfilter_scanlines)
+UNFILTER_BLOCK_ROWS = 256
+UNFILTER_BLOCK_BYTES = 4 * 1024 * 1024
+# smaller blocks (rows times bytes per pixel) are reconstructed row by row
+UNFILTER_BLOCK_MIN = 64
+
+# starting column, starting row, column step and row step of Adam7 passes
+ADAM7_PASSES = (
+    (0, 0, 8, 8),
+    (4, 0, 8, 8),
+    (0, 4, 4, 8),
+    (2, 0, 4, 4),
+    (0, 2, 2, 4),
+    (1, 0, 2, 2),
+    (0, 1, 1, 2)
+)
+
+# column and row step of pixels known after every Adam7 pass
+ADAM7_KNOWN_STEPS = ((8, 8), (4, 8), (4, 4), (2, 4), (2, 2), (1, 2), (1, 1))
+
+FILTER_TYPES = {
+    0 : "None",
+    1 : "Sub",
+    2 : "Up",
+    3 : "Average",
+    4 : "Paeth"
+}
+
+
+def iter_idat_data(chunks: list, block_size: int = INFLATE_BLOCK_SIZE):
+    """Iterate over compressed image data of all IDAT chunks
+
+    Args:
+        chunks (list): Png file chunks
+        block_size (int): Maximal size of single block
+    """
+    for chunk in chunks:
+        if chunk.type == "IDAT":
+            yield from chunk.iter_data(block_size)
+
+
+def iter_inflated(chunks: list, block_size: int = INFLATE_BLOCK_SIZE, stats=None):
+    """Decompress concatenated IDAT data with single decompressor
+
+    Every yielded block is at most block_size bytes long, so the whole
+    decompressed image is never held in memory.
+
+    Args:
+        chunks (list): Png file chunks
+        block_size (int): Maximal size of compressed and decompressed block
+        stats (PngStats): Statistics updated with inflate time and size
+    """
+    decompressor = zlib.decompressobj()
+    for data in iter_idat_data(chunks, block_size):
+        while data and not decompressor.eof:
+            if stats is None:
+                block = decompressor.decompress(data, block_size)
+            else:
+                start = time.perf_counter()
+                block = decompressor.decompress(data, block_size)
+                stats.add_time("inflate", time.perf_counter() - start)
+                stats.add("bytes_inflated", len(block))
+            yield block
+            data = decompressor.unconsumed_tail
+
+    while not decompressor.eof:
+        block = decompressor.decompress(b'', block_size)
+        if not block:
+            raise RuntimeError("IDAT data stream is truncated")
+        yield block
+
+
+def image_passes(ihdr: PngChunkIHDR) -> list:
+    """Size of reduced images stored in IDAT data
+
+    Returns:
+        list: Width and height of every pass (single pass for non interlaced image)
+    """
+    if ihdr.interlace_method == 0:
+        return [(ihdr.width, ihdr.height)]
+    if ihdr.interlace_method != 1:
+        raise RuntimeError(f"Invalid interlace method {ihdr.interlace_method}")
+
+    passes = []
+    for start_x, start_y, step_x, step_y in ADAM7_PASSES:
+        passes.append(((ihdr.width - start_x + step_x - 1) // step_x,
+                       (ihdr.height - start_y + step_y - 1) // step_y))
+    return passes
+
+
+def iter_pass_scanlines(ihdr: PngChunkIHDR, chunks: list, block_size: int = INFLATE_BLOCK_SIZE, stats=None):
+    """Iterate over filtered scanlines of all passes
+
+    Only the currently decompressed block and one row are kept in memory.
+    Empty passes of interlaced image have no scanlines.
+
+    Args:
+        ihdr (PngChunkIHDR): Image header
+        chunks (list): Png file chunks
+        block_size (int): Maximal size of compressed and decompressed block
+        stats (PngStats): Statistics updated with inflate time and size
+
+    Yields:
+        tuple: Pass index, filter type and filtered row data (without filter type byte)
+    """
+    rows = [(index, ihdr.row_bytes(width) + 1, height)
+            for index, (width, height) in enumerate(image_passes(ihdr))
+            if width > 0 and height > 0]
+    rows.reverse()
+    if not rows:
+        return
+
+    pass_index, stride, rows_left = rows.pop()
+    buffer = bytearray()
+    for block in iter_inflated(chunks, block_size, stats):
+        buffer += block
+        start = 0
+        while rows_left > 0 and len(buffer) - start >= stride:
+            filter_type = buffer[start]
+            if filter_type not in FILTER_TYPES:
+                raise RuntimeError(f"Invalid filter type {filter_type}")
+            yield pass_index, filter_type, bytes(buffer[start + 1:start + stride])
+            start += stride
+            rows_left -= 1
+            if rows_left == 0 and rows:
+                pass_index, stride, rows_left = rows.pop()
+        del buffer[:start]
+
+    if rows_left > 0 or rows:
+        raise RuntimeError("IDAT data stream is missing rows")
+    if buffer:
+        logging.warning("%d bytes of extra data after last scanline", len(buffer))
+
+
+def iter_scanlines(ihdr: PngChunkIHDR, chunks: list, block_size: int = INFLATE_BLOCK_SIZE, stats=None):
+    """Iterate over filtered scanlines in the order they are stored
+
+    Only the currently decompressed block and one row are kept in memory.
+    Scanlines of interlaced image are yielded pass after pass, rows of every
+    pass are as wide as the pass (see image_passes, iter_pass_scanlines also
+    yields pass index).
+
+    Args:
+        ihdr (PngChunkIHDR): Image header
+        chunks (list): Png file chunks
+        block_size (int): Maximal size of compressed and decompressed block
+        stats (PngStats): Statistics updated with inflate time and size
+
+    Yields:
+        tuple: Filter type and filtered row data (without filter type byte)
+    """
+    for _, filter_type, row in iter_pass_scanlines(ihdr, chunks, block_size, stats):
+        yield filter_type, row
+
+
+def _unfilter_average(out: list, prior: list, bytes_per_pixel: int):
+    """Reverse Average filter of single row in place"""
+    for i in range(bytes_per_pixel):
+        out[i] = (out[i] + (prior[i] >> 1)) & 0xff
+    for i in range(bytes_per_pixel, len(out)):
+        out[i] = (out[i] + ((out[i - bytes_per_pixel] + prior[i]) >> 1)) & 0xff
+
+
+def _unfilter_paeth(out: list, prior: list, prior_distance: list, bytes_per_pixel: int):
+    """Reverse Paeth filter of single row in place
+
+    prior_distance is |b - c| of every byte, it depends only on previous row.
+    """
+    for i in range(bytes_per_pixel):
+        out[i] = (out[i] + prior[i]) & 0xff
+    for i in range(bytes_per_pixel, len(out)):
+        a = out[i - bytes_per_pixel]
+        b = prior[i]
+        c = prior[i - bytes_per_pixel]
+        pa = prior_distance[i]
+        pb = abs(a - c)
+        pc = abs(a + b - c - c)
+        if pa <= pb and pa <= pc:
+            out[i] = (out[i] + a) & 0xff
+        elif pb <= pc:
+            out[i] = (out[i] + b) & 0xff
+        else:
+            out[i] = (out[i] + c) & 0xff
+
+
+def unfilter_scanlines(filter_types: np.ndarray, rows: np.ndarray, previous: np.ndarray,
+                       bytes_per_pixel: int) -> np.ndarray:
+    """Reverse filter of block of consecutive Average and Paeth scanlines
+
+    Pixel depends on pixels on the left, above and above left, so all pixels
+    of one anti-diagonal of the block (column x of row y, column x - 1 of row
+    y + 1, ...) are independent. Rows are stored skewed, so every anti-diagonal
+    is a single array and block is reconstructed in width + rows NumPy steps.
+
+    Args:
+        filter_types (np.ndarray): Filter type (3 or 4) of every scanline
+        rows (np.ndarray): Filtered scanlines of shape (rows, row bytes)
+        previous (np.ndarray): Reconstructed scanline above the block
+        bytes_per_pixel (int): Filter distance in bytes
+
+    Returns:
+        np.ndarray: Reconstructed scanlines as uint8 array of the same shape
+    """
+    height, row_bytes = rows.shape
+    width = row_bytes // bytes_per_pixel
+    # skewed[y, x] = diagonals[x + y + 1, y], row 0 is previous scanline and
+    # diagonal 0 is zero column on the left of the image
+    diagonals = np.zeros((width + height + 1, height + 1, bytes_per_pixel), dtype=np.int16)
+    step, row_step, byte_step = diagonals.strides
+    skewed = as_strided(diagonals[1:], shape=(height + 1, width, bytes_per_pixel),
+                        strides=(step + row_step, step, byte_step))
+    skewed[0] = previous.reshape(width, bytes_per_pixel)
+    skewed[1:] = rows.reshape(height, width, bytes_per_pixel)
+
+    paeth = (np.asarray(filter_types) == 4)[:, np.newaxis]
+    any_paeth = paeth.any()
+    all_paeth = paeth.all()
+    for diagonal in range(2, width + height + 1):
+        first = max(1, diagonal - width)
+        last = min(height, diagonal - 1) + 1
+        a = diagonals[diagonal - 1, first:last]
+        b = diagonals[diagonal - 1, first - 1:last - 1]
+        c = diagonals[diagonal - 2, first - 1:last - 1]
+        if any_paeth:
+            up = b - c
+            left = a - c
+            pa = np.abs(up)
+            pb = np.abs(left)
+            pc = np.abs(up + left)
+            predictor = np.where(pa <= np.minimum(pb, pc), a, np.where(pb <= pc, b, c))
+            if not all_paeth:
+                predictor = np.where(paeth[first - 1:last - 1], predictor, (a + b) >> 1)
+        else:
+            predictor = (a + b) >> 1
+        current = diagonals[diagonal, first:last]
+        current += predictor
+        current &= 0xff
+
+    return skewed[1:].astype(np.uint8).reshape(height, row_bytes)
+
+
+def unfilter_scanline(filter_type: int, row: bytes, previous: np.ndarray, bytes_per_pixel: int) -> np.ndarray:
+    """Reverse filter of single scanline
+
+    None, Sub and Up are computed on whole row with NumPy (Sub as cumulative
+    sum over pixels with uint8 wrap around). Average and Paeth depend on
+    already reconstructed byte on the left, so they are computed byte by byte,
+    terms depending only on previous row are computed with NumPy for whole
+    row. Blocks of Average and Paeth scanlines are reconstructed faster by
+    unfilter_scanlines.
+
+    Args:
+        filter_type (int): Filter type byte of scanline
+        row (bytes): Filtered scanline (without filter type byte)
+        previous (np.ndarray): Reconstructed previous scanline (zeros for first row)
+        bytes_per_pixel (int): Filter distance in bytes
+
+    Returns:
+        np.ndarray: Reconstructed scanline as uint8 array
+    """
+    filtered = np.frombuffer(row, dtype=np.uint8)
+
+    if filter_type == 0:
+        return filtered.copy()
+
+    if filter_type == 4 and not previous.any():
+        # Paeth predictor of row below zero row is always left byte (Sub)
+        filter_type = 1
+
+    if filter_type == 1:
+        pixels = filtered.reshape(-1, bytes_per_pixel)
+        return np.cumsum(pixels, axis=0, dtype=np.uint8).reshape(-1)
+
+    if filter_type == 2:
+        return filtered + previous
+
+    if filter_type not in (3, 4):
+        raise RuntimeError(f"Invalid filter type {filter_type}")
+
+    prior = previous.astype(np.int16)
+    out = filtered.tolist()
+    if filter_type == 3:
+        _unfilter_average(out, prior.tolist(), bytes_per_pixel)
+    else:
+        prior_distance = np.zeros_like(prior)
+        prior_distance[bytes_per_pixel:] = np.abs(prior[bytes_per_pixel:] - prior[:-bytes_per_pixel])
+        _unfilter_paeth(out, prior.tolist(), prior_distance.tolist(), bytes_per_pixel)
+
+    return np.array(out, dtype=np.uint8)
+
+
+def iter_rows(ihdr: PngChunkIHDR, chunks: list, block_size: int = INFLATE_BLOCK_SIZE, stats=None):
+    """Iterate over reconstructed (unfiltered) scanlines of non interlaced image
+
+    Rows of interlaced image are complete only after the last pass, so they can
+    not be streamed, iter_pass_rows streams rows of passes and decode_pixels
+    decodes whole image.
+
+    Args:
+        ihdr (PngChunkIHDR): Image header
+        chunks (list): Png file chunks
+        block_size (int): Maximal size of compressed and decompressed block
+        stats (PngStats): Statistics updated with inflate and unfilter time
+
+    Yields:
+        np.ndarray: Reconstructed row bytes as uint8 array
+
+    Raises:
+        ValueError: Image is interlaced
+    """
+    if ihdr.interlace_method != 0:
+        raise ValueError("Rows of interlaced image belong to passes, use iter_pass_rows or decode_pixels")
+
+    for _, row in iter_pass_rows(ihdr, chunks, block_size, stats):
+        yield row
+
+
+def _unfilter_block(block: list, previous: np.ndarray, bytes_per_pixel: int) -> list:
+    """Reconstruct consecutive Average and Paeth scanlines given as (filter type, row)"""
+    if len(block) * bytes_per_pixel < UNFILTER_BLOCK_MIN:
+        rows = []
+        for filter_type, row in block:
+            previous = unfilter_scanline(filter_type, row, previous, bytes_per_pixel)
+            rows.append(previous)
+        return rows
+    filter_types = np.array([filter_type for filter_type, _ in block])
+    rows = np.frombuffer(b"".join(row for _, row in block), dtype=np.uint8).reshape(len(block), -1)
+    return list(unfilter_scanlines(filter_types, rows, previous, bytes_per_pixel))
+
+
+def iter_pass_rows(ihdr: PngChunkIHDR, chunks: list, block_size: int = INFLATE_BLOCK_SIZE, stats=None):
+    """Iterate over reconstructed scanlines of all passes
+
+    Consecutive Average and Paeth scanlines of a pass are collected into blocks
+    of at most UNFILTER_BLOCK_ROWS rows (and UNFILTER_BLOCK_BYTES bytes), which
+    are reconstructed together.
+
+    Yields:
+        tuple: Pass index and reconstructed row bytes as uint8 array
+    """
+    bytes_per_pixel = ihdr.filter_bytes_per_pixel
+    passes = image_passes(ihdr)
+    current_pass = None
+    previous = None
+    block = []
+    block_rows = UNFILTER_BLOCK_ROWS
+
+    def unfilter(block: list, previous: np.ndarray) -> list:
+        if stats is None:
+            return _unfilter_block(block, previous, bytes_per_pixel)
+        start = time.perf_counter()
+        rows = _unfilter_block(block, previous, bytes_per_pixel)
+        stats.add_time("unfilter", time.perf_counter() - start)
+        stats.add("rows_unfiltered", len(rows))
+        return rows
+
+    for pass_index, filter_type, row in iter_pass_scanlines(ihdr, chunks, block_size, stats):
+        if block and (pass_index != current_pass or filter_type not in (3, 4) or len(block) == block_rows):
+            for previous in unfilter(block, previous):
+                yield current_pass, previous
+            block = []
+        if pass_index != current_pass:
+            current_pass = pass_index
+            row_bytes = ihdr.row_bytes(passes[pass_index][0])
+            previous = np.zeros(row_bytes, dtype=np.uint8)
+            block_rows = max(1, min(UNFILTER_BLOCK_ROWS, UNFILTER_BLOCK_BYTES // row_bytes))
+
+        if filter_type in (3, 4):
+            block.append((filter_type, row))
+            continue
+        previous, = unfilter([(filter_type, row)], previous)
+        yield pass_index, previous
+
+    if block:
+        for previous in unfilter(block, previous):
+            yield current_pass, previous
+
+
+def _iter_reporting(rows, total: int, on_rows):
+    """Pass rows through, calling on_rows every PROGRESS_ROWS rows and at the last row"""
+    if on_rows is None:
+        yield from rows
+        return
+    for done, row in enumerate(rows, 1):
+        if done % PROGRESS_ROWS == 0 or done == total:
+            on_rows(done, total)
+        yield row
+
+
+def iter_adam7_passes(ihdr: PngChunkIHDR, chunks: list, preview: bool = True, stats=None, on_rows=None):
+    """Decode interlaced image pass by pass
+
+    Args:
+        ihdr (PngChunkIHDR): Image header
+        chunks (list): Png file chunks
+        preview (bool): Fill pixels not decoded yet with nearest decoded pixel,
+            otherwise they stay zero
+        stats (PngStats): Statistics updated with inflate and unfilter time
+        on_rows: Callback called with number of reconstructed rows of all passes
+            and total number of rows (see decode_pixels)
+
+    Yields:
+        tuple: Pass index (0 - 6) and image decoded so far. Without preview
+            the same array is updated after every pass.
+    """
+    passes = image_passes(ihdr)
+    total = sum(height for width, height in passes if width > 0)
+    rows_iter = _iter_reporting(iter_pass_rows(ihdr, chunks, stats=stats), total, on_rows)
+    image = None
+
+    for pass_index, (width, height) in enumerate(passes):
+        if width > 0 and height > 0:
+            raw = np.empty((height, ihdr.row_bytes(width)), dtype=np.uint8)
+            for i in range(height):
+                _, raw[i] = next(rows_iter)
+            samples = unpack_samples(raw, width, ihdr.bit_depth, ihdr.channels)
+            if image is None:
+                image = np.zeros((ihdr.height, ihdr.width) + samples.shape[2:], dtype=samples.dtype)
+
+            start_x, start_y, step_x, step_y = ADAM7_PASSES[pass_index]
+            image[start_y::step_y, start_x::step_x] = samples
+
+        if image is None:
+            continue
+        if preview is False or pass_index == len(ADAM7_PASSES) - 1:
+            yield pass_index, image
+            continue
+
+        step_x, step_y = ADAM7_KNOWN_STEPS[pass_index]
+        known = image[::step_y, ::step_x]
+        known = np.repeat(np.repeat(known, step_y, axis=0), step_x, axis=1)
+        yield pass_index, known[:ihdr.height, :ihdr.width]
+
+
+def unpack_samples(raw: np.ndarray, width: int, bit_depth: int, channels: int) -> np.ndarray:
+    """Convert reconstructed scanline bytes to samples
+
+    Args:
+        raw (np.ndarray): uint8 array of shape (rows, row bytes)
+        width (int): Number of pixels in row
+        bit_depth (int): Bits per sample
+        channels (int): Samples per pixel
+
+    Returns:
+        np.ndarray: Array of shape (rows, width) for single channel images or
+            (rows, width, channels), uint8 for bit depth up to 8 (values are
+            not rescaled) and native uint16 for bit depth 16
+    """
+    rows = raw.shape[0]
+    if bit_depth == 16:
+        samples = raw.view(">u2").astype(np.uint16)
+    elif bit_depth == 8:
+        samples = raw
+    else:
+        shifts = np.arange(8 - bit_depth, -1, -bit_depth, dtype=np.uint8)
+        mask = (1 << bit_depth) - 1
+        samples = (raw[:, :, np.newaxis] >> shifts) & mask
+        samples = samples.reshape(rows, -1)[:, :width * channels]
+
+    if channels == 1:
+        return samples.reshape(rows, width)
+    return samples.reshape(rows, width, channels)
+
+
+def decode_pixels(ihdr: PngChunkIHDR, chunks: list, on_pass=None, stats=None, on_rows=None) -> np.ndarray:
+    """Decode image samples
+
+    Args:
+        ihdr (PngChunkIHDR): Image header
+        chunks (list): Png file chunks
+        on_pass: Callback called with pass index and progressively refined
+            image after every pass of interlaced image
+        stats (PngStats): Statistics updated with inflate and unfilter time
+        on_rows: Callback called with number of reconstructed rows and total
+            number of rows every PROGRESS_ROWS rows, exception raised by it
+            stops decoding (used for progress and cancellation)
+
+    Returns:
+        np.ndarray: Image samples (see unpack_samples), palette indices
+            for indexed color images
+    """
+    if ihdr.interlace_method != 0:
+        image = None
+        for pass_index, image in iter_adam7_passes(ihdr, chunks, on_pass is not None, stats, on_rows):
+            if on_pass is not None:
+                on_pass(pass_index, image)
+        return image
+
+    raw = np.empty((ihdr.height, ihdr.row_bytes()), dtype=np.uint8)
+    rows = _iter_reporting(iter_rows(ihdr, chunks, stats=stats), ihdr.height, on_rows)
+    for i, row in enumerate(rows):
+        raw[i] = row
+    return unpack_samples(raw, ihdr.width, ihdr.bit_depth, ihdr.channels)
+
+
+def to_grayscale(samples: np.ndarray, color_type: int, palette: np.ndarray = None, dtype=None) -> np.ndarray:
+    """Convert image samples to single channel luminance (alpha is dropped)
+
+    Args:
+        samples (np.ndarray): Image samples returned by decode_pixels
+        color_type (int): Color type from IHDR
+        palette (np.ndarray): Palette of shape (entries, 3) for indexed color images
+        dtype: Float type of result, samples of gray images are not converted
+            and luminance of color images is float64 by default
+
+    Returns:
+        np.ndarray: Gray image of shape (rows, width)
+    """
+    if color_type == 0 or color_type == 4:
+        gray = samples if color_type == 0 else samples[..., 0]
+        return gray if dtype is None else gray.astype(dtype)
+    if color_type == 3:
+        samples = expand_palette(samples, palette)
+
+    dtype = dtype or np.float64
+    red, green, blue = samples[..., 0], samples[..., 1], samples[..., 2]
+    gray = red.astype(dtype)
+    gray *= 0.299
+    gray += dtype(0.587) * green
+    gray += dtype(0.114) * blue
+    return gray
+
+
+def isgray(samples: np.ndarray, color_type: int, palette: np.ndarray = None) -> bool:
+    """Check that all pixels of samples have equal red, green and blue values
+
+    Args:
+        samples (np.ndarray): Image samples (or block of rows) returned by decode_pixels
+        color_type (int): Color type from IHDR
+        palette (np.ndarray): Palette of shape (entries, 3) for indexed color images
+    """
+    if color_type == 0 or color_type == 4:
+        return True
+    if color_type == 3:
+        samples = expand_palette(samples, palette)
+    red, green, blue = samples[..., 0], samples[..., 1], samples[..., 2]
+    return bool((red == green).all() and (red == blue).all())
+
+
+def expand_palette(indices: np.ndarray, table: np.ndarray) -> np.ndarray:
+    """Expand palette indices to colors
+
+    Args:
+        indices (np.ndarray): Palette indices returned by decode_pixels
+        table (np.ndarray): Lookup table of shape (256, channels) (see PngChunkPLTE.lookup_table)
+
+    Returns:
+        np.ndarray: uint8 array of shape indices.shape + (channels,)
+    """
+    return np.take(table, indices, axis=0)
+
+
+def to_display(samples: np.ndarray, color_type: int, bit_depth: int, palette: np.ndarray = None) -> np.ndarray:
+    """Convert image samples to 8 bit samples for display
+
+    Args:
+        samples (np.ndarray): Image samples returned by decode_pixels
+        color_type (int): Color type from IHDR
+        bit_depth (int): Bit depth from IHDR
+        palette (np.ndarray): Palette or lookup table of shape (entries, 3) or
+            (entries, 4) for indexed color images
+
+    Returns:
+        np.ndarray: uint8 array of shape (rows, width) for gray images,
+            (rows, width, 3) for RGB and indexed color images and
+            (rows, width, 4) for images with alpha channel
+    """
+    if color_type == 3:
+        return expand_palette(samples, palette)
+
+    if bit_depth == 16:
+        samples = (samples >> 8).astype(np.uint8)
+    elif bit_depth < 8:
+        samples = samples * np.uint8(255 // ((1 << bit_depth) - 1))
+
+    if color_type == 4:
+        gray, alpha = samples[..., 0], samples[..., 1]
+        return np.stack([gray, gray, gray, alpha], axis=-1)
+    return np.ascontiguousarray(samples)
@@ -0,0 +1,317 @@
+import argparse
+import contextlib
+import logging
+import os
+import struct
+import sys
+import tempfile
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pngDecoder
+from pngChunk import CHUNK_HEADER
+from pngFile import PngFile
+from rsaAlgorithm import AlgorithmRSA, PublicKey, PrivateKey, ECB_BATCH_BLOCKS
+from rsaAlgorithm import RANDOM_EXPONENT, STANDARD_EXPONENT
+
+# private ancillary chunk with encryption mode and ciphertext overflow
+# (ancillary, private, unsafe to copy, because it depends on image data)
+EXTRA_CHUNK = "exTD"
+# "compressed" encrypts IDAT data as stored, "decompressed" encrypts scanlines
+# (filter type bytes are kept) and compresses them again, so image stays decodable
+MODES = ("compressed", "decompressed")
+IDAT_SIZE = 1 << 16
+EXTRA_CHUNK_SIZE = 1 << 20
+# overflow kept in memory before it is spooled to temporary file
+SPOOL_SIZE = 1 << 20
+
+
+def write_chunk(output, chunk_type: str, data: bytes):
+    """Write chunk with calculated length and crc"""
+    type_bytes = chunk_type.encode()
+    output.write(CHUNK_HEADER.pack(len(data), type_bytes))
+    output.write(data)
+    output.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(type_bytes))))
+
+
+def copy_chunk(output, chunk):
+    """Stream chunk to output, crc is calculated again"""
+    type_bytes = chunk.type.encode()
+    output.write(CHUNK_HEADER.pack(chunk.chunk_length, type_bytes))
+    crc = zlib.crc32(type_bytes)
+    for block in chunk.iter_data():
+        output.write(block)
+        crc = zlib.crc32(block, crc)
+    output.write(struct.pack(">I", crc))
+
+
+class _ChunkDataReader(object):
+    """File like reader of concatenated data of chunks"""
+    def __init__(self, chunks: list) -> None:
+        self._blocks = (block for chunk in chunks for block in chunk.iter_data())
+        self._buffer = bytearray()
+
+    def read(self, size: int) -> bytes:
+        while len(self._buffer) < size:
+            block = next(self._blocks, None)
+            if block is None:
+                break
+            self._buffer += block
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+class _EcbStream(object):
+    """Encrypt or decrypt data fed in pieces of any size
+
+    Data is processed in pieces of whole blocks large enough to keep all
+    workers busy, overflow of ciphertext blocks is written to (or read from)
+    extra file in the same order.
+    """
+    def __init__(self, rsa: AlgorithmRSA, extra, workers: int = None, executor=None) -> None:
+        self._rsa = rsa
+        self._extra = extra
+        self._workers = workers
+        self._executor = executor
+        self._piece = rsa.plain_block_size * ECB_BATCH_BLOCKS * (workers or os.cpu_count() or 1)
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> bytes:
+        self._buffer += data
+        if len(self._buffer) < self._piece:
+            return b""
+        size = len(self._buffer) // self._piece * self._piece
+        processed = self._process(bytes(self._buffer[:size]))
+        del self._buffer[:size]
+        return processed
+
+    def finish(self) -> bytes:
+        processed = self._process(bytes(self._buffer))
+        self._buffer = bytearray()
+        return processed
+
+    def _process(self, data: bytes) -> bytes:
+        raise NotImplementedError()
+
+
+class _EncryptStream(_EcbStream):
+    def _process(self, data: bytes) -> bytes:
+        encrypted, extra = self._rsa.encrypt_ECB(data, self._workers, self._executor)
+        self._extra.write(extra)
+        return encrypted
+
+
+class _DecryptStream(_EcbStream):
+    def _process(self, data: bytes) -> bytes:
+        full_blocks, last_size = divmod(len(data), self._rsa.plain_block_size)
+        extra_size = full_blocks + (self._rsa.cipher_block_size - last_size if last_size else 0)
+        extra = self._extra.read(extra_size)
+        if len(extra) != extra_size:
+            raise RuntimeError(f"{EXTRA_CHUNK} data is truncated")
+        return self._rsa.decrypt_ECB(data, extra, self._workers, self._executor)
+
+
+def _transform_idat(output, chunks: list, stream: _EcbStream):
+    """Write IDAT chunks with transformed data of the same length as original chunks"""
+    lengths = deque()
+    buffer = bytearray()
+
+    def flush():
+        while lengths and len(buffer) >= lengths[0]:
+            length = lengths.popleft()
+            write_chunk(output, "IDAT", buffer[:length])
+            del buffer[:length]
+
+    for chunk in chunks:
+        if chunk.type != "IDAT":
+            continue
+        lengths.append(chunk.chunk_length)
+        for block in chunk.iter_data():
+            buffer += stream.feed(block)
+            flush()
+    buffer += stream.finish()
+    flush()
+
+
+def _transform_scanlines(output, ihdr, chunks: list, stream: _EcbStream, idat_size: int, level: int):
+    """Write IDAT chunks with transformed and compressed scanlines
+
+    Filter type bytes are not transformed, so data stays valid zlib stream of
+    valid scanlines.
+    """
+    compressor = zlib.compressobj(level)
+    rows = deque()
+    data = bytearray()
+    idat = bytearray()
+
+    def emit(processed: bytes):
+        data.extend(processed)
+        start = 0
+        while rows and len(data) - start >= rows[0][1]:
+            filter_type, length = rows.popleft()
+            idat.extend(compressor.compress(bytes((filter_type,))))
+            idat.extend(compressor.compress(data[start:start + length]))
+            start += length
+        del data[:start]
+        while len(idat) >= idat_size:
+            write_chunk(output, "IDAT", idat[:idat_size])
+            del idat[:idat_size]
+
+    for _, filter_type, row in pngDecoder.iter_pass_scanlines(ihdr, chunks):
+        rows.append((filter_type, len(row)))
+        emit(stream.feed(row))
+    emit(stream.finish())
+    idat.extend(compressor.flush())
+    for start in range(0, len(idat), idat_size):
+        write_chunk(output, "IDAT", idat[start:start + idat_size])
+
+
+def _executor(workers: int):
+    if workers == 1:
+        return contextlib.nullcontext()
+    # worker processes are started only when data has more than one batch
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+def encrypt_png(input_path: str, output_path: str, rsa: AlgorithmRSA, mode: str = "compressed",
+                workers: int = None, idat_size: int = IDAT_SIZE, level: int = zlib.Z_DEFAULT_COMPRESSION):
+    """Encrypt image data of png file
+
+    File is streamed chunk by chunk, other chunks are copied. Encrypted IDAT
+    chunks are followed by exTD chunks with encryption mode and ciphertext
+    overflow, all lengths and crcs are calculated again.
+
+    Args:
+        input_path (str): Png file to encrypt
+        output_path (str): Encrypted png file
+        rsa (AlgorithmRSA): Algorithm with public key
+        mode (str): "compressed" encrypts IDAT data (image can not be decoded,
+            decrypted file is identical), "decompressed" encrypts scanlines
+            (image is decodable noise, decrypted image data is identical)
+        workers (int): Number of encryption processes
+        idat_size (int): Size of IDAT chunks written in "decompressed" mode
+        level (int): Compression level of "decompressed" mode
+    """
+    if mode not in MODES:
+        raise ValueError(f"Invalid encryption mode {mode}")
+
+    with contextlib.ExitStack() as stack:
+        png_file = stack.enter_context(PngFile(input_path, lazy=True, pixel_cache=False))
+        output = stack.enter_context(open(output_path, "wb"))
+        extra = stack.enter_context(tempfile.SpooledTemporaryFile(SPOOL_SIZE))
+        executor = stack.enter_context(_executor(workers))
+
+        if png_file.get_chunk(EXTRA_CHUNK) is not None:
+            raise RuntimeError(f"File {input_path} is already encrypted")
+        extra.write(bytes((MODES.index(mode),)))
+        stream = _EncryptStream(rsa, extra, workers, executor)
+
+        output.write(PngFile.HEADER)
+        image_written = False
+        for chunk in png_file.chunks:
+            if chunk.type != "IDAT":
+                copy_chunk(output, chunk)
+                continue
+            if image_written:
+                continue
+            # all IDAT chunks are written in place of the first one
+            if mode == "compressed":
+                _transform_idat(output, png_file.chunks, stream)
+            else:
+                _transform_scanlines(output, png_file.ihdr, png_file.chunks, stream, idat_size, level)
+
+            extra.seek(0)
+            for data in iter(lambda: extra.read(EXTRA_CHUNK_SIZE), b""):
+                write_chunk(output, EXTRA_CHUNK, data)
+            image_written = True
+
+
+def decrypt_png(input_path: str, output_path: str, rsa: AlgorithmRSA, workers: int = None,
+                idat_size: int = IDAT_SIZE, level: int = zlib.Z_DEFAULT_COMPRESSION):
+    """Decrypt png file encrypted by encrypt_png
+
+    Args:
+        input_path (str): Encrypted png file
+        output_path (str): Decrypted png file
+        rsa (AlgorithmRSA): Algorithm with private key
+        workers (int): Number of decryption processes
+        idat_size (int): Size of IDAT chunks written in "decompressed" mode
+        level (int): Compression level of "decompressed" mode
+    """
+    with contextlib.ExitStack() as stack:
+        png_file = stack.enter_context(PngFile(input_path, lazy=True, pixel_cache=False))
+        output = stack.enter_context(open(output_path, "wb"))
+        executor = stack.enter_context(_executor(workers))
+
+        extra_chunks = [chunk for chunk in png_file.chunks if chunk.type == EXTRA_CHUNK]
+        if not extra_chunks:
+            raise RuntimeError(f"File {input_path} is not encrypted")
+        extra = _ChunkDataReader(extra_chunks)
+        mode_index = extra.read(1)[0]
+        if mode_index >= len(MODES):
+            raise RuntimeError(f"Invalid encryption mode {mode_index}")
+        mode = MODES[mode_index]
+        stream = _DecryptStream(rsa, extra, workers, executor)
+
+        output.write(PngFile.HEADER)
+        image_written = False
+        for chunk in png_file.chunks:
+            if chunk.type == EXTRA_CHUNK or (chunk.type == "IDAT" and image_written):
+                continue
+            if chunk.type != "IDAT":
+                copy_chunk(output, chunk)
+                continue
+            if mode == "compressed":
+                _transform_idat(output, png_file.chunks, stream)
+            else:
+                _transform_scanlines(output, png_file.ihdr, png_file.chunks, stream, idat_size, level)
+            image_written = True
+
+        if extra.read(1):
+            logging.warning("%s has more data than encrypted image", EXTRA_CHUNK)
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Encrypt image data of png files with rsa")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    keygen = commands.add_parser("keygen", help="generate key pair (PREFIX.pub and PREFIX.key)")
+    keygen.add_argument("prefix")
+    keygen.add_argument("--key-size", type=int, default=2048)
+    keygen.add_argument("--random-exponent", action="store_true",
+                        help=f"random public exponent instead of {STANDARD_EXPONENT}")
+
+    encrypt = commands.add_parser("encrypt", help="encrypt png file")
+    encrypt.add_argument("input")
+    encrypt.add_argument("output")
+    encrypt.add_argument("--key", required=True, help="public key file")
+    encrypt.add_argument("--mode", choices=MODES, default="compressed")
+
+    decrypt = commands.add_parser("decrypt", help="decrypt png file")
+    decrypt.add_argument("input")
+    decrypt.add_argument("output")
+    decrypt.add_argument("--key", required=True, help="private key file")
+
+    for command in (encrypt, decrypt):
+        command.add_argument("-j", "--workers", type=int, default=None, help="number of processes")
+    args = parser.parse_args(argv)
+
+    if args.command == "keygen":
+        rsa = AlgorithmRSA(args.key_size, RANDOM_EXPONENT if args.random_exponent else STANDARD_EXPONENT)
+        rsa.public_key.save(f"{args.prefix}.pub")
+        rsa.private_key.save(f"{args.prefix}.key")
+    elif args.command == "encrypt":
+        rsa = AlgorithmRSA.from_keys(PublicKey.load(args.key))
+        encrypt_png(args.input, args.output, rsa, args.mode, args.workers)
+    else:
+        rsa = AlgorithmRSA.from_keys(private_key=PrivateKey.load(args.key))
+        decrypt_png(args.input, args.output, rsa, args.workers)
+    logging.info("%s done", args.command)
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
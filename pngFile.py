@@ -1,20 +1,97 @@
 import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import cv2
 import matplotlib.pyplot as plt;
-from pngChunk import PngChunk
+from pngChunk import PngChunk, VERIFY_MODES
+from pngReader import FileReader, MappedReader
+from pngStats import PngStats
+import pixelCache
+import pngDecoder
+import pngSpectrum
+import fftBackend
+
+ChunkIndexEntry = namedtuple("ChunkIndexEntry", ["offset", "length", "type", "crc"])
+
+# thread pools of crc verification shared by all files, by number of workers
+_crc_executors = {}
+_crc_executors_lock = threading.Lock()
+
+
+def _crc_executor(workers: int) -> ThreadPoolExecutor:
+    with _crc_executors_lock:
+        executor = _crc_executors.get(workers)
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="crc")
+            _crc_executors[workers] = executor
+    return executor
+
 
 class PngFile(object):
     HEADER = b'\x89PNG\r\n\x1a\n'
-    def __init__(self, file_path) -> None:
+    # minimal size of chunk data for which crc is verified on thread pool
+    PARALLEL_CRC_MIN_BYTES = 16 * 1024 * 1024
+    # bytes of decoded rows checked at once by isgray
+    ISGRAY_BLOCK_BYTES = 64 * 1024
+
+    def __init__(self, file_path, use_mmap: bool = False, lazy: bool = False,
+                 verify: str = "lenient", crc_workers: int = None, stats=False,
+                 pixel_cache=None) -> None:
+        """Open png file and load its chunks
+
+        Args:
+            file_path: Path to png file
+            use_mmap (bool): Map file into memory, chunk data becomes memoryview
+                slices of the mapping instead of copies
+            lazy (bool): Scan only chunk headers, chunk data is loaded
+                on first access of byte_data or data
+            verify (str): Crc verification, "strict" raises ChunkCrcError on first
+                invalid chunk, "lenient" logs a warning, "off" skips verification.
+                In lazy mode chunk is verified when its data is loaded.
+            crc_workers (int): Number of threads used for crc verification
+            stats (bool | PngStats): Collect counters and timers of processing
+                stages in stats (PngStats instance can be shared between files
+                or configured with profiling hooks)
+            pixel_cache (PixelCache): Cache of decoded images shared between PngFile
+                objects, process wide cache by default (if enabled), False disables it
+        """
+        if verify not in VERIFY_MODES:
+            raise ValueError(f"Invalid verify mode {verify}, expected one of {VERIFY_MODES}")
+
         self.path_to_file = file_path
-        self.file = open(file_path, "br")
+        self._lazy = lazy
+        self._verify = verify
+        self._crc_workers = crc_workers
+        if stats is True:
+            stats = PngStats()
+        self._stats = stats or None
+        if pixel_cache is None:
+            pixel_cache = pixelCache.shared_cache()
+        self._pixel_cache = pixel_cache or None
+        self._pixels = None
+        self._fft_backend = None
+        file = open(file_path, "br")
+        if use_mmap:
+            self.file = MappedReader(file, verify, self._stats)
+        else:
+            self.file = FileReader(file, verify, self._stats)
         self._chunks = []
 
-        self.__check_header()
-        self.__load_chunks()
-        # self._decode_picture()
-        # self.get_fft()
+        try:
+            self.__check_header()
+            if self._stats is None:
+                self.__load_chunks()
+            else:
+                with self._stats.timer("load"):
+                    self.__load_chunks()
+                self._stats.add("chunks_loaded", len(self._chunks))
+        except BaseException:
+            # e.g. ChunkCrcError in strict mode, file is not returned to caller
+            self.close()
+            raise
 
     def _check_color(self):
         res = next((chunk for chunk in self.chunks if chunk.type == "IHDR"), None)
@@ -23,67 +100,495 @@ class PngFile(object):
         else:
             raise RuntimeError("IHDR chunk not found")
 
-    def _decode_picture(self, data_dict: dict):
-        color = self._check_color()
-        for chunk in self.chunks:
-            if chunk.type == "IDAT":
-                chunk.decode(color, dict)
-            if chunk.type == "bKGD":
-                chunk.decode(color, dict)
+    def scanlines(self):
+        """Iterate over filtered scanlines decompressed from IDAT chunks
 
+        Scanlines of interlaced image are yielded pass after pass, every one
+        as wide as its Adam7 pass.
+
+        Yields:
+            tuple: Filter type and filtered row data
+        """
+        yield from pngDecoder.iter_scanlines(self.ihdr, self._chunks, stats=self._stats)
 
     def __check_header(self):
         header = self.file.read(8)
         logging.debug("Header: %s",header)
 
         if header != self.HEADER:
-            raise RuntimeError(f"Invalid header {header}")
+            raise RuntimeError(f"Invalid header {bytes(header)}")
 
         return header
 
     def __load_chunks(self):
-        self._chunks.append(PngChunk(self.file))
+        self._chunks.append(PngChunk.read(self.file, self._lazy))
         while self._chunks[-1].type != "IEND":
-            self._chunks.append(PngChunk(self.file))
+            self._chunks.append(PngChunk.read(self.file, self._lazy))
+
+        if self._lazy is False:
+            self.verify_crc(self._verify)
+            for chunk in self._chunks:
+                chunk._parse()
+
+    def verify_crc(self, mode: str = "strict") -> list:
+        """Verify crc of all chunks
+
+        Crc of files with more than PARALLEL_CRC_MIN_BYTES of chunk data is
+        calculated on shared thread pool (zlib releases GIL while calculating
+        crc of large buffers), smaller files are verified in calling thread.
+
+        Args:
+            mode (str): "strict" raises ChunkCrcError on first invalid chunk,
+                "lenient" logs a warning, "off" skips verification
+
+        Returns:
+            list: Chunks with invalid crc
+        """
+        if mode == "off":
+            return []
+
+        start = time.perf_counter()
+        workers = self._crc_workers or os.cpu_count() or 1
+        data_size = sum(chunk.chunk_length for chunk in self._chunks)
+        if workers > 1 and len(self._chunks) > 1 and data_size >= self.PARALLEL_CRC_MIN_BYTES:
+            crcs = _crc_executor(workers).map(PngChunk.calculate_crc, self._chunks)
+        else:
+            crcs = map(PngChunk.calculate_crc, self._chunks)
+
+        try:
+            for chunk, crc in zip(self._chunks, crcs):
+                chunk.check_crc(mode, crc)
+        finally:
+            if self._stats is not None:
+                self._stats.add_time("crc", time.perf_counter() - start)
+        return self.corrupted_chunks
+
+    def close(self):
+        for chunk in self._chunks:
+            chunk.release()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def pixels(self, on_pass=None, expand_palette: bool = False, on_rows=None) -> np.ndarray:
+        """Decode image samples
+
+        Image is decoded once, later calls (and other PngFile objects of the same
+        file when pixel cache is used) return the same read only array.
+
+        Indexed color images are kept in compact form of palette indices (3 - 4
+        times smaller than RGB or RGBA), expand_palette converts them with single
+        lookup in palette_table, expanded image is not cached.
+
+        Args:
+            on_pass: Callback called with pass index and progressively refined
+                image after every Adam7 pass of interlaced image (only when
+                image is decoded)
+            expand_palette (bool): Return RGB (RGBA with tRNS) colors of indexed
+                color image instead of palette indices
+            on_rows: Callback called with number of reconstructed rows and total
+                number of rows during decoding (see pngDecoder.decode_pixels)
+
+        Returns:
+            np.ndarray: Array of shape (height, width) for gray and indexed color
+                images or (height, width, channels), uint8 for bit depth up to 8
+                and uint16 for bit depth 16. Indexed color images contain palette
+                indices unless expanded.
+        """
+        pixels = self._decode_pixels(on_pass, on_rows)
+        if expand_palette and self.ihdr.color_type == 3:
+            return pngDecoder.expand_palette(pixels, self.palette_table())
+        return pixels
+
+    def _decode_pixels(self, on_pass=None, on_rows=None) -> np.ndarray:
+        if self._pixels is not None:
+            return self._pixels
+
+        key = None
+        if self._pixel_cache is not None:
+            key = self._pixel_cache.key(self.path_to_file)
+            self._pixels = self._pixel_cache.get(key)
+            if self._pixels is not None:
+                return self._pixels
+
+        pixels = pngDecoder.decode_pixels(self.ihdr, self._chunks, on_pass, self._stats, on_rows)
+        pixels.setflags(write=False)
+        if self._pixel_cache is not None:
+            self._pixel_cache.put(key, pixels)
+        self._pixels = pixels
+        return pixels
+
+    def display_pixels(self) -> np.ndarray:
+        """Decoded image converted to 8 bit gray, RGB or RGBA for display"""
+        ihdr = self.ihdr
+        return pngDecoder.to_display(self.pixels(), ihdr.color_type, ihdr.bit_depth, self.palette_table())
+
+    def passes(self, preview: bool = True):
+        """Decode interlaced image pass by pass
+
+        Yields:
+            tuple: Pass index and progressively refined image
+        """
+        ihdr = self.ihdr
+        if ihdr.interlace_method == 0 or self._pixels is not None:
+            yield 6, self.pixels()
+            return
+        yield from pngDecoder.iter_adam7_passes(ihdr, self._chunks, preview, self._stats)
+
+    def palette(self) -> np.ndarray:
+        """Palette from PLTE chunk as array of shape (entries, 3)"""
+        plte = self.get_chunk("PLTE")
+        if plte is None:
+            return None
+        return plte.get_entries()
+
+    def palette_table(self, alpha: bool = True) -> np.ndarray:
+        """Lookup table of all 256 palette indices (see PngChunkPLTE.lookup_table)
+
+        Args:
+            alpha (bool): Add alpha from tRNS chunk (when file has one)
+
+        Returns:
+            np.ndarray: Table of shape (256, 3) or (256, 4), None without PLTE
+        """
+        plte = self.get_chunk("PLTE")
+        if plte is None:
+            return None
+        return plte.lookup_table(self.get_chunk("tRNS") if alpha else None)
+
+    def grayscale(self, dtype=None) -> np.ndarray:
+        """Decode image as single channel luminance
+
+        Args:
+            dtype: Float type of result, samples are not converted by default
+                (luminance of color images is float64)
+        """
+        return pngDecoder.to_grayscale(self.pixels(), self._check_color(), self.palette_table(False), dtype)
+
+    def isgray(self) -> bool:
+        """Check that image has no color
+
+        Answer is taken from IHDR color type or from PLTE when all palette entries
+        are gray. Otherwise pixels are scanned in row blocks (decoded rows are
+        streamed when image is not decoded yet) and scan stops at the first block
+        with color.
+        """
+        color_type = self._check_color()
+        if color_type == 0 or color_type == 4:
+            return True
+
+        colored_entries = None
+        if color_type == 3:
+            palette = self.palette()
+            colored_entries = (palette[:, 0] != palette[:, 1]) | (palette[:, 0] != palette[:, 2])
+            if not colored_entries.any():
+                return True
 
-    def isgray(self):
-        img = cv2.imread(self.path_to_file)
-        if len(img.shape) < 3: return True
-        if img.shape[2]  == 1: return True
-        b,g,r = img[:,:,0], img[:,:,1], img[:,:,2]
-        if (b==g).all() and (b==r).all(): return True
-        return False
+        for block in self._iter_sample_blocks():
+            if colored_entries is not None:
+                # indices outside of palette are not colored
+                used = block[block < len(colored_entries)]
+                if colored_entries[used].any():
+                    return False
+            elif not pngDecoder.isgray(block, color_type):
+                return False
+        return True
 
+    def _iter_sample_blocks(self, block_bytes: int = None):
+        """Iterate over blocks of sample rows of decoded or streamed image"""
+        block_bytes = block_bytes or self.ISGRAY_BLOCK_BYTES
+        pixels = self._pixels
+        if pixels is None and self._pixel_cache is not None:
+            pixels = self._pixel_cache.get(self._pixel_cache.key(self.path_to_file))
+        if pixels is None:
+            for row in self._iter_sample_rows():
+                yield row
+            return
 
+        row_bytes = pixels[0].nbytes
+        block_rows = max(1, block_bytes // max(1, row_bytes))
+        for start in range(0, len(pixels), block_rows):
+            yield pixels[start:start + block_rows]
 
-    def get_fft(self):
-        fft_log = True
-        if self.isgray():
-            fft_log = False
 
-        # image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        image = cv2.imread(self.path_to_file, 0)
-        fft = np.fft.fft2(image)
-        fft_shifted = np.fft.fftshift(fft)
 
-        if fft_log:
-            fft_mag = np.ma.log10(abs(fft_shifted.transpose()))
+    def histogram(self) -> np.ndarray:
+        """Count sample values of every channel
+
+        Decoded pixels are used when available, otherwise rows are streamed from
+        IDAT chunks, so image is not held in memory.
+
+        Returns:
+            np.ndarray: Counts of shape (channels, 2 ** bit depth), channels are
+                samples of pixel (see channel_names), indexed color images have
+                single channel of palette indices
+        """
+        ihdr = self.ihdr
+        channels = ihdr.channels
+        values = 1 << ihdr.bit_depth
+        counts = np.zeros((channels, values), dtype=np.int64)
+
+        start = time.perf_counter()
+        for block in self._iter_sample_blocks():
+            if channels == 1:
+                counts[0] += np.bincount(block.ravel(), minlength=values)
+                continue
+            for channel in range(channels):
+                counts[channel] += np.bincount(block[..., channel].ravel(), minlength=values)
+        if self._stats is not None:
+            self._stats.add_time("histogram", time.perf_counter() - start)
+        return counts
+
+    def check_histogram(self, tolerance: float = 0.01) -> bool:
+        """Compare hIST chunk with palette index histogram of image
+
+        Stored frequencies are approximate (scaled to 16 bits), so relative
+        frequencies are compared. hIST of truecolor images refers to suggested
+        palette, not to image samples, so it is not checked.
+
+        Args:
+            tolerance (float): Allowed difference of relative frequency of any entry
+
+        Returns:
+            bool: True when hIST matches image, None when file has no hIST chunk
+                or image is not indexed color
+        """
+        hist = self.get_chunk("hIST")
+        if hist is None or self._check_color() != 3:
+            return None
+        stored = hist.get_histogram()
+        palette = self.palette()
+        if palette is None or len(stored) != len(palette):
+            logging.warning("hIST has %d entries, palette has %s", len(stored),
+                            None if palette is None else len(palette))
+            return False
+
+        counts = self.histogram()[0]
+        if counts[len(palette):].any():
+            logging.warning("Image uses indices outside of palette")
+            return False
+        counts = counts[:len(palette)]
+
+        # entries of unused colors must be zero and of used colors nonzero
+        matching = np.array_equal(stored == 0, counts == 0)
+        if matching and stored.any():
+            difference = np.abs(stored / stored.sum() - counts / counts.sum())
+            matching = bool(difference.max() <= tolerance)
+        if not matching:
+            logging.warning("hIST does not match image histogram")
+        return matching
+
+    def channel_names(self) -> tuple:
+        """Names of channels returned by channel_stack"""
+        color_type = self._check_color()
+        if color_type == 0:
+            return ("Gray",)
+        if color_type == 4:
+            return ("Gray", "Alpha")
+        if color_type == 6:
+            return ("Red", "Green", "Blue", "Alpha")
+        if color_type == 3 and self.get_chunk("tRNS") is not None:
+            return ("Red", "Green", "Blue", "Alpha")
+        return ("Red", "Green", "Blue")
+
+    def channel_stack(self, dtype=np.float64) -> np.ndarray:
+        """Image channels as contiguous array of shape (channels, height, width)
+
+        Indexed color images are expanded with palette (and tRNS alpha).
+        """
+        samples = self.pixels()
+        if self._check_color() == 3:
+            samples = pngDecoder.expand_palette(samples, self.palette_table())
+        if samples.ndim == 2:
+            return samples[np.newaxis].astype(dtype)
+        return np.ascontiguousarray(np.moveaxis(samples, -1, 0), dtype=dtype)
+
+    def get_fft(self, mode: str = "full", dtype=None, mirror: bool = True, channels: bool = False,
+                backend: str = None, workers: int = None, on_stage=None):
+        """Compute spectrum of grayscale image
+
+        Args:
+            mode (str): "full" computes complex fft2, "half" computes real input
+                fft (rfft2) of half spectrum only
+            dtype: Float type of computation, float64 in "full" and float32 in
+                "half" mode by default
+            mirror (bool): In "half" mode build full shifted spectrum for display,
+                otherwise half spectrum of shape (height, width // 2 + 1) is returned
+            channels (bool): Compute spectrum of every channel (see channel_names)
+                instead of grayscale image, all channels are transformed in single
+                batched call and results have leading channel axis
+            backend (str): Fft backend name (see fftBackend), default backend when None
+            workers (int): Number of fft threads
+            on_stage: Callback called with name of next stage, "fft" after image
+                is decoded and converted and "mirror" after "half" mode transform,
+                exception raised by it stops computation
+
+        Returns:
+            tuple: Magnitude (log10 for color images) and phase
+        """
+        if mode == "full":
+            dtype = dtype or np.float64
+        elif mode == "half":
+            dtype = dtype or np.float32
+        else:
+            raise ValueError(f"Invalid fft mode {mode}")
+
+        # image is decoded first, so isgray scans decoded pixels instead of
+        # streaming and unfiltering rows again
+        if channels:
+            image = self.channel_stack(dtype)
         else:
-            fft_mag = abs(fft_shifted.transpose())
+            image = self.grayscale(dtype)
+        fft_log = not self.isgray()
+        if on_stage is not None:
+            on_stage("fft")
+
+        fft_backend = fftBackend.get_backend(backend, workers)
+        self._fft_backend = fft_backend.description
+        start = time.perf_counter()
+        fft_mag, fft_phase = self._spectrum(image, mode, dtype, mirror, fft_log, fft_backend, on_stage)
+        if self._stats is not None:
+            self._stats.add_time("fft", time.perf_counter() - start)
+        return (fft_mag, fft_phase)
+
+    def get_fft_out_of_core(self, memory_budget: int = 256 * 1024 * 1024, preview_size: int = 512,
+                            path: str = None, dtype=np.float32, backend: str = None,
+                            workers: int = None) -> tuple:
+        """Compute spectrum of grayscale image larger than memory
+
+        Rows of non interlaced images are decoded and transformed block by block,
+        so decoded image is never held in memory. Spectrum is stored in memory
+        mapped file and only downsampled preview is returned for display.
 
+        Args:
+            memory_budget (int): Approximate peak memory of fft blocks in bytes
+            preview_size (int): Maximal size of preview
+            path (str): Spectrum file (.npy format), by default temporary file which
+                is removed when returned spectrum is released
+            dtype: Float type of computation
+            backend (str): Fft backend name (see fftBackend), default backend when None
+            workers (int): Number of fft threads
 
-        fft_phase = np.angle(fft_shifted.transpose())
+        Returns:
+            tuple: Preview magnitude (log10 for color images) and phase and memory
+                mapped half spectrum of shape (height, width // 2 + 1)
+        """
+        ihdr = self.ihdr
+        color_type = ihdr.color_type
+        palette = self.palette_table(False)
+        gray = [True]
 
+        def rows():
+            for samples in self._iter_sample_rows():
+                if gray[0] and not pngDecoder.isgray(samples, color_type, palette):
+                    gray[0] = False
+                yield pngDecoder.to_grayscale(samples, color_type, palette, dtype)
+
+        fft_backend = fftBackend.get_backend(backend, workers)
+        self._fft_backend = fft_backend.description
+        start = time.perf_counter()
+        spectrum = pngSpectrum.out_of_core_spectrum(rows(), ihdr.height, ihdr.width,
+                                                    memory_budget, path, dtype, fft_backend)
+        fft_mag, fft_phase = pngSpectrum.spectrum_preview(spectrum, ihdr.width, preview_size, not gray[0])
+        if self._stats is not None:
+            self._stats.add_time("fft", time.perf_counter() - start)
+        return (fft_mag, fft_phase, spectrum)
+
+    def _iter_sample_rows(self):
+        """Iterate over rows of samples, non interlaced images are streamed"""
+        ihdr = self.ihdr
+        if ihdr.interlace_method != 0 or self._pixels is not None:
+            yield from self.pixels()
+            return
+        for row in pngDecoder.iter_rows(ihdr, self._chunks, stats=self._stats):
+            yield pngDecoder.unpack_samples(row[np.newaxis], ihdr.width, ihdr.bit_depth, ihdr.channels)[0]
+
+    @staticmethod
+    def _spectrum(image: np.ndarray, mode: str, dtype, mirror: bool, log: bool, backend, on_stage=None) -> tuple:
+        if mode == "full":
+            return pngSpectrum.full_spectrum(image, log, backend)
+
+        fft_mag, fft_phase = pngSpectrum.half_spectrum(image, dtype, log, backend)
+        if mirror:
+            if on_stage is not None:
+                on_stage("mirror")
+            fft_mag, fft_phase = pngSpectrum.mirror_half_spectrum(fft_mag, fft_phase, image.shape[-1])
         return (fft_mag, fft_phase)
 
+    @staticmethod
+    def batch_fft(png_files: list, mode: str = "half", dtype=None, mirror: bool = False,
+                  log: bool = False, backend: str = None, workers: int = None) -> tuple:
+        """Compute spectra of grayscale images of the same size in single call
+
+        Args:
+            png_files (list): PngFile objects with images of the same size
+            mode (str): "full" or "half" (see get_fft)
+            dtype: Float type of computation, float64 in "full" and float32 in
+                "half" mode by default
+            mirror (bool): In "half" mode build full shifted spectra
+            log (bool): Return log10 of magnitude
+            backend (str): Fft backend name (see fftBackend), default backend when None
+            workers (int): Number of fft threads
+
+        Returns:
+            tuple: Magnitude and phase with leading image axis
+        """
+        if mode not in ("full", "half"):
+            raise ValueError(f"Invalid fft mode {mode}")
+        dtype = dtype or (np.float64 if mode == "full" else np.float32)
+        if not png_files:
+            raise ValueError("No images to transform")
+
+        shape = (png_files[0].ihdr.height, png_files[0].ihdr.width)
+        images = np.empty((len(png_files),) + shape, dtype=dtype)
+        for i, png_file in enumerate(png_files):
+            image = png_file.grayscale()
+            if image.shape != shape:
+                raise ValueError(f"Image {png_file.path_to_file} has size {image.shape}, expected {shape}")
+            images[i] = image
+
+        return PngFile._spectrum(images, mode, dtype, mirror, log, fftBackend.get_backend(backend, workers))
+
     def get_chunk(self, name: str):
         res = next((chunk for chunk in self._chunks if chunk.type == name), None)
         return res
 
+    @property
+    def fft_backend(self) -> str:
+        """Description of fft backend used by last spectrum computation, None before first one"""
+        return self._fft_backend
+
+    @property
+    def stats(self) -> PngStats:
+        """Processing statistics, None when disabled"""
+        return self._stats
+
+    @property
+    def ihdr(self):
+        ihdr = self.get_chunk("IHDR")
+        if ihdr is None:
+            raise RuntimeError("IHDR chunk not found")
+        return ihdr
+
     @property
     def chunks(self):
         return self._chunks
 
+    @property
+    def corrupted_chunks(self) -> list:
+        """Chunks which failed crc verification"""
+        return [chunk for chunk in self._chunks if chunk.crc_valid is False]
+
+    @property
+    def index(self) -> list:
+        """Chunk index with data offset, length, type and stored crc of every chunk"""
+        return [ChunkIndexEntry(chunk.offset, chunk.chunk_length, chunk.type, chunk.crc)
+                for chunk in self._chunks]
+
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG)
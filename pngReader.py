@@ -0,0 +1,90 @@
+import io
+import mmap
+import threading
+
+
+class FileReader(object):
+    """Sequential reader over a regular file object
+
+    Attributes:
+        verify (str): Crc verification mode of chunks loaded from this reader
+        stats (PngStats): Statistics updated with number of read bytes, None if disabled
+    """
+    def __init__(self, file: io.BufferedReader, verify: str = "lenient", stats=None) -> None:
+        self._file = file
+        self._lock = threading.Lock()
+        self.verify = verify
+        self.stats = stats
+
+    def read(self, size: int) -> bytes:
+        data = self._file.read(size)
+        if self.stats is not None:
+            self.stats.add("bytes_read", len(data))
+        return data
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def read_at(self, offset: int, size: int) -> bytes:
+        """Read data at given offset without moving current position (thread safe)"""
+        with self._lock:
+            position = self._file.tell()
+            self._file.seek(offset)
+            data = self._file.read(size)
+            self._file.seek(position)
+        if self.stats is not None:
+            self.stats.add("bytes_read", len(data))
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+class MappedReader(FileReader):
+    """Sequential reader over a memory mapped file
+
+    Every read returns a memoryview slice of the mapping, so no data is copied
+    until the caller converts it to bytes.
+    """
+    def __init__(self, file: io.BufferedReader, verify: str = "lenient", stats=None) -> None:
+        super().__init__(file, verify, stats)
+        self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        self._position = 0
+
+    def read(self, size: int) -> memoryview:
+        start = self._position
+        self._position = min(start + size, len(self._view))
+        if self.stats is not None:
+            self.stats.add("bytes_read", self._position - start)
+        return self._view[start:self._position]
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(0, min(offset, len(self._view)))
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def read_at(self, offset: int, size: int) -> memoryview:
+        data = self._view[offset:offset + size]
+        if self.stats is not None:
+            self.stats.add("bytes_read", len(data))
+        return data
+
+    def close(self):
+        """Close mapping and file
+
+        Raises:
+            BufferError: Some memoryview slices of the mapping are still in use
+        """
+        self._view.release()
+        self._mmap.close()
+        super().close()
@@ -0,0 +1,171 @@
+import argparse
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from pngFile import PngFile
+
+
+def iter_png_paths(paths: list):
+    """Iterate over png files in given files and directories (recursively)"""
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(".png"):
+                    yield os.path.join(root, name)
+
+
+def _decode_text(value: bytes) -> str:
+    return value.decode("latin-1")
+
+
+def scan_file(path: str, verify: str = "off") -> dict:
+    """Read metadata of single png file
+
+    Only chunk headers and metadata chunks are read, image data is skipped.
+
+    Returns:
+        dict: Json serializable record
+    """
+    record = {"path": path}
+    try:
+        record["size"] = os.path.getsize(path)
+        with PngFile(path, lazy=True, verify=verify) as png_file:
+            record["ihdr"] = png_file.ihdr.data
+            record["chunks"] = [{"type": entry.type, "length": entry.length}
+                                for entry in png_file.index]
+
+            text = []
+            for chunk in png_file.chunks:
+                if chunk.type == "tEXt":
+                    text.append({"keyword": _decode_text(chunk.data["Keyword"]),
+                                 "text": _decode_text(chunk.data["Text string"])})
+                elif chunk.type == "tIME":
+                    record["time"] = chunk.data
+                elif chunk.type == "pHYs":
+                    record["phys"] = chunk.data
+            if text:
+                record["text"] = text
+
+            corrupted = png_file.corrupted_chunks
+            if corrupted:
+                record["corrupted_chunks"] = [chunk.type for chunk in corrupted]
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    return record
+
+
+def scan_files(paths: list, verify: str = "off") -> list:
+    """Scan batch of files (single task of process pool)"""
+    return [scan_file(path, verify) for path in paths]
+
+
+def _iter_batches(paths, batch_size: int):
+    batch = []
+    for path in paths:
+        batch.append(path)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _load_checkpoint(path: str) -> set:
+    if path is None or not os.path.isfile(path):
+        return set()
+    with open(path, encoding="utf-8") as file:
+        return set(line.rstrip("\n") for line in file)
+
+
+def scan(paths: list, output=sys.stdout, workers: int = None, batch_size: int = 16,
+         max_in_flight: int = None, checkpoint: str = None, verify: str = "off") -> int:
+    """Scan png files on process pool and write NDJSON records
+
+    At most max_in_flight batches are submitted at once, so memory usage does
+    not depend on number of files.
+
+    Args:
+        paths (list): Files and directories to scan
+        output: Text stream for NDJSON records
+        workers (int): Number of worker processes
+        batch_size (int): Number of files scanned by single task
+        max_in_flight (int): Maximal number of submitted tasks, 4 per worker by default
+        checkpoint (str): File with paths of already scanned files, scanned files are
+            appended to it and skipped when scan is resumed
+        verify (str): Crc verification mode of loaded chunks
+
+    Returns:
+        int: Number of scanned files
+    """
+    workers = workers or os.cpu_count()
+    max_in_flight = max_in_flight or workers * 4
+    done = _load_checkpoint(checkpoint)
+    if done:
+        logging.info("Resuming scan, skipping %d files", len(done))
+
+    checkpoint_file = open(checkpoint, "a", encoding="utf-8") if checkpoint else None
+    pending_paths = (path for path in iter_png_paths(paths) if path not in done)
+    batches = _iter_batches(pending_paths, batch_size)
+    scanned = 0
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            in_flight = set()
+            for batch in batches:
+                in_flight.add(executor.submit(scan_files, batch, verify))
+                if len(in_flight) < max_in_flight:
+                    continue
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                scanned += _write_records(finished, output, checkpoint_file)
+
+            while in_flight:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                scanned += _write_records(finished, output, checkpoint_file)
+    finally:
+        if checkpoint_file is not None:
+            checkpoint_file.close()
+
+    return scanned
+
+
+def _write_records(futures, output, checkpoint_file) -> int:
+    count = 0
+    for future in futures:
+        records = future.result()
+        for record in records:
+            output.write(json.dumps(record) + "\n")
+        output.flush()
+        if checkpoint_file is not None:
+            checkpoint_file.writelines(record["path"] + "\n" for record in records)
+            checkpoint_file.flush()
+        count += len(records)
+    return count
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Write metadata of png files as NDJSON records")
+    parser.add_argument("paths", nargs="+", help="png files and directories")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--batch-size", type=int, default=16, help="files scanned by single task")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="maximal number of submitted tasks")
+    parser.add_argument("--checkpoint", default=None, help="file with scanned paths used to resume scan")
+    parser.add_argument("--verify", choices=["strict", "lenient", "off"], default="off",
+                        help="crc verification of loaded chunks")
+    args = parser.parse_args(argv)
+
+    scanned = scan(args.paths, sys.stdout, args.workers, args.batch_size,
+                   args.max_in_flight, args.checkpoint, args.verify)
+    logging.info("Scanned %d files", scanned)
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,198 @@
+import os
+import tempfile
+
+import numpy as np
+
+import fftBackend
+
+
+def full_spectrum(image: np.ndarray, log: bool = False, backend=None) -> tuple:
+    """Complex fft of image
+
+    Args:
+        image (np.ndarray): Gray image or stack of images (fft is computed over
+            last two axes in single call)
+        log (bool): Return log10 of magnitude
+        backend: Fft backend (see fftBackend), default backend when None
+
+    Returns:
+        tuple: Shifted magnitude and phase, transposed for display
+    """
+    backend = backend or fftBackend.get_backend()
+    axes = (-2, -1)
+    fft_shifted = np.fft.fftshift(backend.fft2(image, axes=axes), axes=axes).swapaxes(-2, -1)
+
+    if log:
+        fft_mag = np.ma.log10(np.abs(fft_shifted))
+    else:
+        fft_mag = np.abs(fft_shifted)
+    fft_phase = np.angle(fft_shifted)
+
+    return (fft_mag, fft_phase)
+
+
+def half_spectrum(image: np.ndarray, dtype=np.float32, log: bool = False, backend=None) -> tuple:
+    """Real input fft of image
+
+    Spectrum of real image is Hermitian, so only columns 0 - width // 2 are computed.
+
+    Args:
+        image (np.ndarray): Gray image or stack of images (fft is computed over
+            last two axes in single call)
+        dtype: Float type of computation and results
+        log (bool): Return log10 of magnitude (zero magnitude stays zero)
+        backend: Fft backend (see fftBackend), default backend when None
+
+    Returns:
+        tuple: Magnitude and phase of shape (..., height, width // 2 + 1), not shifted
+    """
+    backend = backend or fftBackend.get_backend()
+    spectrum = backend.rfft2(np.asarray(image, dtype=dtype), axes=(-2, -1))
+
+    fft_mag = np.abs(spectrum).astype(dtype, copy=False)
+    fft_phase = np.angle(spectrum).astype(dtype, copy=False)
+    del spectrum
+
+    if log:
+        np.log10(fft_mag, out=fft_mag, where=fft_mag > 0)
+    return (fft_mag, fft_phase)
+
+
+def mirror_half_spectrum(fft_mag: np.ndarray, fft_phase: np.ndarray, width: int) -> tuple:
+    """Build shifted full spectrum from half spectrum
+
+    Missing columns are mirrored from Hermitian symmetry F(u, v) = conj(F(-u, -v)),
+    shift is applied by the same index arrays, so no intermediate full size arrays
+    are created.
+
+    Args:
+        fft_mag (np.ndarray): Half spectrum magnitude (last two axes are image axes)
+        fft_phase (np.ndarray): Half spectrum phase
+        width (int): Width of image
+
+    Returns:
+        tuple: Shifted magnitude and phase, transposed for display
+    """
+    height = fft_mag.shape[-2]
+    rows = (np.arange(height) - height // 2) % height
+    columns = (np.arange(width) - width // 2) % width
+    stored = columns <= width // 2
+    rows = rows[:, np.newaxis]
+    mirrored_rows = (-rows) % height
+    stored_columns = columns[stored]
+    mirrored_columns = width - columns[~stored]
+
+    shape = fft_mag.shape[:-2] + (height, width)
+    full_mag = np.empty(shape, dtype=fft_mag.dtype)
+    full_phase = np.empty(shape, dtype=fft_phase.dtype)
+
+    full_mag[..., stored] = fft_mag[..., rows, stored_columns]
+    full_mag[..., ~stored] = fft_mag[..., mirrored_rows, mirrored_columns]
+    full_phase[..., stored] = fft_phase[..., rows, stored_columns]
+    full_phase[..., ~stored] = np.negative(fft_phase[..., mirrored_rows, mirrored_columns])
+
+    return (full_mag.swapaxes(-2, -1), full_phase.swapaxes(-2, -1))
+
+
+def _temporary_memmap(dtype, shape: tuple, directory: str = None) -> np.memmap:
+    """Memory mapped array in unnamed temporary file, removed when array is released"""
+    with tempfile.TemporaryFile(suffix=".spectrum", dir=directory) as file:
+        # mapping keeps its own handle of file
+        return np.memmap(file, dtype=dtype, mode="w+", shape=shape)
+
+
+def out_of_core_spectrum(rows, height: int, width: int, memory_budget: int = 256 * 1024 * 1024,
+                         path: str = None, dtype=np.float32, backend=None) -> np.memmap:
+    """Compute half spectrum of image larger than memory
+
+    Blocks of streamed rows are transformed with row ffts and written transposed
+    to temporary memory mapped file, so columns of half spectrum are contiguous.
+    Column ffts are then computed over blocks of these rows and written to the
+    result. Only a block of rows or a block of columns is held in memory.
+
+    Args:
+        rows: Iterable of gray image rows
+        height (int): Image height
+        width (int): Image width
+        memory_budget (int): Approximate peak memory of blocks in bytes
+        path (str): Spectrum file (.npy format), by default spectrum is stored in
+            temporary file which is removed when returned array is released
+        dtype: Float type of computation (complex spectrum is stored with matching precision)
+        backend: Fft backend (see fftBackend), default backend when None
+
+    Returns:
+        np.memmap: Complex half spectrum of shape (height, width // 2 + 1), not shifted
+    """
+    backend = backend or fftBackend.get_backend()
+    dtype = np.dtype(dtype)
+    complex_dtype = np.result_type(dtype, np.complex64)
+    half_width = width // 2 + 1
+    directory = None if path is None else os.path.dirname(os.path.abspath(path))
+
+    # row pass: input row, complex output row and fft temporary
+    transposed = _temporary_memmap(complex_dtype, (half_width, height), directory)
+    row_bytes = width * dtype.itemsize + 2 * half_width * complex_dtype.itemsize
+    block_rows = max(1, min(height, memory_budget // row_bytes))
+    block = np.empty((block_rows, width), dtype=dtype)
+    start = 0
+    filled = 0
+    for row in rows:
+        block[filled] = row
+        filled += 1
+        if filled == block_rows:
+            transposed[:, start:start + filled] = backend.rfft(block, axis=1).T
+            start += filled
+            filled = 0
+    if filled:
+        transposed[:, start:start + filled] = backend.rfft(block[:filled], axis=1).T
+        start += filled
+    del block
+    if start != height:
+        raise RuntimeError(f"Expected {height} rows, got {start}")
+
+    if path is None:
+        spectrum = _temporary_memmap(complex_dtype, (height, half_width))
+    else:
+        spectrum = np.lib.format.open_memmap(path, mode="w+", dtype=complex_dtype, shape=(height, half_width))
+
+    # column pass: contiguous block of columns, fft output and temporary
+    column_bytes = 3 * height * complex_dtype.itemsize
+    block_columns = max(1, min(half_width, memory_budget // column_bytes))
+    for column in range(0, half_width, block_columns):
+        columns = backend.fft(transposed[column:column + block_columns], axis=1)
+        spectrum[:, column:column + block_columns] = columns.T
+    del transposed
+    spectrum.flush()
+    return spectrum
+
+
+def spectrum_preview(spectrum: np.ndarray, width: int, preview_size: int = 512, log: bool = False) -> tuple:
+    """Sample shifted full spectrum from (memory mapped) half spectrum
+
+    Only sampled elements are read from spectrum.
+
+    Args:
+        spectrum (np.ndarray): Complex half spectrum of shape (height, width // 2 + 1)
+        width (int): Image width
+        preview_size (int): Maximal size of preview
+        log (bool): Return log10 of magnitude
+
+    Returns:
+        tuple: Shifted preview magnitude and phase, transposed for display
+    """
+    height = spectrum.shape[0]
+    row_step = -(-height // preview_size)
+    column_step = -(-width // preview_size)
+
+    rows = (np.arange(0, height, row_step) - height // 2) % height
+    columns = (np.arange(0, width, column_step) - width // 2) % width
+    stored = columns <= width // 2
+
+    preview = np.empty((len(rows), len(columns)), dtype=spectrum.dtype)
+    preview[:, stored] = spectrum[np.ix_(rows, columns[stored])]
+    preview[:, ~stored] = np.conj(spectrum[np.ix_((-rows) % height, width - columns[~stored])])
+
+    fft_mag = np.abs(preview)
+    if log:
+        np.log10(fft_mag, out=fft_mag, where=fft_mag > 0)
+    return (fft_mag.transpose(), np.angle(preview).transpose())
@@ -0,0 +1,87 @@
+import cProfile
+import pstats
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class PngStats(object):
+    """Counters and timers of png processing stages
+
+    Instrumented code receives None instead of PngStats when statistics are
+    disabled and skips all measurements, so disabled statistics cost only
+    a single comparison per stage.
+
+    Attributes:
+        counters (dict): Counter values, e.g. bytes_read, chunks_parsed
+        timers (dict): Total time in seconds spent in every stage
+    """
+    def __init__(self, profile: bool = False, trace_memory: bool = False) -> None:
+        """
+        Args:
+            profile (bool): Run cProfile inside profile() blocks
+            trace_memory (bool): Trace allocations with tracemalloc inside profile() blocks
+        """
+        self.counters = defaultdict(int)
+        self.timers = defaultdict(float)
+        self._profile = profile
+        self._trace_memory = trace_memory
+        self._profiler = cProfile.Profile() if profile else None
+        self._peak_memory = 0
+
+    def add(self, counter: str, value: int = 1):
+        self.counters[counter] += value
+
+    def add_time(self, stage: str, seconds: float):
+        self.timers[stage] += seconds
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timers[stage] += time.perf_counter() - start
+
+    @contextmanager
+    def profile(self):
+        """Run block under enabled cProfile and tracemalloc hooks"""
+        if self._trace_memory:
+            tracemalloc.start()
+        if self._profiler is not None:
+            self._profiler.enable()
+        try:
+            yield
+        finally:
+            if self._profiler is not None:
+                self._profiler.disable()
+            if self._trace_memory:
+                self._peak_memory = max(self._peak_memory, tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+
+    @property
+    def peak_memory(self) -> int:
+        """Peak traced memory in bytes inside profile() blocks"""
+        return self._peak_memory
+
+    def print_profile(self, limit: int = 20, sort: str = "cumulative"):
+        if self._profiler is None:
+            raise RuntimeError("Profiling is disabled")
+        pstats.Stats(self._profiler).sort_stats(sort).print_stats(limit)
+
+    def as_dict(self) -> dict:
+        stats = {
+            "counters": dict(self.counters),
+            "timers": dict(self.timers)
+        }
+        if self._trace_memory:
+            stats["peak_memory"] = self._peak_memory
+        return stats
+
+    def reset(self):
+        self.counters.clear()
+        self.timers.clear()
+        self._peak_memory = 0
+        if self._profiler is not None:
+            self._profiler = cProfile.Profile()
@@ -1,10 +1,79 @@
 import sympy
 import logging
+import os
+import struct
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+import numpy as np
+
+# public exponent modes of AlgorithmRSA
+RANDOM_EXPONENT = "random"
+STANDARD_EXPONENT = 65537
+
+# number of blocks encrypted or decrypted by single process pool task
+ECB_BATCH_BLOCKS = 1024
+
+# key file: magic, format version, then integers as 4 byte length and big endian value
+KEY_FILE_VERSION = 1
+PUBLIC_KEY_MAGIC = b"RSAP"
+PRIVATE_KEY_MAGIC = b"RSAS"
+_EXPONENT_MODES = (RANDOM_EXPONENT, "fixed")
+
+
+def _pack_key(magic: bytes, flags: int, values: list) -> bytes:
+    data = bytearray(magic)
+    data += struct.pack(">BB", KEY_FILE_VERSION, flags)
+    for value in values:
+        value = value or 0
+        encoded = value.to_bytes((value.bit_length() + 7) // 8, "big")
+        data += struct.pack(">I", len(encoded))
+        data += encoded
+    return bytes(data)
+
+
+def _unpack_key(magic: bytes, data: bytes, count: int, required: int) -> tuple:
+    """Unpack key file, returns flags and count integers (zero length integers are None)
+
+    First required integers must not be empty, malformed data raises ValueError.
+    """
+    if len(data) < 6 or data[:4] != magic:
+        raise ValueError("Invalid key file")
+    version, flags = struct.unpack_from(">BB", data, 4)
+    if version != KEY_FILE_VERSION:
+        raise ValueError(f"Unsupported key file version {version}")
+    values = []
+    offset = 6
+    while offset < len(data):
+        if offset + 4 > len(data):
+            raise ValueError("Key file is truncated")
+        length, = struct.unpack_from(">I", data, offset)
+        offset += 4
+        if offset + length > len(data):
+            raise ValueError("Key file is truncated")
+        values.append(int.from_bytes(data[offset:offset + length], "big") if length else None)
+        offset += length
+    if len(values) != count:
+        raise ValueError(f"Key file has {len(values)} values, expected {count}")
+    if None in values[:required]:
+        raise ValueError("Key file has empty key value")
+    return flags, values
+
+
+def _write_file(path: str, data: bytes):
+    with open(path, "wb") as file:
+        file.write(data)
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read()
 
 class PublicKey:
-    def __init__(self, n: int, e: int) -> None:
+    """Public key, exponent_mode records how e was chosen ("random" or "fixed")"""
+    def __init__(self, n: int, e: int, exponent_mode: str = RANDOM_EXPONENT) -> None:
         self._n = n
         self._e = e
+        self._exponent_mode = exponent_mode
 
     def __str__(self) -> str:
         return f"({self._n}, {self._e}"
@@ -17,10 +86,43 @@ class PublicKey:
     def e(self) -> int:
         return self._e
 
+    @property
+    def exponent_mode(self) -> str:
+        return self._exponent_mode
+
+    def tobytes(self) -> bytes:
+        return _pack_key(PUBLIC_KEY_MAGIC, _EXPONENT_MODES.index(self._exponent_mode), [self._n, self._e])
+
+    @classmethod
+    def frombytes(cls, data: bytes) -> "PublicKey":
+        flags, values = _unpack_key(PUBLIC_KEY_MAGIC, data, 2, 2)
+        if flags >= len(_EXPONENT_MODES):
+            raise ValueError(f"Invalid exponent mode {flags} in key file")
+        n, e = values
+        return cls(n, e, _EXPONENT_MODES[flags])
+
+    def save(self, path: str):
+        _write_file(path, self.tobytes())
+
+    @classmethod
+    def load(cls, path: str) -> "PublicKey":
+        return cls.frombytes(_read_file(path))
+
 class PrivateKey:
-    def __init__(self, n: int, d: int) -> None:
+    """Private key, primes p and q enable decryption with Chinese Remainder Theorem"""
+    def __init__(self, n: int, d: int, p: int = None, q: int = None) -> None:
         self._n = n
         self._d = d
+        self._p = p
+        self._q = q
+        if p is not None and q is not None:
+            if p == q:
+                raise ValueError("Primes p and q of private key must be different")
+            self._dP = d % (p - 1)
+            self._dQ = d % (q - 1)
+            self._qInv = pow(q, -1, p)
+        else:
+            self._dP = self._dQ = self._qInv = None
 
     def __str__(self) -> str:
         return f"({self._n}, {self._d})"
@@ -33,24 +135,103 @@ class PrivateKey:
     def d(self) -> int:
         return self._d
 
+    @property
+    def p(self) -> int:
+        return self._p
+
+    @property
+    def q(self) -> int:
+        return self._q
+
+    @property
+    def dP(self) -> int:
+        """d mod (p - 1)"""
+        return self._dP
+
+    @property
+    def dQ(self) -> int:
+        """d mod (q - 1)"""
+        return self._dQ
+
+    @property
+    def qInv(self) -> int:
+        """Inverse of q modulo p"""
+        return self._qInv
+
+    @property
+    def has_crt(self) -> bool:
+        return self._qInv is not None
+
+    def tobytes(self) -> bytes:
+        """Serialize key, CRT parameters are recomputed from p and q on load"""
+        return _pack_key(PRIVATE_KEY_MAGIC, 0, [self._n, self._d, self._p, self._q])
+
+    @classmethod
+    def frombytes(cls, data: bytes) -> "PrivateKey":
+        _, values = _unpack_key(PRIVATE_KEY_MAGIC, data, 4, 2)
+        n, d, p, q = values
+        return cls(n, d, p, q)
+
+    def save(self, path: str):
+        """Save key to file readable only by owner"""
+        descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(self.tobytes())
+
+    @classmethod
+    def load(cls, path: str) -> "PrivateKey":
+        return cls.frombytes(_read_file(path))
+
 class AlgorithmRSA:
-    def __init__(self, key_size_bits = 2048) -> None:
+    def __init__(self, key_size_bits = 2048, public_exponent = RANDOM_EXPONENT) -> None:
+        """Generate key pair
+
+        Args:
+            key_size_bits (int): Size of modulus
+            public_exponent: RANDOM_EXPONENT for random prime e of half modulus
+                size, or fixed odd exponent (STANDARD_EXPONENT = 65537 makes
+                encryption much faster than decryption)
+        """
+        if public_exponent != RANDOM_EXPONENT and (not isinstance(public_exponent, int)
+                                                   or public_exponent < 3 or public_exponent % 2 == 0):
+            raise ValueError(f"Invalid public exponent {public_exponent}")
 
         exp_size = key_size_bits // 2
-        p = sympy.randprime(2**exp_size, 2**(exp_size+1) + 1)
-        q = sympy.randprime(2**exp_size, 2**(exp_size+1) + 1)
-        n = p * q
-        phi = (p - 1) * (q - 1)
-        e =  sympy.randprime(2**(exp_size - 1), phi)
-        while e < phi and sympy.gcd(e, phi) != 1:
-            e = sympy.randprime(2**(exp_size - 1), phi)
+        while True:
+            p = sympy.randprime(2**exp_size, 2**(exp_size+1) + 1)
+            q = sympy.randprime(2**exp_size, 2**(exp_size+1) + 1)
+            while q == p:
+                q = sympy.randprime(2**exp_size, 2**(exp_size+1) + 1)
+            n = p * q
+            phi = (p - 1) * (q - 1)
+            if public_exponent == RANDOM_EXPONENT:
+                e =  sympy.randprime(2**(exp_size - 1), phi)
+                while e < phi and sympy.gcd(e, phi) != 1:
+                    e = sympy.randprime(2**(exp_size - 1), phi)
+                break
+            # fixed exponent must be coprime with phi, otherwise new primes are needed
+            if sympy.gcd(public_exponent, phi) == 1:
+                e = public_exponent
+                break
 
         d = sympy.mod_inverse(e, phi)
 
-        self._public_key = PublicKey(n, e)
-        self._private_key = PrivateKey(n, d)
+        exponent_mode = RANDOM_EXPONENT if public_exponent == RANDOM_EXPONENT else "fixed"
+        self._public_key = PublicKey(n, e, exponent_mode)
+        self._private_key = PrivateKey(n, d, p, q)
+
+    @classmethod
+    def from_keys(cls, public_key: PublicKey = None, private_key: PrivateKey = None) -> "AlgorithmRSA":
+        """Create algorithm from existing (e.g. loaded) keys without key generation
 
-        self._block_size_bit = key_size_bits // 8
+        Public key is needed only for encryption and private key only for decryption.
+        """
+        if public_key is None and private_key is None:
+            raise ValueError("No key given")
+        algorithm = cls.__new__(cls)
+        algorithm._public_key = public_key
+        algorithm._private_key = private_key
+        return algorithm
 
     @property
     def public_key(self) -> PublicKey:
@@ -64,26 +245,221 @@ class AlgorithmRSA:
         return pow(data, self._public_key.e, self._public_key.n)
 
     def decrypt_data(self, data:int) -> int:
-        return pow(data, self._private_key.d, self._private_key.n)
+        """Decrypt block, with Chinese Remainder Theorem when primes are known"""
+        key = self._private_key
+        if not key.has_crt:
+            return pow(data, key.d, key.n)
+        m1 = pow(data, key.dP, key.p)
+        m2 = pow(data, key.dQ, key.q)
+        return m2 + (key.qInv * (m1 - m2) % key.p) * key.q
 
-    def encrypt_ECB(self, chunk_data : bytes) -> bytes:
-        encrypted_data = b''
-        extra_data = b''
+    def decrypt_many(self, data: list) -> list:
+        """Decrypt blocks reusing precomputed key parameters"""
+        return _decrypt_many(self._private_key, data)
+
+    @property
+    def plain_block_size(self) -> int:
+        """Bytes of plaintext block, one byte less than modulus, so block is always smaller"""
+        return self.cipher_block_size - 1
+
+    @property
+    def cipher_block_size(self) -> int:
+        """Bytes of ciphertext block (modulus length)"""
+        key = self._public_key or self._private_key
+        return (key.n.bit_length() + 7) // 8
+
+    def encrypt_ECB(self, chunk_data: bytes, workers: int = None, executor=None) -> tuple:
+        """Encrypt data block by block
+
+        Every plaintext block of plain_block_size bytes (last block may be shorter)
+        is encrypted to cipher_block_size bytes. Encrypted data has the same length
+        as input, remaining bytes of every ciphertext block are stored in extra data
+        (one byte per full block, the rest of last block).
+
+        Args:
+            chunk_data (bytes): Data to encrypt
+            workers (int): Number of processes used for data of more than
+                ECB_BATCH_BLOCKS blocks (1 encrypts in calling process)
+            executor (ProcessPoolExecutor): Pool reused by repeated calls instead
+                of pool created for single call
+
+        Returns:
+            tuple: Encrypted data and extra data as bytearrays
+        """
+        plain_size, cipher_size = self.plain_block_size, self.cipher_block_size
+        full_blocks, last_size = divmod(len(chunk_data), plain_size)
+        batch_size = plain_size * ECB_BATCH_BLOCKS
+        batches = [bytes(chunk_data[i:i + batch_size]) for i in range(0, len(chunk_data), batch_size)]
+        ciphertext = b"".join(_map_batches(_encrypt_blocks, self._public_key, batches,
+                                           [plain_size] * len(batches), workers, executor))
+
+        encrypted = bytearray(len(chunk_data))
+        extra = bytearray(full_blocks + (cipher_size - last_size if last_size else 0))
+        blocks = np.frombuffer(ciphertext, dtype=np.uint8, count=full_blocks * cipher_size)
+        blocks = blocks.reshape(full_blocks, cipher_size)
+        full_size = full_blocks * plain_size
+        np.frombuffer(encrypted, dtype=np.uint8, count=full_size).reshape(full_blocks, plain_size)[:] = blocks[:, :plain_size]
+        np.frombuffer(extra, dtype=np.uint8, count=full_blocks)[:] = blocks[:, plain_size]
+        if last_size:
+            last = ciphertext[full_blocks * cipher_size:]
+            encrypted[full_size:] = last[:last_size]
+            extra[full_blocks:] = last[last_size:]
+        return encrypted, extra
+
+    def decrypt_ECB(self, encrypted: bytes, extra: bytes, workers: int = None, executor=None) -> bytearray:
+        """Decrypt data encrypted by encrypt_ECB
+
+        Args:
+            encrypted (bytes): Encrypted data
+            extra (bytes): Extra data returned by encrypt_ECB
+            workers (int): Number of processes (see encrypt_ECB)
+            executor (ProcessPoolExecutor): Reused pool (see encrypt_ECB)
+
+        Returns:
+            bytearray: Decrypted data
+        """
+        plain_size, cipher_size = self.plain_block_size, self.cipher_block_size
+        full_blocks, last_size = divmod(len(encrypted), plain_size)
+        if len(extra) != full_blocks + (cipher_size - last_size if last_size else 0):
+            raise ValueError("Extra data does not match encrypted data")
+
+        full_size = full_blocks * plain_size
+        ciphertext = bytearray(full_blocks * cipher_size + (cipher_size if last_size else 0))
+        blocks = np.frombuffer(ciphertext, dtype=np.uint8, count=full_blocks * cipher_size)
+        blocks = blocks.reshape(full_blocks, cipher_size)
+        blocks[:, :plain_size] = np.frombuffer(encrypted, dtype=np.uint8, count=full_size).reshape(full_blocks, plain_size)
+        blocks[:, plain_size] = np.frombuffer(extra, dtype=np.uint8, count=full_blocks)
+        if last_size:
+            ciphertext[full_blocks * cipher_size:] = bytes(encrypted[full_size:]) + bytes(extra[full_blocks:])
+
+        batch_size = cipher_size * ECB_BATCH_BLOCKS
+        batches = [bytes(ciphertext[i:i + batch_size]) for i in range(0, len(ciphertext), batch_size)]
+        # every block decrypts to plain_size bytes except the last one
+        last_sizes = [plain_size] * len(batches)
+        if last_size:
+            last_sizes[-1] = last_size
+        decrypted = bytearray(len(encrypted))
+        offset = 0
+        for plaintext in _map_batches(_decrypt_blocks, self._private_key, batches, last_sizes, workers, executor):
+            decrypted[offset:offset + len(plaintext)] = plaintext
+            offset += len(plaintext)
+        return decrypted
+
+
+def _decrypt_many(key: PrivateKey, data: list) -> list:
+    if not key.has_crt:
+        d, n = key.d, key.n
+        return [pow(block, d, n) for block in data]
+
+    p, q, dP, dQ, qInv = key.p, key.q, key.dP, key.dQ, key.qInv
+    decrypted = []
+    for block in data:
+        m1 = pow(block, dP, p)
+        m2 = pow(block, dQ, q)
+        decrypted.append(m2 + (qInv * (m1 - m2) % p) * q)
+    return decrypted
+
+
+def _encrypt_blocks(key: PublicKey, data: bytes, plain_size: int) -> bytes:
+    """Encrypt batch of plaintext blocks to concatenated ciphertext blocks"""
+    n, e = key.n, key.e
+    cipher_size = plain_size + 1
+    ciphertext = bytearray(-(-len(data) // plain_size) * cipher_size)
+    for i, offset in enumerate(range(0, len(data), plain_size)):
+        block = pow(int.from_bytes(data[offset:offset + plain_size], "big"), e, n)
+        ciphertext[i * cipher_size:(i + 1) * cipher_size] = block.to_bytes(cipher_size, "big")
+    return bytes(ciphertext)
+
+
+def _decrypt_blocks(key: PrivateKey, data: bytes, last_size: int) -> bytes:
+    """Decrypt batch of ciphertext blocks, last block has last_size bytes of plaintext"""
+    cipher_size = (key.n.bit_length() + 7) // 8
+    plain_size = cipher_size - 1
+    blocks = [int.from_bytes(data[i:i + cipher_size], "big") for i in range(0, len(data), cipher_size)]
+    decrypted = _decrypt_many(key, blocks)
+    plaintext = bytearray(plain_size * (len(blocks) - 1) + last_size)
+    for i, block in enumerate(decrypted[:-1]):
+        plaintext[i * plain_size:(i + 1) * plain_size] = block.to_bytes(plain_size, "big")
+    if decrypted:
+        plaintext[-last_size:] = decrypted[-1].to_bytes(last_size, "big")
+    return bytes(plaintext)
+
+
+def _map_batches(function, key, batches: list, sizes: list, workers: int = None, executor=None) -> list:
+    """Run function on batches, on process pool when there is more than one batch"""
+    if workers == 1 or len(batches) <= 1:
+        return [function(key, batch, size) for batch, size in zip(batches, sizes)]
+    if executor is not None:
+        return list(executor.map(function, [key] * len(batches), batches, sizes))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(function, [key] * len(batches), batches, sizes))
+
+
+def generate_keys(key_size_bits: int = 2048, public_exponent = RANDOM_EXPONENT) -> tuple:
+    """Generate key pair (task of process pool)
+
+    Returns:
+        tuple: PublicKey and PrivateKey
+    """
+    algorithm = AlgorithmRSA(key_size_bits, public_exponent)
+    return (algorithm.public_key, algorithm.private_key)
+
+
+class KeyPool:
+    """Pool of key pairs generated in background processes
+
+    Size key pairs are generated ahead, every taken key pair is replaced by new
+    one, so keys are ready immediately unless they are taken faster than
+    generated.
+    """
+    def __init__(self, key_size_bits: int = 2048, public_exponent = RANDOM_EXPONENT,
+                 size: int = 4, workers: int = None) -> None:
+        if size < 1:
+            raise ValueError(f"Invalid key pool size {size}")
+        self._key_size_bits = key_size_bits
+        self._public_exponent = public_exponent
+        self._executor = ProcessPoolExecutor(max_workers=workers)
+        self._pending = deque(self._submit() for _ in range(size))
+
+    def _submit(self):
+        return self._executor.submit(generate_keys, self._key_size_bits, self._public_exponent)
+
+    def _replace(self, future):
+        self._pending.remove(future)
+        self._pending.append(self._submit())
+
+    def get(self, timeout: float = None) -> AlgorithmRSA:
+        """Take key pair, waits for generation when no key pair is ready
+
+        On timeout key pair being generated stays in pool for next call.
+        """
+        # ready key pair is preferred over oldest one still being generated
+        future = next((future for future in self._pending if future.done()), self._pending[0])
+        try:
+            public_key, private_key = future.result(timeout)
+        except FutureTimeoutError:
+            raise
+        except Exception:
+            # failed generation is replaced, so it is not raised again
+            self._replace(future)
+            raise
+        self._replace(future)
+        return AlgorithmRSA.from_keys(public_key, private_key)
+
+    @property
+    def ready(self) -> int:
+        """Number of generated key pairs"""
+        return sum(1 for future in self._pending if future.done())
 
-        chunk_data_blocks = [chunk_data[i:i + self._block_size_bit] for i in range(0, len(chunk_data), self._block_size_bit)]
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
 
-        for data_block in chunk_data_blocks:
-            encrypted_int: int = encrypted_data(int.from_bytes(data_block, "big"))
-            encrypted_block = encrypted_int.to_bytes(self._block_size_bit, "big")
+    def __enter__(self):
+        return self
 
-            if len(encrypted_block) < self._block_size_bit:
-                encrypted_data += encrypted_block
-            else:
-                encrypted_data += encrypted_block[:self._block_size_bit]
-                extra_data += encrypted_block[self._block_size_bit:]
-                logging.info(extra_data)
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
-        return encrypted_data, extra_data
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG)
@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import pytest
+
+import fftBackend
+from pngFile import PngFile
+
+PNG_DIR = os.path.join(os.path.dirname(__file__), "png")
+
+
+@pytest.fixture(params=sorted(fftBackend.BACKENDS))
+def backend(request):
+    if request.param not in fftBackend.available_backends():
+        pytest.skip(f"{request.param} is not installed")
+    return fftBackend.get_backend(request.param, workers=2)
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_backend_matches_numpy(backend, dtype):
+    image = np.random.default_rng(0).random((3, 12, 9)).astype(dtype)
+    tolerance = 1e-3 if dtype == np.float32 else 1e-9
+    for axis in (0, 1, -1):
+        np.testing.assert_allclose(backend.fft(image, axis=axis), np.fft.fft(image, axis=axis), atol=tolerance)
+        np.testing.assert_allclose(backend.rfft(image, axis=axis), np.fft.rfft(image, axis=axis), atol=tolerance)
+    for axes in ((-2, -1), (0, 2)):
+        np.testing.assert_allclose(backend.fft2(image, axes=axes), np.fft.fft2(image, axes=axes), atol=tolerance)
+        np.testing.assert_allclose(backend.rfft2(image, axes=axes), np.fft.rfft2(image, axes=axes), atol=tolerance)
+
+
+def test_backend_results_are_not_reused(backend):
+    first = np.random.default_rng(1).random((8, 8))
+    first_spectrum = backend.rfft2(first)
+    backend.rfft2(first + 1)
+    np.testing.assert_allclose(first_spectrum, np.fft.rfft2(first), atol=1e-9)
+
+
+def test_pyfftw_plans_are_cached():
+    if "pyfftw" not in fftBackend.available_backends():
+        pytest.skip("pyfftw is not installed")
+    backend = fftBackend.PyfftwBackend(workers=1)
+    for _ in range(3):
+        backend.rfft2(np.zeros((4, 6)))
+    backend.rfft2(np.zeros((4, 6), dtype=np.float32))
+    assert len(backend._plans) == 2
+
+
+def test_backends_are_shared():
+    assert fftBackend.get_backend("numpy") is fftBackend.get_backend("numpy")
+    assert fftBackend.get_backend("numpy", workers=3).description == "numpy (1 workers)"
+    with pytest.raises(ValueError):
+        fftBackend.get_backend("fftpack")
+    with pytest.raises(ValueError):
+        fftBackend.set_default_backend("fftpack")
+
+
+def test_missing_backend_falls_back_to_numpy(monkeypatch):
+    monkeypatch.setattr(fftBackend, "pyfftw", None)
+    assert fftBackend.get_backend("pyfftw").name == "numpy"
+
+
+def test_get_fft_reports_backend(backend):
+    with PngFile(os.path.join(PNG_DIR, "fft_test.png"), pixel_cache=False) as png_file:
+        assert png_file.fft_backend is None
+        fft_mag, _ = png_file.get_fft("half", backend=backend.name, workers=2)
+        assert png_file.fft_backend == backend.description
+        expected, _ = png_file.get_fft("half", backend="numpy")
+        # float32 error is relative to largest (zero frequency) magnitude
+        np.testing.assert_allclose(fft_mag, expected, atol=1e-5 * expected.max())
@@ -0,0 +1,78 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+import pngDecoder
+from pixelCache import PixelCache
+from pngFile import PngFile
+
+PNG_DIR = os.path.join(os.path.dirname(__file__), "png")
+
+
+@pytest.fixture
+def decode_calls(monkeypatch) -> list:
+    """Arguments of every pngDecoder.decode_pixels call"""
+    calls = []
+    decode_pixels = pngDecoder.decode_pixels
+
+    def counting_decode_pixels(*args, **kwargs):
+        calls.append(args)
+        return decode_pixels(*args, **kwargs)
+
+    monkeypatch.setattr(pngDecoder, "decode_pixels", counting_decode_pixels)
+    return calls
+
+
+def test_files_of_same_image_share_decoded_pixels(decode_calls):
+    cache = PixelCache()
+    path = os.path.join(PNG_DIR, "histo15.png")
+    with PngFile(path, pixel_cache=cache) as first, PngFile(path, pixel_cache=cache) as second:
+        pixels = first.pixels()
+        assert second.pixels() is pixels
+        assert first.pixels() is pixels
+    assert len(decode_calls) == 1
+    assert not pixels.flags.writeable
+    assert cache.size == pixels.nbytes
+
+
+def test_modified_file_is_decoded_again(decode_calls, tmp_path):
+    cache = PixelCache()
+    path = tmp_path / "image.png"
+    shutil.copy(os.path.join(PNG_DIR, "histo15.png"), path)
+    with PngFile(path, pixel_cache=cache) as png_file:
+        pixels = png_file.pixels()
+
+    status = os.stat(path)
+    os.utime(path, ns=(status.st_atime_ns, status.st_mtime_ns + 1_000_000_000))
+    with PngFile(path, pixel_cache=cache) as png_file:
+        assert png_file.pixels() is not pixels
+        np.testing.assert_array_equal(png_file.pixels(), pixels)
+    assert len(decode_calls) == 2
+
+
+def test_least_recently_used_arrays_are_evicted():
+    cache = PixelCache(max_bytes=250)
+    arrays = {key: np.zeros(100, dtype=np.uint8) for key in "abc"}
+    cache.put("a", arrays["a"])
+    cache.put("b", arrays["b"])
+    assert cache.get("a") is arrays["a"]
+
+    cache.put("c", arrays["c"])
+    assert cache.get("b") is None
+    assert cache.get("a") is arrays["a"] and cache.get("c") is arrays["c"]
+    assert cache.size == 200
+
+    # array bigger than whole budget is not cached
+    cache.put("d", np.zeros(251, dtype=np.uint8))
+    assert cache.get("d") is None and cache.size == 200
+
+
+def test_replaced_array_is_counted_once():
+    cache = PixelCache(max_bytes=250)
+    cache.put("a", np.zeros(100, dtype=np.uint8))
+    cache.put("a", np.zeros(150, dtype=np.uint8))
+    assert cache.size == 150
+    cache.clear()
+    assert cache.size == 0 and cache.get("a") is None
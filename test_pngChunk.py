@@ -0,0 +1,90 @@
+import os
+import struct
+import zlib
+
+import pytest
+
+import pngChunk
+from pngChunk import PngChunk, register_chunk
+from pngFile import PngFile
+
+PNG_DIR = os.path.join(os.path.dirname(__file__), "png")
+
+
+def _with_chunk(path, chunk_type: bytes, data: bytes) -> bytes:
+    """Png file data with chunk inserted after IHDR"""
+    with open(path, "rb") as file:
+        png = file.read()
+    ihdr_end = 8 + 12 + 13
+    chunk = struct.pack(">I", len(data)) + chunk_type + data + \
+        zlib.crc32(chunk_type + data).to_bytes(4, "big")
+    return png[:ihdr_end] + chunk + png[ihdr_end:]
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_registered_chunk_class_is_used(monkeypatch, tmp_path, lazy):
+    monkeypatch.setattr(pngChunk, "CHUNK_TYPES", dict(pngChunk.CHUNK_TYPES))
+
+    @register_chunk("vpAg")
+    class PngChunkvpAg(PngChunk):
+        __slots__ = ()
+
+        def _parse_data(self, data_dict: dict):
+            data_dict["Width"], data_dict["Height"], data_dict["Unit"] = struct.unpack(">IIB", self.byte_data)
+
+    path = tmp_path / "vpag.png"
+    path.write_bytes(_with_chunk(os.path.join(PNG_DIR, "histo15.png"), b"vpAg", struct.pack(">IIB", 640, 480, 0)))
+    with PngFile(path, lazy=lazy, pixel_cache=False) as png_file:
+        chunk = png_file.get_chunk("vpAg")
+        assert type(chunk) is PngChunkvpAg
+        assert chunk.data == {"Width": 640, "Height": 480, "Unit": 0}
+        assert all(not hasattr(chunk, "__dict__") for chunk in png_file.chunks)
+
+
+def test_unregistered_chunk_has_no_parsed_data(tmp_path):
+    path = tmp_path / "unknown.png"
+    path.write_bytes(_with_chunk(os.path.join(PNG_DIR, "histo15.png"), b"prVt", b"data"))
+    with PngFile(path, pixel_cache=False) as png_file:
+        chunk = png_file.get_chunk("prVt")
+        assert type(chunk) is PngChunk
+        assert chunk.data == {} and chunk.tobytes() == b"data"
+
+
+@pytest.mark.parametrize("name, chunk_type, expected", [
+    ("sbit.png", "sBIT", [{"Gray significant bits": 5}]),
+    ("trns.png", "tRNS", [{"Transparency": [0, 200]}]),
+    ("splt.png", "sPLT", [{"Palette name": b"Eight-bit", "Sample depth": 8, "Entries": 2},
+                          {"Palette name": b"Sixteen-bit", "Sample depth": 16, "Entries": 2}]),
+])
+def test_chunk_parsers(name, chunk_type, expected):
+    with PngFile(os.path.join(PNG_DIR, name), pixel_cache=False) as png_file:
+        chunks = [chunk for chunk in png_file.chunks if chunk.type == chunk_type]
+        assert [chunk.data for chunk in chunks] == expected
+        assert all(type(chunk) is pngChunk.CHUNK_TYPES[chunk_type] for chunk in chunks)
+
+
+def test_ztxt_parser():
+    with PngFile(os.path.join(PNG_DIR, "ztxt.png"), pixel_cache=False) as png_file:
+        data = png_file.get_chunk("zTXt").data
+    assert data["Keyword"] == b"Description" and data["Compression method"] == 0
+    assert data["Text string"].startswith(b"Lorem ipsum dolor sit amet")
+
+
+def test_splt_entries():
+    with PngFile(os.path.join(PNG_DIR, "splt.png"), pixel_cache=False) as png_file:
+        entries = [chunk.get_entries() for chunk in png_file.chunks if chunk.type == "sPLT"]
+    assert [len(chunk_entries) for chunk_entries in entries] == [2, 2]
+    assert all(len(entry) == 5 for chunk_entries in entries for entry in chunk_entries)
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+@pytest.mark.parametrize("missing", [5, 9, 12])
+def test_truncated_chunk_header(tmp_path, use_mmap, missing):
+    with open(os.path.join(PNG_DIR, "histo15.png"), "rb") as file:
+        data = file.read()
+    # file ends inside header of IEND chunk
+    path = tmp_path / "truncated.png"
+    path.write_bytes(data[:-missing])
+
+    with pytest.raises(RuntimeError, match="Truncated chunk header"):
+        PngFile(path, use_mmap=use_mmap, pixel_cache=False)
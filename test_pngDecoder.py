@@ -0,0 +1,133 @@
+import os
+
+import numpy as np
+import pytest
+
+import pngDecoder
+from benchmark import write_synthetic_png
+from pngFile import PngFile
+
+PNG_DIR = os.path.join(os.path.dirname(__file__), "png")
+
+
+def _filter_reference(filter_type: int, row: bytes, previous: bytes, bytes_per_pixel: int) -> bytes:
+    """Filter row byte by byte as described in png specification"""
+    filtered = bytearray()
+    for i, x in enumerate(row):
+        a = row[i - bytes_per_pixel] if i >= bytes_per_pixel else 0
+        b = previous[i]
+        c = previous[i - bytes_per_pixel] if i >= bytes_per_pixel else 0
+        if filter_type == 0:
+            predictor = 0
+        elif filter_type == 1:
+            predictor = a
+        elif filter_type == 2:
+            predictor = b
+        elif filter_type == 3:
+            predictor = (a + b) // 2
+        else:
+            p = a + b - c
+            pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+            predictor = a if pa <= pb and pa <= pc else b if pb <= pc else c
+        filtered.append((x - predictor) % 256)
+    return bytes(filtered)
+
+
+def _pillow_pixels(path, mode: str = None) -> np.ndarray:
+    """Pixels decoded by Pillow, test is skipped when it is not installed"""
+    Image = pytest.importorskip("PIL.Image")
+    with Image.open(path) as image:
+        return np.asarray(image.convert(mode) if mode else image)
+
+
+@pytest.mark.parametrize("filter_type", sorted(pngDecoder.FILTER_TYPES))
+@pytest.mark.parametrize("bytes_per_pixel", [1, 2, 3, 4, 6, 8])
+def test_unfilter_scanline(filter_type, bytes_per_pixel):
+    generator = np.random.default_rng(filter_type * 10 + bytes_per_pixel)
+    for previous in (np.zeros(bytes_per_pixel * 37, dtype=np.uint8),
+                     generator.integers(0, 256, bytes_per_pixel * 37, dtype=np.uint8)):
+        row = generator.integers(0, 256, len(previous), dtype=np.uint8)
+        filtered = _filter_reference(filter_type, row.tobytes(), previous.tobytes(), bytes_per_pixel)
+
+        unfiltered = pngDecoder.unfilter_scanline(filter_type, filtered, previous, bytes_per_pixel)
+        np.testing.assert_array_equal(unfiltered, row)
+
+
+@pytest.mark.parametrize("bytes_per_pixel", [1, 3, 8])
+@pytest.mark.parametrize("width, height", [(1, 1), (1, 9), (9, 1), (40, 23)])
+def test_unfilter_scanlines_matches_row_by_row(bytes_per_pixel, width, height):
+    generator = np.random.default_rng(width * height + bytes_per_pixel)
+    filter_types = generator.choice([3, 4], height)
+    image = generator.integers(0, 256, (height + 1, width * bytes_per_pixel), dtype=np.uint8)
+    filtered = np.array([
+        np.frombuffer(_filter_reference(filter_type, row.tobytes(), previous.tobytes(), bytes_per_pixel),
+                      dtype=np.uint8)
+        for filter_type, previous, row in zip(filter_types, image, image[1:])])
+
+    unfiltered = pngDecoder.unfilter_scanlines(filter_types, filtered, image[0], bytes_per_pixel)
+    np.testing.assert_array_equal(unfiltered, image[1:])
+
+
+@pytest.mark.parametrize("color_type, bit_depth", [(0, 8), (2, 8), (3, 1), (3, 2), (3, 4), (3, 8), (4, 8), (6, 8)])
+@pytest.mark.parametrize("width, height", [(1, 1), (5, 3), (33, 17)])
+def test_decode_matches_pillow(tmp_path, color_type, bit_depth, width, height):
+    # rows of synthetic images cycle through all filter types
+    path = tmp_path / "image.png"
+    write_synthetic_png(path, width, height, color_type, bit_depth)
+
+    expected = _pillow_pixels(path)
+    with PngFile(path, pixel_cache=False) as png_file:
+        np.testing.assert_array_equal(png_file.pixels(), expected)
+
+
+def test_decode_photo_matches_pillow():
+    # long runs of Paeth and Average filtered rows
+    path = os.path.join(PNG_DIR, "duck.png")
+    expected = _pillow_pixels(path)
+    with PngFile(path, pixel_cache=False) as png_file:
+        np.testing.assert_array_equal(png_file.pixels(), expected)
+
+
+@pytest.mark.parametrize("color_type, bit_depth", [(0, 8), (2, 8), (3, 1), (3, 4), (6, 8)])
+@pytest.mark.parametrize("width, height", [(1, 1), (5, 3), (33, 17)])
+def test_decode_interlaced_matches_pillow(tmp_path, color_type, bit_depth, width, height):
+    path = tmp_path / "image.png"
+    write_synthetic_png(path, width, height, color_type, bit_depth, interlace=1)
+
+    expected = _pillow_pixels(path)
+    with PngFile(path, pixel_cache=False) as png_file:
+        np.testing.assert_array_equal(png_file.pixels(), expected)
+
+
+def test_adam7_passes_end_with_decoded_image(tmp_path):
+    path = tmp_path / "image.png"
+    write_synthetic_png(path, 29, 23, 2, 8, interlace=1)
+
+    with PngFile(path, pixel_cache=False) as png_file:
+        expected = png_file.pixels()
+        passes = list(pngDecoder.iter_adam7_passes(png_file.ihdr, png_file.chunks))
+        assert [pass_index for pass_index, _ in passes] == list(range(7))
+        np.testing.assert_array_equal(passes[-1][1], expected)
+
+        scanlines = list(png_file.scanlines())
+        assert len(scanlines) == sum(height for _, height in pngDecoder.image_passes(png_file.ihdr))
+        with pytest.raises(ValueError):
+            next(pngDecoder.iter_rows(png_file.ihdr, png_file.chunks))
+
+
+@pytest.mark.parametrize("bits", [1, 2, 4, 8])
+def test_palette_lookup_table_with_trns(tmp_path, bits):
+    Image = pytest.importorskip("PIL.Image")
+    generator = np.random.default_rng(bits)
+    colors = 1 << bits
+    indices = generator.integers(0, colors, (13, 11), dtype=np.uint8)
+    image = Image.fromarray(indices, "P")
+    image.putpalette(generator.integers(0, 256, colors * 3, dtype=np.uint8).tobytes())
+    path = tmp_path / "palette.png"
+    # only first entries have alpha in tRNS, others are opaque
+    image.save(path, bits=bits, transparency=bytes(range(0, 256, 64))[:max(1, colors // 2)])
+
+    expected = _pillow_pixels(path, "RGBA")
+    with PngFile(path, pixel_cache=False) as png_file:
+        assert png_file.ihdr.bit_depth == bits
+        np.testing.assert_array_equal(png_file.pixels(expand_palette=True), expected)
@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+import pytest
+
+import pngEncryption
+from benchmark import write_synthetic_png
+from pngFile import PngFile
+from rsaAlgorithm import AlgorithmRSA, STANDARD_EXPONENT
+
+PNG_DIR = os.path.join(os.path.dirname(__file__), "png")
+
+
+@pytest.fixture(scope="module")
+def rsa() -> AlgorithmRSA:
+    return AlgorithmRSA(512, STANDARD_EXPONENT)
+
+
+@pytest.fixture(params=["bgan6a16.png", "histo15.png", "fft_test.png", "interlaced"])
+def png_path(request, tmp_path) -> str:
+    if request.param != "interlaced":
+        return os.path.join(PNG_DIR, request.param)
+    path = tmp_path / "interlaced.png"
+    write_synthetic_png(path, 45, 31, 6, 8, interlace=1, idat_size=512)
+    return path
+
+
+def _pixels(path) -> np.ndarray:
+    with PngFile(path, pixel_cache=False) as png_file:
+        return png_file.pixels()
+
+
+def test_compressed_mode_round_trip(rsa, png_path, tmp_path):
+    encrypted = tmp_path / "encrypted.png"
+    decrypted = tmp_path / "decrypted.png"
+    pngEncryption.encrypt_png(png_path, encrypted, rsa, "compressed", workers=1)
+    pngEncryption.decrypt_png(encrypted, decrypted, rsa, workers=1)
+
+    with open(png_path, "rb") as original, open(decrypted, "rb") as result:
+        assert original.read() == result.read()
+
+
+def test_decompressed_mode_round_trip(rsa, png_path, tmp_path):
+    encrypted = tmp_path / "encrypted.png"
+    decrypted = tmp_path / "decrypted.png"
+    pngEncryption.encrypt_png(png_path, encrypted, rsa, "decompressed", workers=1)
+    pngEncryption.decrypt_png(encrypted, decrypted, rsa, workers=1)
+
+    assert not np.array_equal(_pixels(encrypted), _pixels(png_path))
+    np.testing.assert_array_equal(_pixels(decrypted), _pixels(png_path))
+
+
+def test_decompressed_mode_output_is_valid_png(rsa, tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    encrypted = tmp_path / "encrypted.png"
+    pngEncryption.encrypt_png(os.path.join(PNG_DIR, "histo15.png"), encrypted, rsa, "decompressed", workers=1)
+
+    with Image.open(encrypted) as image:
+        image.load()
+
+
+def test_encrypted_file_is_not_encrypted_again(rsa, tmp_path):
+    encrypted = tmp_path / "encrypted.png"
+    pngEncryption.encrypt_png(os.path.join(PNG_DIR, "histo15.png"), encrypted, rsa, workers=1)
+    with pytest.raises(RuntimeError):
+        pngEncryption.encrypt_png(encrypted, tmp_path / "twice.png", rsa, workers=1)
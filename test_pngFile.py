@@ -0,0 +1,270 @@
+import logging
+import os
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+import pngDecoder
+import pngFile
+from pngChunk import ChunkCrcError
+from pngFile import PngFile
+
+PNG_DIR = os.path.join(os.path.dirname(__file__), "png")
+SAMPLES = ["bgan6a16.png", "hist.png", "splt.png", "ztxt.png", "land.png"]
+
+
+def _write_png(path, pixels: np.ndarray, color_type: int, palette: np.ndarray = None):
+    """Write 8 bit non interlaced png file with unfiltered rows"""
+    height, width = pixels.shape[:2]
+
+    def chunk(chunk_type: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + chunk_type + data + zlib.crc32(chunk_type + data).to_bytes(4, "big")
+
+    rows = pixels.astype(np.uint8).reshape(height, -1)
+    scanlines = np.hstack([np.zeros((height, 1), dtype=np.uint8), rows])
+    with open(path, "wb") as file:
+        file.write(PngFile.HEADER)
+        file.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)))
+        if palette is not None:
+            file.write(chunk(b"PLTE", palette.astype(np.uint8).tobytes()))
+        file.write(chunk(b"IDAT", zlib.compress(scanlines.tobytes())))
+        file.write(chunk(b"IEND", b""))
+
+
+def _read_chunks(path) -> list:
+    """Types and data of all chunks of png file"""
+    with open(path, "rb") as file:
+        data = file.read()
+    chunks = []
+    offset = len(PngFile.HEADER)
+    while offset < len(data):
+        length, chunk_type = struct.unpack_from(">I4s", data, offset)
+        chunks.append((chunk_type, data[offset + 8:offset + 8 + length]))
+        offset += 12 + length
+    return chunks
+
+
+def _write_chunks(path, chunks: list):
+    with open(path, "wb") as file:
+        file.write(PngFile.HEADER)
+        for chunk_type, data in chunks:
+            file.write(struct.pack(">I", len(data)) + chunk_type + data)
+            file.write(zlib.crc32(chunk_type + data).to_bytes(4, "big"))
+
+
+def _chunk_records(png_file: PngFile) -> list:
+    return [(chunk.type, chunk.offset, chunk.chunk_length, chunk.crc, chunk.tobytes())
+            for chunk in png_file.chunks]
+
+
+@pytest.fixture
+def corrupted_path(tmp_path) -> str:
+    """Copy of land.png with one byte of IDAT payload flipped"""
+    path = os.path.join(PNG_DIR, "land.png")
+    with PngFile(path, lazy=True) as png_file:
+        idat = next(chunk for chunk in png_file.chunks if chunk.type == "IDAT")
+    with open(path, "rb") as file:
+        data = bytearray(file.read())
+    data[idat.offset + idat.chunk_length // 2] ^= 0xff
+    corrupted = tmp_path / "corrupted.png"
+    corrupted.write_bytes(data)
+    return corrupted
+
+
+@pytest.mark.parametrize("name", SAMPLES)
+def test_mapped_file_matches_regular_file(name):
+    path = os.path.join(PNG_DIR, name)
+    with PngFile(path, pixel_cache=False) as png_file:
+        chunks = _chunk_records(png_file)
+        pixels = png_file.pixels()
+
+    with PngFile(path, use_mmap=True, pixel_cache=False) as mapped:
+        assert isinstance(mapped.get_chunk("IDAT").byte_data, memoryview)
+        assert _chunk_records(mapped) == chunks
+        np.testing.assert_array_equal(mapped.pixels(), pixels)
+
+
+def test_close_releases_mapped_chunk_data():
+    png_file = PngFile(os.path.join(PNG_DIR, "land.png"), use_mmap=True, pixel_cache=False)
+    png_file.pixels()
+    views = [chunk.byte_data for chunk in png_file.chunks]
+    png_file.close()
+
+    for view in views:
+        with pytest.raises(ValueError, match="released"):
+            view.tobytes()
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+@pytest.mark.parametrize("name", SAMPLES)
+def test_lazy_file_matches_eager_file(name, use_mmap):
+    path = os.path.join(PNG_DIR, name)
+    with PngFile(path, pixel_cache=False) as png_file:
+        chunks = _chunk_records(png_file)
+        pixels = png_file.pixels()
+
+    with PngFile(path, use_mmap=use_mmap, lazy=True, stats=True, pixel_cache=False) as lazy:
+        # only signature, chunk headers and crcs are read
+        assert lazy.stats.counters["bytes_read"] == len(PngFile.HEADER) + 12 * len(lazy.chunks)
+        assert all(chunk.crc_valid is None for chunk in lazy.chunks)
+        assert _chunk_records(lazy) == chunks
+        np.testing.assert_array_equal(lazy.pixels(), pixels)
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_verify_modes_of_corrupted_file(corrupted_path, use_mmap, caplog):
+    with pytest.raises(ChunkCrcError):
+        PngFile(corrupted_path, use_mmap=use_mmap, verify="strict", pixel_cache=False)
+
+    with caplog.at_level(logging.WARNING):
+        with PngFile(corrupted_path, use_mmap=use_mmap, verify="lenient", pixel_cache=False) as png_file:
+            assert [chunk.type for chunk in png_file.corrupted_chunks] == ["IDAT"]
+            assert all(chunk.crc_valid for chunk in png_file.chunks if chunk.type != "IDAT")
+    assert "Invalid IDAT crc" in caplog.text
+
+    with PngFile(corrupted_path, use_mmap=use_mmap, verify="off", pixel_cache=False) as png_file:
+        assert png_file.corrupted_chunks == []
+        assert all(chunk.crc_valid is None for chunk in png_file.chunks)
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_lazy_strict_reports_idat_crc_before_decompression(corrupted_path, use_mmap):
+    with PngFile(corrupted_path, use_mmap=use_mmap, lazy=True, verify="strict", pixel_cache=False) as png_file:
+        with pytest.raises(ChunkCrcError):
+            png_file.pixels()
+        assert [chunk.type for chunk in png_file.corrupted_chunks] == ["IDAT"]
+
+
+def test_lazy_lenient_records_idat_before_decompression(corrupted_path, caplog):
+    with PngFile(corrupted_path, lazy=True, verify="lenient", pixel_cache=False) as png_file:
+        with caplog.at_level(logging.WARNING):
+            try:
+                png_file.pixels()
+            except (zlib.error, RuntimeError):
+                # corrupted data is decoded in lenient mode and may be invalid
+                pass
+        assert [chunk.type for chunk in png_file.corrupted_chunks] == ["IDAT"]
+        assert "Invalid IDAT crc" in caplog.text
+
+
+def test_crc_of_small_files_is_verified_without_thread_pool(monkeypatch):
+    monkeypatch.setattr(pngFile, "_crc_executors", {})
+    with PngFile(os.path.join(PNG_DIR, "land.png"), crc_workers=4, pixel_cache=False) as png_file:
+        assert all(chunk.crc_valid for chunk in png_file.chunks)
+    assert pngFile._crc_executors == {}
+
+
+def test_crc_of_large_files_is_verified_on_shared_thread_pool(monkeypatch, corrupted_path):
+    monkeypatch.setattr(pngFile, "_crc_executors", {})
+    monkeypatch.setattr(PngFile, "PARALLEL_CRC_MIN_BYTES", 0)
+    for _ in range(2):
+        with PngFile(corrupted_path, crc_workers=2, pixel_cache=False) as png_file:
+            assert [chunk.type for chunk in png_file.corrupted_chunks] == ["IDAT"]
+    assert list(pngFile._crc_executors) == [2]
+
+
+@pytest.fixture
+def no_decoding(monkeypatch):
+    """Fail test when image rows are decoded"""
+    def decode(*args, **kwargs):
+        raise AssertionError("image was decoded")
+
+    monkeypatch.setattr(pngDecoder, "iter_pass_rows", decode)
+
+
+@pytest.mark.parametrize("name", ["fft_test.png", "fft_test_4.png"])
+def test_isgray_of_gray_color_types_does_not_decode(no_decoding, name):
+    with PngFile(os.path.join(PNG_DIR, name), pixel_cache=False) as png_file:
+        assert png_file.isgray()
+
+
+def test_isgray_of_gray_palette_does_not_decode(no_decoding, tmp_path):
+    path = tmp_path / "palette.png"
+    gray_palette = np.repeat(np.arange(0, 256, 16)[:, np.newaxis], 3, axis=1)
+    _write_png(path, np.arange(64).reshape(8, 8) % 16, 3, gray_palette)
+    with PngFile(path, pixel_cache=False) as png_file:
+        assert png_file.isgray()
+
+
+@pytest.mark.parametrize("color_type", [2, 3])
+def test_isgray_stops_at_first_colored_row(tmp_path, color_type):
+    path = tmp_path / "image.png"
+    gray = np.repeat(np.arange(64 * 64).reshape(64, 64, 1) % 200, 3, axis=2)
+    if color_type == 2:
+        pixels = gray.copy()
+        pixels[1, 5] = (255, 0, 0)
+        _write_png(path, pixels, 2)
+    else:
+        indices = gray[..., 0] % 100
+        indices[1, 5] = 100
+        palette = np.repeat(np.arange(101)[:, np.newaxis], 3, axis=1)
+        palette[100] = (255, 0, 0)
+        _write_png(path, indices, 3, palette)
+
+    with PngFile(path, stats=True, pixel_cache=False) as png_file:
+        assert not png_file.isgray()
+        assert png_file.stats.counters["rows_unfiltered"] < 64
+
+        # decoded image is scanned in blocks
+        png_file.pixels()
+        assert not png_file.isgray()
+
+
+def test_isgray_of_gray_truecolor_image(tmp_path, monkeypatch):
+    path = tmp_path / "image.png"
+    _write_png(path, np.repeat(np.arange(48 * 16).reshape(48, 16, 1) % 256, 3, axis=2), 2)
+    monkeypatch.setattr(PngFile, "ISGRAY_BLOCK_BYTES", 100)
+    with PngFile(path, stats=True, pixel_cache=False) as png_file:
+        assert png_file.isgray()
+        assert png_file.stats.counters["rows_unfiltered"] == 48
+        png_file.pixels()
+        assert png_file.isgray()
+
+
+@pytest.mark.parametrize("name", ["histo15.png", "fft_test.png", "fft_test_4.png", "bgan6a16.png"])
+def test_histogram_counts_samples_of_every_channel(name):
+    with PngFile(os.path.join(PNG_DIR, name), pixel_cache=False) as png_file:
+        # rows are streamed before image is decoded
+        streamed = png_file.histogram()
+        pixels = png_file.pixels()
+        decoded = png_file.histogram()
+
+    samples = pixels.reshape(pixels.shape[0], pixels.shape[1], -1)
+    values = 1 << png_file.ihdr.bit_depth
+    expected = [np.bincount(samples[..., channel].ravel(), minlength=values)
+                for channel in range(samples.shape[-1])]
+    np.testing.assert_array_equal(streamed, expected)
+    np.testing.assert_array_equal(decoded, expected)
+
+
+def test_check_histogram(tmp_path):
+    path = os.path.join(PNG_DIR, "histo15.png")
+    with PngFile(path, pixel_cache=False) as png_file:
+        assert png_file.check_histogram() is True
+    with PngFile(os.path.join(PNG_DIR, "fft_test.png"), pixel_cache=False) as png_file:
+        assert png_file.check_histogram() is None
+
+    chunks = _read_chunks(path)
+    hist = next(i for i, (chunk_type, _) in enumerate(chunks) if chunk_type == b"hIST")
+    for data in (chunks[hist][1][::-1], chunks[hist][1][:-2]):
+        chunks[hist] = (b"hIST", data)
+        _write_chunks(tmp_path / "modified.png", chunks)
+        with PngFile(tmp_path / "modified.png", pixel_cache=False) as png_file:
+            assert png_file.check_histogram() is False
+
+
+def test_check_histogram_ignores_suggested_palette_of_truecolor_image(tmp_path):
+    path = tmp_path / "truecolor.png"
+    pixels = np.zeros((4, 4, 3), dtype=np.uint8)
+    pixels[..., 0] = 1
+    _write_png(path, pixels, 2)
+    chunks = _read_chunks(path)
+    # suggested palette of two colors, hIST does not match red channel
+    chunks[1:1] = [(b"PLTE", bytes(6)), (b"hIST", struct.pack(">HH", 1, 0))]
+    _write_chunks(path, chunks)
+
+    with PngFile(path, pixel_cache=False) as png_file:
+        assert png_file.get_chunk("hIST") is not None
+        assert png_file.check_histogram() is None
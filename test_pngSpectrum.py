@@ -0,0 +1,127 @@
+import os
+
+import numpy as np
+import pytest
+
+import pngSpectrum
+from pngFile import PngFile
+
+PNG_DIR = os.path.join(os.path.dirname(__file__), "png")
+
+
+def _complex(fft_mag: np.ndarray, fft_phase: np.ndarray) -> np.ndarray:
+    return fft_mag * np.exp(1j * fft_phase)
+
+
+def _image(height: int, width: int, *leading) -> np.ndarray:
+    return np.random.default_rng(height * width).random(leading + (height, width))
+
+
+@pytest.mark.parametrize("height, width", [(1, 1), (7, 5), (8, 6), (9, 16)])
+def test_half_spectrum_matches_fft2(height, width):
+    image = _image(height, width)
+    expected = np.fft.fft2(image)
+
+    fft_mag, fft_phase = pngSpectrum.half_spectrum(image, np.float64)
+    assert fft_mag.shape == (height, width // 2 + 1)
+    np.testing.assert_allclose(_complex(fft_mag, fft_phase), expected[:, :width // 2 + 1], atol=1e-9)
+
+    fft_mag, fft_phase = pngSpectrum.half_spectrum(image)
+    assert fft_mag.dtype == fft_phase.dtype == np.float32
+    np.testing.assert_allclose(_complex(fft_mag, fft_phase), expected[:, :width // 2 + 1], atol=1e-4)
+
+
+@pytest.mark.parametrize("height, width", [(1, 1), (7, 5), (8, 6), (9, 16)])
+def test_mirrored_half_spectrum_matches_full_spectrum(height, width):
+    image = _image(height, width)
+    expected = np.fft.fftshift(np.fft.fft2(image)).T
+
+    fft_mag, fft_phase = pngSpectrum.mirror_half_spectrum(*pngSpectrum.half_spectrum(image, np.float64), width)
+    np.testing.assert_allclose(_complex(fft_mag, fft_phase), expected, atol=1e-9)
+    np.testing.assert_allclose(_complex(*pngSpectrum.full_spectrum(image)), expected, atol=1e-9)
+
+
+def test_log_half_spectrum_keeps_zero_magnitude():
+    image = np.zeros((4, 4))
+    image[0, 0] = 1000
+    fft_mag, _ = pngSpectrum.half_spectrum(image, log=True)
+    np.testing.assert_allclose(fft_mag, 3)
+
+    fft_mag, _ = pngSpectrum.half_spectrum(np.zeros((4, 4)), log=True)
+    assert not fft_mag.any()
+
+
+@pytest.mark.parametrize("name", ["histo15.png", "fft_test.png"])
+def test_get_fft_half_mode_matches_full_mode(name):
+    with PngFile(os.path.join(PNG_DIR, name), pixel_cache=False) as png_file:
+        full_mag, full_phase = png_file.get_fft("full")
+        half_mag, half_phase = png_file.get_fft("half")
+        unmirrored_mag, _ = png_file.get_fft("half", mirror=False)
+        width = png_file.ihdr.width
+
+    assert half_mag.dtype == np.float32 and half_mag.shape == full_mag.shape
+    # float32 error is relative to largest (zero frequency) magnitude
+    full_mag = np.ma.filled(full_mag, 0)
+    np.testing.assert_allclose(half_mag, full_mag, atol=1e-5 * full_mag.max())
+    assert unmirrored_mag.shape == (full_mag.shape[1], width // 2 + 1)
+
+
+def test_channel_spectra_are_computed_per_channel():
+    with PngFile(os.path.join(PNG_DIR, "bgan6a16.png"), pixel_cache=False) as png_file:
+        assert png_file.channel_names() == ("Red", "Green", "Blue", "Alpha")
+        stack = png_file.channel_stack(np.float32)
+        fft_mag, fft_phase = png_file.get_fft("half", mirror=False, channels=True)
+
+    assert fft_mag.shape == (4,) + pngSpectrum.half_spectrum(stack[0])[0].shape
+    for channel, channel_mag in zip(stack, fft_mag):
+        # color images have log10 magnitude
+        np.testing.assert_allclose(channel_mag, pngSpectrum.half_spectrum(channel, log=True)[0], rtol=1e-5)
+
+
+@pytest.mark.parametrize("mode", ["full", "half"])
+def test_batch_fft_matches_single_images(mode):
+    names = ("fft_test.png", "fft_test_2.png", "fft_test_4.png")
+    png_files = [PngFile(os.path.join(PNG_DIR, name), pixel_cache=False) for name in names]
+    try:
+        batch_mag, batch_phase = PngFile.batch_fft(png_files, mode, mirror=True)
+        assert batch_mag.shape[0] == len(png_files)
+        for png_file, fft_mag in zip(png_files, batch_mag):
+            expected, _ = PngFile._spectrum(png_file.grayscale(), mode, batch_mag.dtype, True, False, None)
+            np.testing.assert_allclose(fft_mag, expected, atol=1e-5 * expected.max())
+
+        with PngFile(os.path.join(PNG_DIR, "histo15.png"), pixel_cache=False) as other_size:
+            with pytest.raises(ValueError):
+                PngFile.batch_fft(png_files + [other_size], mode)
+    finally:
+        for png_file in png_files:
+            png_file.close()
+
+
+@pytest.mark.parametrize("memory_budget", [1, 4096, 1 << 20])
+@pytest.mark.parametrize("height, width", [(1, 1), (7, 5), (33, 20)])
+def test_out_of_core_spectrum_matches_in_memory(memory_budget, height, width):
+    image = _image(height, width)
+    spectrum = pngSpectrum.out_of_core_spectrum(iter(image), height, width, memory_budget, dtype=np.float64)
+    np.testing.assert_allclose(spectrum, np.fft.rfft2(image), atol=1e-9)
+
+
+def test_out_of_core_spectrum_file(tmp_path):
+    image = _image(16, 9)
+    path = tmp_path / "spectrum.npy"
+    spectrum = pngSpectrum.out_of_core_spectrum(iter(image), 16, 9, 1024, path=str(path))
+    assert spectrum.dtype == np.complex64
+    del spectrum
+    np.testing.assert_allclose(np.load(path), np.fft.rfft2(image), rtol=1e-4, atol=1e-4)
+
+    with pytest.raises(RuntimeError):
+        pngSpectrum.out_of_core_spectrum(iter(image[:-1]), 16, 9)
+
+
+@pytest.mark.parametrize("name", ["histo15.png", "fft_test.png", "bgan6a16.png"])
+def test_get_fft_out_of_core_matches_in_memory(name):
+    with PngFile(os.path.join(PNG_DIR, name), pixel_cache=False) as png_file:
+        fft_mag, fft_phase, spectrum = png_file.get_fft_out_of_core(memory_budget=4096, preview_size=16)
+        expected = np.fft.rfft2(png_file.grayscale(np.float64))
+
+    np.testing.assert_allclose(spectrum, expected, atol=1e-5 * np.abs(expected).max())
+    assert fft_mag.shape == fft_phase.shape and max(fft_mag.shape) <= 16
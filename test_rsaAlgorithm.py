@@ -0,0 +1,87 @@
+import os
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import pytest
+
+from rsaAlgorithm import AlgorithmRSA, KeyPool, PrivateKey, PublicKey, RANDOM_EXPONENT, STANDARD_EXPONENT
+
+
+@pytest.fixture(scope="module", params=[RANDOM_EXPONENT, STANDARD_EXPONENT])
+def rsa(request) -> AlgorithmRSA:
+    return AlgorithmRSA(512, request.param)
+
+
+def test_crt_decryption_matches_modular_exponentiation(rsa):
+    key = rsa.private_key
+    assert key.has_crt
+    blocks = [int.from_bytes(os.urandom(rsa.plain_block_size), "big") for _ in range(20)]
+    encrypted = [rsa.encrypt_data(block) for block in blocks]
+
+    assert [pow(block, key.d, key.n) for block in encrypted] == blocks
+    assert [rsa.decrypt_data(block) for block in encrypted] == blocks
+    assert rsa.decrypt_many(encrypted) == blocks
+
+
+def test_small_keys_have_distinct_primes():
+    for _ in range(100):
+        rsa = AlgorithmRSA(8)
+        key = rsa.private_key
+        assert key.p != key.q
+        assert rsa.decrypt_data(rsa.encrypt_data(5)) == 5
+
+
+def test_private_key_rejects_equal_primes():
+    with pytest.raises(ValueError):
+        PrivateKey(17 * 17, 3, 17, 17)
+
+
+
+def test_key_files_round_trip(rsa, tmp_path):
+    rsa.public_key.save(tmp_path / "key.pub")
+    rsa.private_key.save(tmp_path / "key.key")
+    public_key = PublicKey.load(tmp_path / "key.pub")
+    private_key = PrivateKey.load(tmp_path / "key.key")
+
+    assert (public_key.n, public_key.e, public_key.exponent_mode) == \
+        (rsa.public_key.n, rsa.public_key.e, rsa.public_key.exponent_mode)
+    assert (private_key.n, private_key.d, private_key.p, private_key.q) == \
+        (rsa.private_key.n, rsa.private_key.d, rsa.private_key.p, rsa.private_key.q)
+
+    loaded = AlgorithmRSA.from_keys(public_key, private_key)
+    assert loaded.decrypt_data(loaded.encrypt_data(12345)) == 12345
+
+
+def test_malformed_key_files(rsa):
+    data = rsa.public_key.tobytes()
+    for malformed in (data[:3], data[:7], data[:-1], data + b"\0\0\0\1\1", b"RSAS" + data[4:]):
+        with pytest.raises(ValueError):
+            PublicKey.frombytes(malformed)
+    with pytest.raises(ValueError):
+        PrivateKey.frombytes(rsa.private_key.tobytes()[:-1])
+
+
+def test_key_pool_keeps_key_pair_after_timeout():
+    with KeyPool(512, STANDARD_EXPONENT, size=1, workers=1) as pool:
+        pending = list(pool._pending)
+        # worker process is not even started yet
+        with pytest.raises(FutureTimeoutError):
+            pool.get(timeout=0)
+        assert list(pool._pending) == pending
+
+        rsa = pool.get()
+        assert rsa.decrypt_data(rsa.encrypt_data(5)) == 5
+        assert len(pool._pending) == 1 and pool._pending[0] is not pending[0]
+
+
+def test_key_pool_rejects_empty_pool():
+    with pytest.raises(ValueError):
+        KeyPool(512, size=0)
+
+
+@pytest.mark.parametrize("blocks, remainder", [(0, 0), (0, 1), (1, -1), (1, 0), (1, 1), (15, 7)])
+def test_ecb_round_trip(rsa, blocks, remainder):
+    data = os.urandom(blocks * rsa.plain_block_size + remainder)
+    encrypted, extra = rsa.encrypt_ECB(data, workers=1)
+
+    assert len(encrypted) == len(data)
+    assert rsa.decrypt_ECB(encrypted, extra, workers=1) == data